@@ -1,3 +1,8 @@
 """Daisys-mcp server module."""
 
 __version__ = "1.0.3"
+
+from dotenv import load_dotenv  # type: ignore
+
+# Loaded once, before any module reads its settings from the environment
+load_dotenv()
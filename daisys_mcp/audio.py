@@ -0,0 +1,561 @@
+import io
+import math
+import mmap
+import os
+import struct
+import tempfile
+import weakref
+from pathlib import Path
+from typing import Optional, Protocol, Tuple, Union
+
+WAV_HEADER_SIZE = 44
+# Rate of a take until the header of its stream says otherwise
+DEFAULT_SAMPLE_RATE = 22050
+
+# Audio a take may hold in memory before it moves to a temporary file; 0 never does.
+spill_threshold_bytes = int(
+    os.getenv("DAISYS_SPILL_THRESHOLD_BYTES", str(32 * 1024 * 1024))
+)
+# Next to the output files, so a spilled take can be linked into place.
+_storage_path = os.environ.get("DAISYS_BASE_STORAGE_PATH")
+spill_dir = os.getenv("DAISYS_SPILL_DIR") or (
+    os.path.join(_storage_path, ".daisys_spill")
+    if _storage_path
+    else tempfile.gettempdir()
+)
+# Write buffer of a spilled take.
+_SPILL_WINDOW = 1024 * 1024
+
+
+def wav_header(
+    data_size: int,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    channels: int = 1,
+    sample_width: int = 2,
+) -> bytes:
+    """Canonical 44 byte PCM WAV header for ``data_size`` bytes of audio."""
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        channels,
+        sample_rate,
+        byte_rate,
+        channels * sample_width,
+        sample_width * 8,
+        b"data",
+        data_size,
+    )
+
+
+def split_wav_header(chunk: bytes) -> Tuple[Optional[bytes], Union[bytes, memoryview]]:
+    """
+    Split the first chunk of a websocket stream into its WAV header and PCM data.
+
+    The first chunk of every part starts with a RIFF header, the following
+    chunks are raw PCM. Returns ``(None, chunk)`` if there is no header.
+    """
+    if chunk[:4] != b"RIFF" or chunk[8:12] != b"WAVE":
+        return None, chunk
+    pos = 12
+    while pos + 8 <= len(chunk):
+        section = chunk[pos : pos + 4]
+        if section == b"data":
+            # the audio is passed on as a view, it is copied once by the sink
+            return chunk[: pos + 8], memoryview(chunk)[pos + 8 :]
+        pos += int.from_bytes(chunk[pos + 4 : pos + 8], "little") + 8
+    return None, chunk
+
+
+def parse_wav_header(header: bytes) -> Tuple[int, int, int]:
+    """The (sample rate, channels, sample width in bytes) of a WAV header."""
+    pos = 12
+    while pos + 8 <= len(header):
+        size = int.from_bytes(header[pos + 4 : pos + 8], "little")
+        if header[pos : pos + 4] == b"fmt ":
+            _, channels, sample_rate, _, _, bits = struct.unpack(
+                "<HHIIHH", header[pos + 8 : pos + 24]
+            )
+            return sample_rate, channels, bits // 8
+        pos += size + 8
+    raise ValueError("WAV header has no fmt section")
+
+
+class AudioSink(Protocol):
+    """Destination for the PCM chunks of a streaming take."""
+
+    bytes_written: int
+
+    def set_format(self, sample_rate: int, channels: int = 1): ...
+
+    def write(self, pcm): ...
+
+    def close(self): ...
+
+
+def estimate_pcm_bytes(text: str, sample_rate: int = DEFAULT_SAMPLE_RATE) -> int:
+    """Rough size of the 16 bit mono PCM for ``text``, at ~15 characters a second."""
+    return int(len(text) / 15 * sample_rate) * 2
+
+
+class Resampler:
+    """
+    Polyphase windowed-sinc resampler for 16 bit PCM.
+
+    Every output sample is a weighted sum of the ``2 * taps`` input samples
+    around its position. Output positions repeat the same few fractional
+    offsets, so the weights of every offset are computed once up front and
+    whole blocks of samples are resampled at once with NumPy. When
+    downsampling the kernel is widened so it also filters out what the new
+    rate cannot represent. ``process`` may be called chunk by chunk; the
+    input it still needs is kept, so the result is the same as resampling
+    everything in one call.
+    """
+
+    def __init__(
+        self, source_rate: int, target_rate: int, channels: int = 1, taps: int = 16
+    ):
+        import numpy as np  # type: ignore
+
+        self._np = np
+        self.channels = channels
+        divisor = math.gcd(source_rate, target_rate)
+        self._up = target_rate // divisor
+        self._down = source_rate // divisor
+        cutoff = min(1.0, target_rate / source_rate)
+        self._half = math.ceil(taps / cutoff)
+        offsets = np.arange(-self._half + 1, self._half + 1)
+        # weights for every fractional position (phase) between two inputs
+        distance = np.arange(self._up)[:, None] / self._up - offsets
+        window = 0.5 + 0.5 * np.cos(np.pi * distance / self._half)
+        weights = np.sinc(cutoff * distance) * window
+        self._weights = (weights / weights.sum(axis=1, keepdims=True)).astype(
+            np.float32
+        )
+        # start with silence before the first sample, so it is centered too
+        self._history = np.zeros((self._half, channels), dtype=np.float32)
+        self._dropped = 0
+        self._samples_in = 0
+        self._samples_out = 0
+
+    def process(self, samples, final: bool = False):
+        """Resample the next int16 samples; ``final`` flushes the last ones."""
+        np = self._np
+        up, down, half = self._up, self._down, self._half
+        samples = np.asarray(samples).reshape(-1, self.channels)
+        self._samples_in += len(samples)
+        x = np.concatenate([self._history, samples.astype(np.float32)])
+        if final:
+            x = np.concatenate([x, np.zeros((half, self.channels), np.float32)])
+
+        # output n lies at input n * down / up; it can be computed once the
+        # input reaches ``half`` samples past that position
+        last = self._dropped + len(x) - 1 - 2 * half
+        end = -(-(last + 1) * up // down) if last >= 0 else 0
+        if final:
+            end = min(end, -(-self._samples_in * up // down))
+        end = max(end, self._samples_out)
+
+        # windows[i] are the 2 * half inputs starting at i, without copying
+        windows = np.lib.stride_tricks.sliding_window_view(x, 2 * half, axis=0)
+        blocks = []
+        for start in range(self._samples_out, end, 8192):
+            n = np.arange(start, min(start + 8192, end), dtype=np.int64)
+            first = (n * down) // up + 1 - self._dropped
+            weights = self._weights[(n * down) % up]
+            blocks.append(np.einsum("mk,mck->mc", weights, windows[first]))
+        self._samples_out = end
+
+        # keep the input the next output still needs
+        keep = (end * down) // up + 1 - self._dropped
+        keep = min(max(keep, 0), len(x))
+        self._history = x[keep:]
+        self._dropped += keep
+
+        if not blocks:
+            return np.zeros((0, self.channels), np.int16)
+        out = np.concatenate(blocks)
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+
+def resample(samples, source_rate: int, target_rate: int, channels: int = 1):
+    """Resample int16 samples in one go, see ``Resampler``."""
+    if source_rate == target_rate:
+        return samples
+    return Resampler(source_rate, target_rate, channels).process(samples, final=True)
+
+
+class WavBufferSink:
+    """
+    Collects PCM chunks in memory and produces a WAV file.
+
+    The WAV header and audio share one preallocated ``bytearray`` that grows
+    geometrically when ``capacity`` turns out too small. Each chunk is copied
+    into it exactly once and ``getbuffer`` hands out a view without copying,
+    so peak memory stays around the size of the audio.
+    """
+
+    def __init__(
+        self, sample_rate: int = DEFAULT_SAMPLE_RATE, capacity: int = 0, channels=1
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bytes_written = 0
+        self._buffer = bytearray(WAV_HEADER_SIZE + max(capacity, 0))
+        self._buffer[:WAV_HEADER_SIZE] = wav_header(0, sample_rate, channels)
+
+    def set_format(self, sample_rate: int, channels: int = 1):
+        """The format the stream turned out to have; the header is written on close."""
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def write(self, pcm):
+        data = memoryview(pcm).cast("B")
+        start = WAV_HEADER_SIZE + self.bytes_written
+        end = start + len(data)
+        if end > len(self._buffer):
+            self._buffer.extend(
+                bytes(max(end, 2 * len(self._buffer)) - len(self._buffer))
+            )
+        self._buffer[start:end] = data
+        self.bytes_written += len(data)
+
+    def close(self):
+        self._buffer[:WAV_HEADER_SIZE] = wav_header(
+            self.bytes_written, self.sample_rate, self.channels
+        )
+
+    def getbuffer(self) -> memoryview:
+        """The WAV file as a read-only view of the buffer, without copying it."""
+        view = memoryview(self._buffer)[: WAV_HEADER_SIZE + self.bytes_written]
+        return view.toreadonly()
+
+    def getvalue(self) -> bytes:
+        return bytes(self.getbuffer())
+
+
+def _unlink(path: Path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class SpilledAudio(mmap.mmap):
+    """
+    A WAV file spilled to disk by ``SpillingWavSink``, mapped read-only.
+
+    Reads like ``bytes`` without being loaded into memory. ``path`` is the
+    file, which is removed once the mapping is garbage collected.
+    """
+
+    path: Path
+
+    @classmethod
+    def open(cls, path: Path) -> "SpilledAudio":
+        with open(path, "rb") as f:
+            audio = cls(f.fileno(), 0, access=mmap.ACCESS_READ)
+        audio.path = Path(path)
+        weakref.finalize(audio, _unlink, audio.path)
+        return audio
+
+
+class SpillingWavSink(WavBufferSink):
+    """
+    ``WavBufferSink`` that moves to a temporary file past ``threshold`` bytes.
+
+    Up to the threshold the audio is collected in memory as before. The
+    chunk that crosses it writes the buffer out to a file in ``directory``
+    and frees it; later chunks are appended through a small write buffer.
+    ``getbuffer`` then returns the finished file as ``SpilledAudio``, so
+    memory use stays bounded however long the take is, and the output
+    writer links or copies the file into place instead of writing it out.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        capacity: int = 0,
+        channels=1,
+        threshold: Optional[int] = None,
+        directory: Optional[str] = None,
+    ):
+        self.threshold = spill_threshold_bytes if threshold is None else threshold
+        if self.threshold > 0:
+            capacity = min(capacity, self.threshold)
+        super().__init__(sample_rate, capacity, channels)
+        self.directory = directory or spill_dir
+        self.path: Optional[Path] = None
+        self._file = None
+        self._spilled: Optional[SpilledAudio] = None
+
+    def write(self, pcm):
+        data = memoryview(pcm).cast("B")
+        if self._file is None:
+            end = WAV_HEADER_SIZE + self.bytes_written + len(data)
+            if self.threshold <= 0:
+                super().write(data)
+                return
+            if end <= WAV_HEADER_SIZE + self.threshold:
+                if end > len(self._buffer):
+                    # grow as usual, but never past the threshold
+                    size = min(
+                        max(end, 2 * len(self._buffer)),
+                        WAV_HEADER_SIZE + self.threshold,
+                    )
+                    self._buffer.extend(bytes(size - len(self._buffer)))
+                super().write(data)
+                return
+            self._spill()
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def _spill(self):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(
+            prefix=".daisys-", suffix=".wav.spill", dir=self.directory
+        )
+        self.path = Path(path)
+        self._file = open(fd, "wb", buffering=_SPILL_WINDOW)
+        self._file.write(
+            memoryview(self._buffer)[: WAV_HEADER_SIZE + self.bytes_written]
+        )
+        self._buffer = bytearray()
+
+    def close(self):
+        if self._file is None:
+            super().close()
+            return
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(
+            wav_header(self.bytes_written, self.sample_rate, self.channels)
+        )
+        self._file.close()
+        # removed along with the mapping, once nobody uses the audio anymore
+        self._spilled = SpilledAudio.open(self.path)
+
+    def discard(self):
+        """Close and remove the spilled file, for audio that is not used."""
+        if self._file is not None:
+            self._file.close()
+            if self._spilled is None:
+                _unlink(self.path)  # type: ignore
+
+    def getbuffer(self):
+        """The WAV file, as a view of the buffer or mapped from the spilled file."""
+        if self._file is None:
+            return super().getbuffer()
+        return self._spilled
+
+
+class WavFileSink:
+    """
+    Streams PCM chunks straight into a WAV file as they arrive.
+
+    A header with a zero length is written up front and patched with the real
+    sizes on ``close``, so memory use stays flat however long the take is and
+    the file can be read while it is still being generated. With an
+    ``output_rate`` the finished file is resampled once, in bulk, on close.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        output_rate: Optional[int] = None,
+    ):
+        self.path = Path(path)
+        self.sample_rate = sample_rate
+        self.channels = 1
+        self.output_rate = output_rate
+        self.bytes_written = 0
+        self._file = open(self.path, "wb")
+        self._file.write(wav_header(0, sample_rate))
+
+    def set_format(self, sample_rate: int, channels: int = 1):
+        """The format the stream turned out to have."""
+        self.sample_rate = sample_rate
+        self.channels = channels
+        if not self.bytes_written:
+            self._file.seek(0)
+            self._file.write(wav_header(0, sample_rate, channels))
+
+    def write(self, pcm):
+        self._file.write(pcm)
+        self.bytes_written += len(pcm)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(
+            wav_header(self.bytes_written, self.sample_rate, self.channels)
+        )
+        self._file.close()
+        if self.output_rate and self.output_rate != self.sample_rate:
+            self.path.write_bytes(
+                resample_audio(self.path.read_bytes(), "wav", self.output_rate)
+            )
+
+    def discard(self):
+        """Close and remove a partially written file."""
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# Compressed formats that are encoded while a take streams in, as
+# (libsndfile format, subtype, sample rates the codec supports)
+ENCODED_FORMATS = {
+    "mp3": ("MP3", "MPEG_LAYER_III", None),
+    "opus": ("OGG", "OPUS", (8000, 12000, 16000, 24000, 48000)),
+}
+
+_SOUNDFILE_FORMATS = {"wav": ("WAV", "PCM_16", None), **ENCODED_FORMATS}
+
+
+def supported_rate(audio_format: str, sample_rate: int) -> int:
+    """``sample_rate``, or the nearest higher rate the codec of ``audio_format`` supports."""
+    rates = _SOUNDFILE_FORMATS[audio_format][2]
+    if not rates or sample_rate in rates:
+        return sample_rate
+    return min((r for r in rates if r > sample_rate), default=rates[-1])
+
+
+def resample_audio(audio, audio_format: str, sample_rate: int) -> bytes:
+    """Decode a whole audio file, resample it in one go and encode it again."""
+    import soundfile as sf  # type: ignore
+
+    data, source_rate = sf.read(io.BytesIO(audio), dtype="int16", always_2d=True)
+    sample_rate = supported_rate(audio_format, sample_rate)
+    if source_rate == sample_rate:
+        return bytes(audio)
+    data = resample(data, source_rate, sample_rate, data.shape[1])
+    sf_format, subtype, _ = _SOUNDFILE_FORMATS[audio_format]
+    out = io.BytesIO()
+    sf.write(out, data, sample_rate, format=sf_format, subtype=subtype)
+    return out.getvalue()
+
+
+class EncodedSink:
+    """
+    Encodes PCM chunks to MP3 or Opus (in OGG) while they stream in.
+
+    Every chunk is passed to libsndfile's encoder as it arrives, so a
+    compressed take is ready right after its last chunk instead of after a
+    separate download. The encoder is opened at the first chunk, once the
+    format of the stream is known. Audio is resampled on the way when an
+    ``output_rate`` is asked for, or when the codec does not support the
+    stream's rate (Opus only has a few). Writes to ``path`` or, without a
+    path, to memory (see ``getbuffer``).
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        audio_format: str = "mp3",
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        output_rate: Optional[int] = None,
+    ):
+        # numpy and libsndfile are only loaded once a compressed take is made
+        import numpy as np  # type: ignore
+
+        self._np = np
+        self.path = Path(path) if path is not None else None
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.channels = 1
+        self.output_rate = output_rate
+        self.bytes_written = 0
+        self._odd_bytes = b""
+        self._resampler: Optional[Resampler] = None
+        self._target = self.path if self.path is not None else io.BytesIO()
+        self._file = None
+
+    def set_format(self, sample_rate: int, channels: int = 1):
+        """The format the stream turned out to have, before the first chunk."""
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def _open(self):
+        import soundfile as sf  # type: ignore
+
+        sf_format, subtype, _ = ENCODED_FORMATS[self.audio_format]
+        rate = supported_rate(self.audio_format, self.output_rate or self.sample_rate)
+        if rate != self.sample_rate:
+            self._resampler = Resampler(self.sample_rate, rate, self.channels)
+        self._file = sf.SoundFile(
+            self._target,
+            "w",
+            samplerate=rate,
+            channels=self.channels,
+            format=sf_format,
+            subtype=subtype,
+        )
+
+    def write(self, pcm):
+        if self._file is None:
+            self._open()
+        data = memoryview(pcm).cast("B")
+        self.bytes_written += len(data)
+        if self._odd_bytes:
+            data = memoryview(self._odd_bytes + bytes(data))
+        # a chunk may end halfway a frame
+        usable = len(data) - len(data) % (2 * self.channels)
+        self._odd_bytes = bytes(data[usable:])
+        self._encode(self._np.frombuffer(data[:usable], "<i2"))
+
+    def _encode(self, samples, final: bool = False):
+        if self._resampler is not None:
+            samples = self._resampler.process(samples, final=final)
+        if len(samples):
+            self._file.buffer_write(samples, dtype="int16")
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            self._open()
+        if not self._file.closed:
+            self._encode(self._np.zeros(0, "<i2"), final=True)
+            self._file.close()
+
+    def discard(self):
+        """Close and remove a partially written file."""
+        if self._file is not None:
+            self._file.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def getbuffer(self) -> memoryview:
+        """The encoded file, for sinks that write to memory."""
+        return self._target.getbuffer().toreadonly()
+
+    def getvalue(self) -> bytes:
+        return bytes(self.getbuffer())
+
+
+def open_file_sink(
+    path: Path, audio_format: str = "wav", output_rate: Optional[int] = None
+):
+    """The sink that streams a take into ``path`` in ``audio_format``."""
+    if audio_format == "wav":
+        return WavFileSink(path, output_rate=output_rate)
+    return EncodedSink(path, audio_format, output_rate=output_rate)
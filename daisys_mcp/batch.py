@@ -0,0 +1,295 @@
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+from daisys_mcp.audio import (
+    EncodedSink,
+    WavFileSink,
+    parse_wav_header,
+    split_wav_header,
+)
+from daisys_mcp.cache import get_synthesis_cache, make_cache_key
+from daisys_mcp.catalog import voice_models
+from daisys_mcp.metrics import audio_bytes_total, characters_total
+from daisys_mcp.model import McpBatchItem, McpBatchResult, Status
+from daisys_mcp.resilience import call_with_retry, resubmit_lost_takes
+from daisys_mcp.scheduler import acquire, scheduling, try_acquire
+from daisys_mcp.takes import remember_file, remember_take
+from daisys_mcp.websocket_pool import pooled_websocket
+from daisys_mcp.output import get_output_writer, open_part_sink
+
+# Number of takes of one batch that are generating on a connection at the same time.
+batch_max_in_flight = int(os.getenv("DAISYS_BATCH_MAX_IN_FLIGHT", "8"))
+# A batch connection that receives nothing for this long is given up on.
+batch_idle_timeout = float(os.getenv("DAISYS_BATCH_IDLE_TIMEOUT_SECONDS", "60"))
+
+_formats = ["wav", "mp3", "opus"]
+
+
+class _BatchJob:
+    def __init__(self, index: int, item: McpBatchItem, voice_id: str, output_path):
+        self.index = index
+        self.item = item
+        self.voice_id = voice_id
+        self.output_path = Path(output_path)
+        # named after its content once it is complete
+        self.output_file: Optional[Path] = None
+        self.cache_key = _cache_key(item.text, voice_id, item.audio_format)
+        self.sink: Optional[Union[WavFileSink, EncodedSink]] = None
+        self.take_id: Optional[str] = None
+        self.ready = False
+        self.audio_done = False
+        self.error: Optional[str] = None
+
+    def reset(self):
+        """Forget a take that was cut off, so the job can be submitted again."""
+        if self.sink is not None:
+            self.sink.discard()
+        self.sink = None
+        self.take_id = None
+        self.ready = self.audio_done = False
+
+    @property
+    def finished(self) -> bool:
+        return self.error is not None or (self.ready and self.audio_done)
+
+    def result(self, status: str, error: Optional[str] = None) -> McpBatchResult:
+        return McpBatchResult(
+            index=self.index,
+            status=status,
+            voice_id=self.voice_id,
+            output_file=str(self.output_file) if status != "error" else None,
+            take_id=self.take_id,
+            error=error,
+        )
+
+
+def _cache_key(text: str, voice_id: str, audio_format: str) -> str:
+    # Same keys as a streaming text_to_speech call
+    return make_cache_key(text, voice_id, None, audio_format, "websocket")
+
+
+def synthesize_batch(
+    items: List[McpBatchItem],
+    output_path: Path,
+    default_voice_id: Optional[str] = None,
+    on_item: Optional[Callable[[int, int], None]] = None,
+) -> List[McpBatchResult]:
+    """
+    Generate many texts, pipelining their takes over one websocket per model.
+
+    Every item is written to its own file in ``output_path``. A failing item
+    does not fail the batch; the returned manifest has one entry per item, in
+    the order of ``items``, with its status and output file or error.
+    ``on_item`` is called with (items done, total items).
+    """
+    results: List[Optional[McpBatchResult]] = [None] * len(items)
+    cache = get_synthesis_cache()
+    done = 0
+
+    def finish(result: McpBatchResult):
+        nonlocal done
+        results[result.index] = result
+        done += 1
+        if on_item:
+            on_item(done, len(items))
+
+    jobs = []
+    for index, item in enumerate(items):
+        job = _BatchJob(
+            index,
+            item,
+            item.voice_id or default_voice_id,  # type: ignore
+            output_path,
+        )
+        if not item.text.strip() or item.text == "None":
+            finish(job.result("error", "Text for TTS cannot be empty."))
+        elif item.audio_format not in _formats:
+            finish(job.result("error", f"audio_format must be one of {_formats}."))
+        elif not job.voice_id:
+            finish(job.result("error", "No voice_id given and no voices available."))
+        else:
+            audio = cache.get(job.cache_key) if cache else None
+            if audio is None:
+                jobs.append(job)
+            else:
+                job.output_file = (
+                    get_output_writer()
+                    .write(output_path, item.text, item.audio_format, audio)
+                    .result()
+                )
+                finish(job.result("cached"))
+
+    groups: Dict[str, List[_BatchJob]] = {}
+    if jobs:
+        models = voice_models([job.voice_id for job in jobs])
+        for job in jobs:
+            model = models.get(job.voice_id)
+            if model is None:
+                finish(job.result("error", f"Voice {job.voice_id} not found."))
+            else:
+                groups.setdefault(model, []).append(job)
+
+    # clients waiting on a take go first
+    with scheduling(priority="batch"):
+        for model, group in groups.items():
+            _run_group(model, group, finish)
+
+    return results  # type: ignore
+
+
+def _run_group(
+    model: str, jobs: List[_BatchJob], finish: Callable[[McpBatchResult], None]
+):
+    """Generate the jobs of one model over its pooled websocket, routed by request_id."""
+    from daisys.v1.speak import (  # type: ignore
+        DaisysWebsocketGenerateError,
+        StreamOptions,
+        StreamMode,
+    )
+
+    cache = get_synthesis_cache()
+    pending = list(reversed(jobs))
+    active: Dict[int, _BatchJob] = {}
+    last_activity = time.monotonic()
+
+    def status_cb(request_id, take):
+        nonlocal last_activity
+        last_activity = time.monotonic()
+        job = active.get(request_id)
+        if job is None:
+            return
+        job.take_id = take.take_id
+        if take.status == Status.READY:
+            job.ready = True
+        elif take.status in [Status.ERROR, Status.TIMEOUT]:
+            job.error = f"Take ended with status {take.status.value}."
+
+    def audio_cb(request_id, take_id, part_id, chunk_id, audio):
+        nonlocal last_activity
+        last_activity = time.monotonic()
+        job = active.get(request_id)
+        if job is None or job.sink is None:
+            return
+        if audio:
+            # the first chunk of every part carries its own wav header
+            if chunk_id in [0, None]:
+                header, audio = split_wav_header(audio)
+                if header is not None and not job.sink.bytes_written:
+                    job.sink.set_format(*parse_wav_header(header)[:2])
+            job.sink.write(audio)
+        elif chunk_id in [0, None]:
+            job.audio_done = True
+
+    def complete(job: _BatchJob):
+        characters_total.inc(len(job.item.text), protocol="websocket")
+        audio_bytes_total.inc(job.sink.bytes_written, protocol="websocket")
+        if job.error is not None:
+            job.sink.discard()
+            finish(job.result("error", job.error))
+            return
+        try:
+            job.sink.close()
+            job.output_file = (
+                get_output_writer()
+                .finish(
+                    job.sink.path,
+                    job.output_path,
+                    job.item.text,
+                    job.item.audio_format,
+                )
+                .result()
+            )
+            if cache:
+                cache.put_file(job.cache_key, job.output_file)
+            remember_take(job.item.text, job.voice_id, None, "websocket", job.take_id)
+            remember_file(
+                job.item.text,
+                job.voice_id,
+                None,
+                "websocket",
+                job.item.audio_format,
+                job.output_file,
+            )
+        except Exception as e:
+            finish(job.result("error", str(e)))
+            return
+        finish(job.result("ok"))
+
+    def run():
+        nonlocal last_activity
+        # takes cut off by a lost connection may have been accepted upstream,
+        # they only start over on the next one when resubmitting is allowed
+        for job in list(active.values()):
+            if job.error is None and not resubmit_lost_takes:
+                job.error = (
+                    "Connection lost while the take was generating; "
+                    "it is not submitted again to avoid generating it twice."
+                )
+            if job.error is not None:
+                job.sink.discard()  # type: ignore
+                finish(job.result("error", job.error))
+            else:
+                job.reset()
+                pending.append(job)
+        active.clear()
+        if not pending:
+            return
+
+        with pooled_websocket(model=model) as ws:
+            while pending or active:
+                throttled = False
+                while pending and len(active) < max(batch_max_in_flight, 1):
+                    job = pending[-1]
+                    # takes that are streaming need update(), wait for the
+                    # turn of the next one in between
+                    if not active:
+                        acquire(len(job.item.text))
+                    elif not try_acquire(len(job.item.text)):
+                        throttled = True
+                        break
+                    # compressed formats are encoded while they stream in
+                    _, job.sink = open_part_sink(job.output_path, job.item.audio_format)
+                    try:
+                        request_id = ws.generate_take(
+                            voice_id=job.voice_id,
+                            text=job.item.text,
+                            status_callback=status_cb,
+                            audio_callback=audio_cb,
+                            stream_options=StreamOptions(mode=StreamMode.CHUNKS),
+                        )
+                    except BaseException:
+                        # still pending, it is retried or reported with the rest
+                        job.sink.discard()
+                        job.sink = None
+                        raise
+                    pending.pop()
+                    active[request_id] = job
+                    last_activity = time.monotonic()
+
+                try:
+                    ws.update(timeout=0.05 if throttled else 1)
+                except DaisysWebsocketGenerateError as e:
+                    job = active.get(e.request_id)  # type: ignore
+                    if job is not None:
+                        job.error = str(e)
+
+                for request_id, job in list(active.items()):
+                    if job.finished:
+                        del active[request_id]
+                        complete(job)
+
+                if time.monotonic() - last_activity > batch_idle_timeout:
+                    raise TimeoutError(
+                        f"No response for {batch_idle_timeout:.0f} seconds."
+                    )
+
+    try:
+        call_with_retry("websocket", run)
+    except Exception as e:
+        for job in list(active.values()) + pending:
+            job.error = job.error or str(e) or type(e).__name__
+            if job.sink is not None:
+                job.sink.discard()
+            finish(job.result("error", job.error))
@@ -0,0 +1,294 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from daisys_mcp.audio import SpilledAudio
+
+cache_enabled = os.getenv("DAISYS_CACHE_ENABLED", "true").lower() == "true"
+cache_max_entries = int(os.getenv("DAISYS_CACHE_MAX_ENTRIES", "256"))
+cache_max_bytes = int(os.getenv("DAISYS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+cache_disk_max_entries = int(os.getenv("DAISYS_CACHE_DISK_MAX_ENTRIES", "4096"))
+cache_disk_max_bytes = int(
+    os.getenv("DAISYS_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))
+)
+cache_ttl_seconds = float(os.getenv("DAISYS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+storage_path = os.environ.get("DAISYS_BASE_STORAGE_PATH")
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return _whitespace.sub(" ", text).strip()
+
+
+def make_cache_key(
+    text: str,
+    voice_id: Optional[str],
+    prosody: Optional[str],
+    audio_format: str,
+    protocol: str,
+    sample_rate: Optional[int] = None,
+) -> str:
+    """Content address of a synthesis request."""
+    parts = [
+        normalize_text(text),
+        voice_id or "",
+        prosody or "",
+        audio_format,
+        protocol,
+    ]
+    if sample_rate:
+        parts.append(str(sample_rate))
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class SynthesisCache:
+    """
+    Two tier cache for finished audio files, keyed by ``make_cache_key``.
+
+    The memory tier is an LRU bounded by entry count and total bytes. The
+    optional disk tier lives in ``directory`` and has its own bounds; entries
+    evicted from memory stay available on disk and are promoted back on a hit.
+    Entries older than ``ttl`` seconds are treated as misses in both tiers.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        max_entries: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_max_entries: int = 4096,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+        ttl: float = 7 * 24 * 3600,
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # key -> (created, data)
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._memory_bytes = 0
+        # key -> (created, size)
+        self._disk: OrderedDict[str, tuple[float, int]] = OrderedDict()
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        if self.directory is not None:
+            self._load_disk_index()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.audio"  # type: ignore
+
+    def _load_disk_index(self):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)  # type: ignore
+            files = [
+                (f.stat().st_mtime, f.stem, f.stat().st_size)
+                for f in self.directory.glob("*/*.audio")  # type: ignore
+            ]
+        except OSError:
+            self.directory = None
+            return
+        for mtime, key, size in sorted(files):
+            self._disk[key] = (mtime, size)
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return entry[1]
+                self._drop_memory(key)
+
+            disk_entry = self._disk.get(key)
+            if disk_entry is not None and self._expired(disk_entry[0]):
+                self._drop_disk(key)
+                disk_entry = None
+            if disk_entry is None:
+                self.misses += 1
+                return None
+
+        # read without the lock, so memory hits don't wait for the disk
+        try:
+            data = self._path(key).read_bytes()
+        except OSError:
+            data = None
+
+        with self._lock:
+            if data is None:
+                if self._disk.get(key) == disk_entry:
+                    self._drop_disk(key)
+                self.misses += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._store_memory(key, data, disk_entry[0])
+            self.hits += 1
+            self.disk_hits += 1
+            return data
+
+    def put(self, key: str, data: bytes):
+        now = time.time()
+        if isinstance(data, SpilledAudio):
+            # a mapped spill file is not RAM, and holding it in the memory
+            # tier would keep the file alive: cache only a copy on disk
+            self._copy_to_disk(key, data.path, len(data), now)
+            return
+        with self._lock:
+            self._store_memory(key, data, now)
+        if self.directory is not None and len(data) <= self.disk_max_bytes:
+            if self._write_disk(key, lambda tmp_path: tmp_path.write_bytes(data)):
+                with self._lock:
+                    self._add_disk_entry(key, len(data), now)
+
+    def put_file(self, key: str, path: Path):
+        """
+        Cache a finished audio file without reading it into memory first.
+
+        The file is copied into the disk tier; it is only loaded into the
+        memory tier when it fits there.
+        """
+        now = time.time()
+        size = os.path.getsize(path)
+        if self.max_entries > 0 and size <= self.max_bytes:
+            data = Path(path).read_bytes()
+            with self._lock:
+                self._store_memory(key, data, now)
+        self._copy_to_disk(key, path, size, now)
+
+    def _copy_to_disk(self, key: str, path: Path, size: int, created: float):
+        if self.directory is not None and size <= self.disk_max_bytes:
+            if self._write_disk(key, lambda tmp_path: shutil.copyfile(path, tmp_path)):
+                with self._lock:
+                    self._add_disk_entry(key, size, created)
+
+    def _store_memory(self, key: str, data: bytes, created: float):
+        if len(data) > self.max_bytes:
+            return
+        if key in self._memory:
+            self._drop_memory(key)
+        self._memory[key] = (created, data)
+        self._memory_bytes += len(data)
+        while self._memory and (
+            len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes
+        ):
+            old_key, _ = next(iter(self._memory.items()))
+            self._drop_memory(old_key)
+            self.evictions += 1
+
+    def _write_disk(self, key: str, write) -> bool:
+        """Write the file of ``key`` with ``write(tmp_path)``, outside of the lock."""
+        path = self._path(key)
+        # unique, so concurrent puts of one key don't write the same file
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return False
+        return True
+
+    def _add_disk_entry(self, key: str, size: int, created: float):
+        if key in self._disk:
+            self._disk_bytes -= self._disk.pop(key)[1]
+        self._disk[key] = (created, size)
+        self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk and (
+            len(self._disk) > self.disk_max_entries
+            or self._disk_bytes > self.disk_max_bytes
+        ):
+            old_key = next(iter(self._disk))
+            self._drop_disk(old_key)
+            self.evictions += 1
+
+    def _drop_memory(self, key: str):
+        _, data = self._memory.pop(key)
+        self._memory_bytes -= len(data)
+
+    def _drop_disk(self, key: str):
+        _, size = self._disk.pop(key)
+        self._disk_bytes -= size
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._disk):
+                self._drop_disk(key)
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+_cache: Optional[SynthesisCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_synthesis_cache() -> Optional[SynthesisCache]:
+    """Return the process-wide synthesis cache, or None when caching is disabled."""
+    global _cache
+    if not cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                directory = None
+                if storage_path:
+                    directory = Path(os.path.expanduser(storage_path)) / ".daisys_cache"
+                _cache = SynthesisCache(
+                    directory=directory,
+                    max_entries=cache_max_entries,
+                    max_bytes=cache_max_bytes,
+                    disk_max_entries=cache_disk_max_entries,
+                    disk_max_bytes=cache_disk_max_bytes,
+                    ttl=cache_ttl_seconds,
+                )
+    return _cache
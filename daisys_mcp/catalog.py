@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+from daisys_mcp.concurrency import SingleFlight
+from daisys_mcp.metrics import timed
+from daisys_mcp.model import (
+    CatalogIndex,
+    McpModel,
+    McpVoice,
+    model_index,
+    voice_index,
+)
+from daisys_mcp.resilience import call_with_retry
+from daisys_mcp.session import speak_client
+from daisys_mcp.utils import throw_mcp_error
+
+# Catalogs younger than this are served without contacting the API.
+catalog_ttl_seconds = float(os.getenv("DAISYS_CATALOG_TTL_SECONDS", "300"))
+# Stale catalogs up to this age are served while a refresh runs in the background.
+catalog_max_stale_seconds = float(os.getenv("DAISYS_CATALOG_MAX_STALE_SECONDS", "3600"))
+
+T = TypeVar("T")
+
+
+class CatalogCache(Generic[T]):
+    """
+    In-memory copy of a listing from the speak API (voices or models).
+
+    Items are converted to their Mcp model once, when fetched. A fresh
+    catalog is served from memory; a stale one is served from memory as well
+    while a single background thread refreshes it (stale-while-revalidate).
+    Only an empty or expired catalog makes the caller wait for the API.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], list[T]],
+        key: Callable[[T], str],
+        build_index: Optional[Callable[[list[T]], CatalogIndex]] = None,
+        ttl: float = 300,
+        max_stale: float = 3600,
+    ):
+        self._fetch = fetch
+        self._key = key
+        self._build_index = build_index
+        self.ttl = ttl
+        self.max_stale = max_stale
+
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._items: Optional[list[T]] = None
+        self._index: Optional[CatalogIndex] = None
+        self._fetched_at = 0.0
+        self._mutations = 0
+        self._refreshing = False
+
+    def _age(self) -> float:
+        return time.monotonic() - self._fetched_at
+
+    def get(self) -> list[T]:
+        """Return the catalog items, in the order the API returned them."""
+        with self._lock:
+            items = self._items
+            age = self._age()
+            if items is not None and age <= self.ttl:
+                return items
+            if items is not None and age <= self.max_stale:
+                self._refresh_in_background()
+                return items
+        return self.refresh()
+
+    def index(self) -> CatalogIndex:
+        """Return the catalog index, rebuilt only when the items have changed."""
+        items = self.get()
+        with self._lock:
+            if self._index is None or self._index.items is not items:
+                self._index = self._build_index(items)  # type: ignore
+            return self._index
+
+    def refresh(self) -> list[T]:
+        """Fetch the catalog from the API now, sharing the fetch between callers."""
+        # callers arriving during a fetch get its result (or error) instead
+        # of fetching again
+        items, _ = self._flight.do("refresh", self._refresh)
+        return items
+
+    def _refresh(self) -> list[T]:
+        with self._lock:
+            mutations = self._mutations
+        items = self._fetch()
+        with self._lock:
+            # An add/remove raced with the fetch, the fetched list may not
+            # include it yet; keep the local view and refetch later.
+            if self._mutations != mutations and self._items is not None:
+                return self._items
+            self._items = items
+            self._fetched_at = time.monotonic()
+            return items
+
+    def _refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the stale catalog, the next call tries again
+                pass
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self):
+        """Drop the cached catalog so the next call fetches it again."""
+        with self._lock:
+            self._items = None
+
+    def add(self, item: T):
+        """Add or replace an item in the cached catalog without refetching."""
+        with self._lock:
+            if self._items is None:
+                return
+            key = self._key(item)
+            self._items = [i for i in self._items if self._key(i) != key] + [item]
+            self._mutations += 1
+
+    def remove(self, key: str):
+        """Remove an item from the cached catalog without refetching."""
+        with self._lock:
+            if self._items is None:
+                return
+            self._items = [i for i in self._items if self._key(i) != key]
+            self._mutations += 1
+
+
+def _get_voices():
+    with speak_client() as speak, timed("voice_lookup"):
+        return speak.get_voices()
+
+
+def _get_models():
+    with speak_client() as speak, timed("model_lookup"):
+        return speak.get_models()
+
+
+def fetch_voices() -> list[McpVoice]:
+    voices = call_with_retry("catalog", _get_voices)
+    return [
+        McpVoice(
+            voice_id=voice.voice_id,
+            name=voice.name,
+            gender=voice.gender,
+            model=voice.model,
+            description=voice.description,
+        )
+        for voice in voices
+    ]
+
+
+def fetch_models() -> list[McpModel]:
+    models = call_with_retry("catalog", _get_models)
+    return [
+        McpModel(
+            name=model.name,
+            displayname=model.displayname,
+            flags=model.flags,
+            languages=model.languages,
+            genders=model.genders,
+            styles=model.styles,
+            prosody_types=model.prosody_types,
+        )
+        for model in models
+    ]
+
+
+voice_catalog: CatalogCache[McpVoice] = CatalogCache(
+    fetch_voices,
+    key=lambda voice: voice.voice_id,
+    build_index=voice_index,
+    ttl=catalog_ttl_seconds,
+    max_stale=catalog_max_stale_seconds,
+)
+model_catalog: CatalogCache[McpModel] = CatalogCache(
+    fetch_models,
+    key=lambda model: model.name,
+    build_index=model_index,
+    ttl=catalog_ttl_seconds,
+    max_stale=catalog_max_stale_seconds,
+)
+
+
+def latest_voice_id() -> str:
+    """The most recently created voice, used when no voice_id is given."""
+    voices = voice_catalog.get()
+    if not voices:
+        throw_mcp_error("No voices available. Try to generate a voice first.")
+    return voices[-1].voice_id
+
+
+def voice_models(voice_ids: list[str]) -> dict[str, str]:
+    """The model of every known voice, refreshing the catalog if one is missing."""
+    models = {voice.voice_id: voice.model for voice in voice_catalog.get()}
+    if any(voice_id not in models for voice_id in voice_ids):
+        models = {voice.voice_id: voice.model for voice in voice_catalog.refresh()}
+    return models
@@ -0,0 +1,214 @@
+import functools
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Literal, TypeVar
+
+import anyio  # type: ignore
+import anyio.from_thread  # type: ignore
+import anyio.to_thread  # type: ignore
+
+# Number of text to speech generations that may run at the same time.
+max_concurrent_synthesis = int(os.getenv("DAISYS_MAX_CONCURRENT_SYNTHESIS", "4"))
+# Number of cheap metadata calls (voices, models, ...) that may run at the same time.
+max_concurrent_requests = int(os.getenv("DAISYS_MAX_CONCURRENT_REQUESTS", "8"))
+# Number of tool calls one client may have running at the same time; 0 is unlimited.
+max_concurrent_per_client = int(os.getenv("DAISYS_MAX_CONCURRENT_PER_CLIENT", "8"))
+
+T = TypeVar("T")
+WorkKind = Literal["synthesis", "request"]
+
+_limiters: dict[str, anyio.CapacityLimiter] = {}
+# one limiter per client session, dropped with the session
+_client_limiters: "weakref.WeakKeyDictionary[Any, anyio.CapacityLimiter]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class ActivityCounter:
+    """Counts running pieces of work, so lower priority work can wait for none to run."""
+
+    def __init__(self):
+        self._active = 0
+        self._idle = threading.Condition()
+
+    def __enter__(self):
+        with self._idle:
+            self._active += 1
+
+    def __exit__(self, *exc):
+        with self._idle:
+            self._active -= 1
+            if not self._active:
+                self._idle.notify_all()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """Block until nothing is running; False if ``timeout`` passed first."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._active, timeout)
+
+
+# Synthesis requested by a client; background work such as prefetching
+# yields to it.
+foreground_synthesis = ActivityCounter()
+
+
+class _Flight:
+    def __init__(self, event=None):
+        self.done = threading.Event()
+        self.event = event
+        self.abandoned = False
+        self.result: Any = None
+        self.error: Exception | None = None
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesces identical calls that are in flight at the same time.
+
+    The first caller of a key runs the call; callers of the same key that
+    arrive before it finishes wait for it and get the same result, or the
+    same exception. The next call after it finished runs again. Use one
+    instance either from threads (``do``) or from the event loop
+    (``do_async``), not both.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+
+    def _join(self, key: str, event=None) -> tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight(event)
+            return flight, True
+
+    def _finish(self, key: str, flight: _Flight):
+        with self._lock:
+            del self._flights[key]
+        flight.done.set()
+        if flight.event is not None:
+            flight.event.set()
+
+    def do(
+        self, key: str, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> tuple[T, bool]:
+        """Run ``func`` once for concurrent callers of ``key``; returns (result, shared)."""
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                break
+            flight.done.wait()
+            if not flight.abandoned:
+                return flight.outcome(), True
+        try:
+            flight.result = func(*args, **kwargs)
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            flight.abandoned = True
+            raise
+        finally:
+            self._finish(key, flight)
+
+    async def do_async(
+        self, key: str, func: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> tuple[T, bool]:
+        """``do`` for coroutine functions; waiting callers do not hold a thread."""
+        while True:
+            flight, leader = self._join(key, anyio.Event())
+            if leader:
+                break
+            await flight.event.wait()  # type: ignore
+            # a cancelled leader leaves nothing to share, one of us runs it again
+            if not flight.abandoned:
+                return flight.outcome(), True
+        try:
+            flight.result = await func(*args, **kwargs)
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            flight.abandoned = True
+            raise
+        finally:
+            self._finish(key, flight)
+
+
+def get_limiter(kind: WorkKind) -> anyio.CapacityLimiter:
+    """
+    Return the capacity limiter for a kind of work.
+
+    Synthesis and metadata calls have separate limits, so a burst of slow
+    generations never starves ``get_voices`` and friends.
+    """
+    limiter = _limiters.get(kind)
+    if limiter is None:
+        limit = (
+            max_concurrent_synthesis if kind == "synthesis" else max_concurrent_requests
+        )
+        limiter = _limiters[kind] = anyio.CapacityLimiter(max(limit, 1))
+    return limiter
+
+
+@asynccontextmanager
+async def client_slot(client: Any) -> AsyncIterator[None]:
+    """
+    Hold one of the ``max_concurrent_per_client`` slots of ``client`` (an MCP session).
+
+    With many clients on one server, a client sending a burst of calls
+    waits for its own slots instead of filling the shared limiters.
+    """
+    if client is None or max_concurrent_per_client <= 0:
+        yield
+        return
+    limiter = _client_limiters.get(client)
+    if limiter is None:
+        limiter = _client_limiters[client] = anyio.CapacityLimiter(
+            max_concurrent_per_client
+        )
+    async with limiter:
+        yield
+
+
+def limiter_stats() -> dict[str, tuple[int, int]]:
+    """(running, waiting) per kind of work that has run so far."""
+    return {
+        kind: (int(limiter.borrowed_tokens), limiter.statistics().tasks_waiting)
+        for kind, limiter in list(_limiters.items())
+    }
+
+
+async def run_blocking(
+    func: Callable[..., T], *args: Any, kind: WorkKind = "request", **kwargs: Any
+) -> T:
+    """Run a blocking function in a worker thread, bounded by the limiter for ``kind``."""
+    call = functools.partial(func, *args, **kwargs)
+    if kind == "synthesis":
+        call = functools.partial(_in_foreground, call)
+    return await anyio.to_thread.run_sync(call, limiter=get_limiter(kind))
+
+
+def _in_foreground(call: Callable[[], T]) -> T:
+    with foreground_synthesis:
+        return call()
+
+
+def run_async_from_thread(func: Callable[..., Awaitable[T]], *args: Any) -> T:
+    """Call an async function on the event loop from inside ``run_blocking``."""
+    return anyio.from_thread.run(func, *args)
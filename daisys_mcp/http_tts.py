@@ -1,53 +1,100 @@
+import functools
 import os
-import io
 from typing import Optional
 
-
-from daisys import DaisysAPI  # type: ignore
-from daisys.v1.speak import SimpleProsody, DaisysTakeGenerateError  # type: ignore
-
+from daisys_mcp.metrics import audio_bytes_total, characters_total, timed
+from daisys_mcp.playback import get_playback_engine
+from daisys_mcp.resilience import call_with_retry, is_unprocessed
+from daisys_mcp.scheduler import acquire
+from daisys_mcp.session import speak_client
+from daisys_mcp.takes import remember_take, reuse_take
 from daisys_mcp.utils import throw_mcp_error
 
 disable_audio_playback = os.getenv("DISABLE_AUDIO_PLAYBACK", "false").lower() == "true"
 
-email = os.environ.get("DAISYS_EMAIL")
-password = os.environ.get("DAISYS_PASSWORD")
+
+@functools.lru_cache(maxsize=None)
+def default_prosody():
+    """Prosody used for HTTP takes, built on first use to keep the client lazy."""
+    from daisys.v1.speak import SimpleProsody  # type: ignore
+
+    return SimpleProsody(pace=0, pitch=0, expression=5)
 
 
-def text_to_speech_http(text: str, voice_id: Optional[str] = None):
+def play_audio(audio: bytes, wait: bool = True, label: str = ""):
+    """
+    Queue an encoded audio file (wav or mp3) on the playback engine.
+
+    Returns the queued utterance; with ``wait`` it only returns once the
+    audio has played.
+    """
+    try:
+        import sounddevice  # type: ignore # noqa: F401
+        import soundfile  # type: ignore # noqa: F401
+    except ModuleNotFoundError:
+        message = "`uv pip install sounddevice soundfile` to enable audio playback."
+        raise ValueError(message)
+    utterance = get_playback_engine().play(audio, label)
+    if wait:
+        utterance.wait()
+    return utterance
+
+
+def text_to_speech_http(
+    text: str,
+    voice_id: Optional[str] = None,
+    audio_format: str = "mp3",
+    playback: bool = True,
+):
     """
     Generate and play audio from text using DaisysAPI's HTTP protocol with sounddevice.
+    The audio is returned in ``audio_format`` ("wav" or "mp3").
+
+    A take of the same text, voice and prosody that was generated before is
+    downloaded again (or read from its saved file) instead of generated.
     """
-    if not email or not password:
-        throw_mcp_error(
-            "DAISYS_EMAIL and DAISYS_PASSWORD environment variables must be set."
-        )
+    from daisys.v1.speak import DaisysTakeGenerateError  # type: ignore
 
     if text in ["None", "", None]:
         throw_mcp_error("Text for TTS cannot be empty.")
 
-    with DaisysAPI("speak", email=email, password=password) as speak:
-        try:
-            take = speak.generate_take(
-                voice_id=voice_id,
-                text=text,
-                prosody=SimpleProsody(pace=0, pitch=0, expression=5),
-            )
-        except DaisysTakeGenerateError as e:
-            raise RuntimeError(f"Error generating take: {str(e)}")
+    prosody = default_prosody().model_dump_json()
+    # an earlier take of the same text is downloaded again, in any format
+    audio = reuse_take(text, voice_id, prosody, "http", audio_format)
+    if audio is not None:
+        if playback and not disable_audio_playback:
+            play_audio(audio, wait=False, label=text)
+        return audio
 
-        audio_mp3 = speak.get_take_audio(take.take_id, format="mp3")
-
-        if not disable_audio_playback:
+    def generate() -> str:
+        acquire(len(text))
+        with speak_client() as speak:
             try:
-                import sounddevice as sd  # type: ignore
-                import soundfile as sf  # type: ignore
-            except ModuleNotFoundError:
-                message = (
-                    "`uv pip install sounddevice soundfile` to enable audio playback."
-                )
-                raise ValueError(message)
-            sd.play(*sf.read(io.BytesIO(audio_mp3)))
-            sd.wait()
-
-        return audio_mp3
+                with timed("http_generate"):
+                    take = speak.generate_take(
+                        voice_id=voice_id,
+                        text=text,
+                        prosody=default_prosody(),
+                    )
+            except DaisysTakeGenerateError as e:
+                raise RuntimeError(f"Error generating take: {str(e)}")
+        remember_take(text, voice_id, prosody, "http", take.take_id)
+        return take.take_id
+
+    def download(take_id: str) -> bytes:
+        with speak_client() as speak, timed("http_download"):
+            return speak.get_take_audio(take_id, format=audio_format)
+
+    # a take is only submitted again when it never reached the server, it
+    # would be generated (and billed) twice otherwise; downloads are retried
+    # on any network error or overloaded server, without generating again
+    take_id = call_with_retry("http", generate, retryable=is_unprocessed)
+    audio = call_with_retry("http", download, take_id)
+    characters_total.inc(len(text), protocol="http")
+    audio_bytes_total.inc(len(audio), protocol="http")
+
+    if playback and not disable_audio_playback:
+        # queued, the take is returned without waiting for it to play
+        play_audio(audio, wait=False, label=text)
+
+    return audio
@@ -0,0 +1,409 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from daisys_mcp.utils import DaisysMcpTimeoutError
+
+# Serve the metrics in the Prometheus text format on this port; unset is off.
+metrics_port = os.getenv("DAISYS_METRICS_PORT")
+metrics_host = os.getenv("DAISYS_METRICS_HOST", "127.0.0.1")
+# Also record every stage as an OpenTelemetry span (needs opentelemetry-api).
+otel_enabled = os.getenv("DAISYS_OTEL_ENABLED", "false").lower() == "true"
+
+# Seconds; spans the few milliseconds of a cache hit up to a long take.
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+# name, type, help, labels, value; as produced by collectors
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _snapshot_key(labels: Labels) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0)
+
+    def _render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {_snapshot_key(k): v for k, v in sorted(self._values.items())}
+
+
+class Gauge(Counter):
+    """A value per label set that goes up and down."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """Count the block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram:
+    """
+    Observed values (durations) per label set, counted in fixed buckets.
+
+    The buckets are upper bounds; quantiles in the summary are interpolated
+    within the bucket they fall in, like Prometheus' histogram_quantile.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            counts, _ = self._values.get(_labels(labels), ([0], [0.0]))
+            return sum(counts)
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        with self._lock:
+            counts, _ = self._values.get(_labels(labels), ([], []))
+            return self._quantile(q, list(counts))
+
+    def _quantile(self, q: float, counts: List[int]) -> Optional[float]:
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    # above the largest bucket, the best bound there is
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def _render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), t[0])) for k, (c, t) in self._values.items())
+        lines = []
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                cumulative += count
+                le = [("le", _format_value(bound))]
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(labels, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            items = sorted((k, (list(c), t[0])) for k, (c, t) in self._values.items())
+        summary = {}
+        for labels, (counts, total) in items:
+            count = sum(counts)
+            summary[_snapshot_key(labels)] = {
+                "count": count,
+                "mean": round(total / count, 4),
+                **{
+                    f"p{int(q * 100)}": round(self._quantile(q, counts), 4)  # type: ignore
+                    for q in (0.5, 0.95, 0.99)
+                },
+            }
+        return summary
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, rendered in the Prometheus text format.
+
+    Collectors are called on every render, for values that are read from
+    other components (cache sizes, queue lengths) rather than counted here.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.setdefault(metric.name, metric)
+            return self._metrics[metric.name]
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._add(Counter(name, help))  # type: ignore
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._add(Gauge(name, help))  # type: ignore
+
+    def histogram(
+        self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._add(Histogram(name, help, buckets))  # type: ignore
+
+    def add_collector(self, collect: Callable[[], Iterable[Sample]]):
+        with self._lock:
+            self._collectors.append(collect)
+
+    def _collected(self) -> Dict[str, List[Sample]]:
+        by_name: Dict[str, List[Sample]] = {}
+        for collect in list(self._collectors):
+            try:
+                samples = list(collect())
+            except Exception:
+                continue
+            for sample in samples:
+                by_name.setdefault(sample[0], []).append(sample)
+        return by_name
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            body = metric._render()  # type: ignore
+            if body:
+                lines.append(f"# HELP {metric.name} {metric.help}")  # type: ignore
+                lines.append(f"# TYPE {metric.name} {metric.kind}")  # type: ignore
+                lines.extend(body)
+        for name, samples in self._collected().items():
+            _, kind, help, _, _ = samples[0]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for _, _, _, labels, value in samples:
+                lines.append(
+                    f"{name}{_format_labels(_labels(labels))} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """All metrics as a dict, with quantiles instead of buckets for histograms."""
+        snapshot = {}
+        for metric in list(self._metrics.values()):
+            values = metric._snapshot()  # type: ignore
+            if values:
+                snapshot[metric.name] = values  # type: ignore
+        for name, samples in self._collected().items():
+            snapshot[name] = {
+                _snapshot_key(_labels(labels)): value
+                for _, _, _, labels, value in samples
+            }
+        return snapshot
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "daisys_stage_seconds",
+    "Duration of a stage of handling a request (login, websocket_connect, first_chunk, ...).",
+)
+tool_seconds = registry.histogram(
+    "daisys_tool_seconds", "Duration of an MCP tool call."
+)
+tools_in_flight = registry.gauge(
+    "daisys_tool_calls_in_flight", "MCP tool calls being handled."
+)
+errors_total = registry.counter(
+    "daisys_errors_total", "Failed stages and tool calls, by exception type."
+)
+timeouts_total = registry.counter(
+    "daisys_timeouts_total", "Stages and tool calls that timed out."
+)
+audio_bytes_total = registry.counter(
+    "daisys_audio_bytes_total", "Audio bytes received from the API."
+)
+characters_total = registry.counter(
+    "daisys_characters_total", "Characters of text sent to the API for synthesis."
+)
+
+
+def _tracer():
+    if not otel_enabled:
+        return None
+    try:
+        from opentelemetry import trace  # type: ignore
+    except ModuleNotFoundError:
+        return None
+    return trace.get_tracer("daisys_mcp")
+
+
+def record_error(where: str, error: BaseException):
+    """Count a failed stage or tool call by exception type, and timeouts apart."""
+    errors_total.inc(stage=where, type=type(error).__name__)
+    if isinstance(error, (DaisysMcpTimeoutError, TimeoutError)):
+        timeouts_total.inc(stage=where)
+
+
+@contextmanager
+def timed(stage: str, **attributes) -> Iterator[None]:
+    """
+    Record the duration of a stage, and its error if it fails.
+
+    With OpenTelemetry enabled the stage is also a span named
+    ``daisys.<stage>`` with ``attributes``.
+    """
+    tracer = _tracer()
+    span = (
+        tracer.start_as_current_span(f"daisys.{stage}", attributes=attributes)
+        if tracer
+        else None
+    )
+    if span is not None:
+        span.__enter__()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        record_error(stage, e)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+        if span is not None:
+            if error is None:
+                span.__exit__(None, None, None)
+            else:
+                span.__exit__(type(error), error, error.__traceback__)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record the duration of a stage that was timed by the caller."""
+    stage_seconds.observe(seconds, stage=stage)
+
+
+def track_tool(name: str):
+    """Decorate an async MCP tool to record its duration, errors and calls in flight."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            with tools_in_flight.track(tool=name):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    record_error(name, e)
+                    raise
+                finally:
+                    tool_seconds.observe(time.perf_counter() - start, tool=name)
+
+        return wrapper
+
+    return decorator
+
+
+def start_metrics_server(host: str, port: int):
+    """Serve ``/metrics`` in the Prometheus text format from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # stdout is the MCP transport
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(
+        target=server.serve_forever, name="daisys-metrics", daemon=True
+    ).start()
+    return server
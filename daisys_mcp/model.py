@@ -1,5 +1,6 @@
-from pydantic import BaseModel  # type: ignore
-from typing import List, Optional
+from pydantic import BaseModel, field_validator  # type: ignore
+from typing import Callable, Dict, Generic, List, Optional, Set, Tuple, TypeVar
+from itertools import islice
 import enum
 
 
@@ -29,6 +30,36 @@ class McpModel(BaseModel):
     prosody_types: List[str]
 
 
+class McpBatchItem(BaseModel):
+    text: str
+    voice_id: str | None = None
+    audio_format: str = "wav"
+
+    @field_validator("voice_id")
+    @classmethod
+    def _null_voice_id(cls, voice_id):
+        # LLM sometimes send null as a string
+        if voice_id and voice_id.lower() in ["null", "undefined"]:
+            return None
+        return voice_id
+
+
+class McpBatchResult(BaseModel):
+    index: int
+    status: str  # "ok", "cached" or "error"
+    voice_id: str | None
+    output_file: str | None = None
+    take_id: str | None = None
+    error: str | None = None
+
+
+class McpPrefetchResult(BaseModel):
+    index: int
+    status: str  # "queued", "in_progress", "cached", "full" or "error"
+    voice_id: str | None
+    error: str | None = None
+
+
 class VoiceGender(str, enum.Enum):
     """Represents the gender of a voice.
 
@@ -41,3 +72,104 @@ class VoiceGender(str, enum.Enum):
     MALE = "male"
     FEMALE = "female"
     NONBINARY = "nonbinary"
+
+
+def _index_value(value) -> str:
+    # enums (e.g. VoiceGender) are indexed by their value
+    return str(getattr(value, "value", value) or "").lower()
+
+
+def language_keys(languages: List[str]) -> List[str]:
+    """Index keys for a list of language tags: "en-GB" -> "en-gb" and "en"."""
+    keys = []
+    for language in languages:
+        tag = _index_value(language).replace("_", "-")
+        keys.extend([tag, tag.split("-")[0]])
+    return keys
+
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class CatalogIndex(Generic[T]):
+    """
+    Read-only index over a catalog of voices or models.
+
+    ``fields`` maps a filter name to a function returning the index keys of an
+    item; items are grouped by key in hash indexes. For every field in
+    ``sort_fields`` the ascending and descending orders are computed once, so
+    a query only has to intersect the hash indexes and walk a presorted order.
+    """
+
+    def __init__(
+        self,
+        items: List[T],
+        fields: Dict[str, Callable[[T], List[str]]],
+        sort_fields: List[str],
+    ):
+        self.items = items
+        self._indexes: Dict[str, Dict[str, Set[int]]] = {}
+        for name, keys in fields.items():
+            index: Dict[str, Set[int]] = {}
+            for position, item in enumerate(items):
+                for key in keys(item):
+                    index.setdefault(key, set()).add(position)
+            self._indexes[name] = index
+
+        self._orders: Dict[Tuple[str, str], List[int]] = {}
+        positions = range(len(items))
+        for sort_by in sort_fields:
+
+            def sort_key(position: int, sort_by=sort_by) -> str:
+                return _index_value(getattr(items[position], sort_by))
+
+            self._orders[(sort_by, "asc")] = sorted(positions, key=sort_key)
+            self._orders[(sort_by, "desc")] = sorted(
+                positions, key=sort_key, reverse=True
+            )
+
+    def query(
+        self,
+        filters: Dict[str, Optional[str]],
+        sort_by: str,
+        sort_direction: str = "asc",
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[T]:
+        """Return the items matching all non-None ``filters``, sorted and paginated."""
+        matches: Optional[Set[int]] = None
+        for name, value in filters.items():
+            if value is None:
+                continue
+            found = self._indexes[name].get(_index_value(value), set())
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+
+        order = self._orders[(sort_by, sort_direction)]
+        offset = max(offset or 0, 0)
+        end = None if limit is None else offset + max(limit, 0)
+        if matches is None:
+            return [self.items[position] for position in order[offset:end]]
+
+        selected = (position for position in order if position in matches)
+        return [self.items[position] for position in islice(selected, offset, end)]
+
+
+def voice_index(voices: List[McpVoice]) -> CatalogIndex[McpVoice]:
+    return CatalogIndex(
+        voices,
+        fields={
+            "model": lambda voice: [_index_value(voice.model)],
+            "gender": lambda voice: [_index_value(voice.gender)],
+        },
+        sort_fields=["name", "description"],
+    )
+
+
+def model_index(models: List[McpModel]) -> CatalogIndex[McpModel]:
+    return CatalogIndex(
+        models,
+        fields={"language": lambda model: language_keys(model.languages)},
+        sort_fields=["name", "displayname"],
+    )
@@ -0,0 +1,301 @@
+import atexit
+import hashlib
+import os
+import queue
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Optional, Union
+
+import anyio  # type: ignore
+import anyio.from_thread  # type: ignore
+import anyio.lowlevel  # type: ignore
+
+from daisys_mcp.audio import SpilledAudio, open_file_sink
+from daisys_mcp.concurrency import run_blocking
+from daisys_mcp.metrics import timed
+from daisys_mcp.utils import forget_output_path, make_output_file, throw_mcp_error
+
+# "none" leaves flushing to the OS, "file" syncs every file before it is
+# renamed into place, "full" also syncs the directory after the rename.
+output_fsync = os.getenv("DAISYS_OUTPUT_FSYNC", "none").lower()
+# Files waiting for the writer thread; callers wait for room beyond this.
+output_max_queued = int(os.getenv("DAISYS_OUTPUT_MAX_QUEUED", "64"))
+# Files the writer thread writes before syncing their directories together.
+output_batch_size = 16
+
+_FSYNC_POLICIES = ["none", "file", "full"]
+_CHUNK_SIZE = 1024 * 1024
+
+AudioData = Union[bytes, bytearray, memoryview]
+
+
+def content_hash(data: AudioData) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def part_file(output_path: Path, extension: str) -> Path:
+    """A hidden file in ``output_path`` to stream a take into before it is named."""
+    return output_path / f".{uuid.uuid4().hex}.{extension}.part"
+
+
+def open_part_sink(
+    output_path: Path, audio_format: str, output_rate: Optional[int] = None
+):
+    """
+    A ``part_file`` in ``output_path`` and the sink streaming into it.
+
+    The directory is created again when it was removed since it was checked.
+    """
+    part = part_file(output_path, audio_format)
+    try:
+        return part, open_file_sink(part, audio_format, output_rate)
+    except FileNotFoundError:
+        forget_output_path(output_path)
+        output_path.mkdir(parents=True, exist_ok=True)
+        return part, open_file_sink(part, audio_format, output_rate)
+
+
+def _copy_file(source: Path, target: Path):
+    """Copy ``source`` to ``target`` in the kernel, without reading it into Python."""
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if not copied:
+                        break
+                    remaining -= copied
+            if remaining <= 0:
+                return
+        except OSError:
+            # not supported between these file systems
+            pass
+    # sendfile where available
+    shutil.copyfile(source, target)
+
+
+def _fsync_directory(directory: Path):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class _Write:
+    def __init__(self, output_path: Path, text: str, extension: str, data, source):
+        self.output_path = output_path
+        self.text = text
+        self.extension = extension
+        self.data = data
+        self.source = source
+        self.future: Future = Future()
+
+
+class OutputWriter:
+    """
+    Writes output files from one background thread, in batches.
+
+    A file is written to a hidden temporary file in its directory and
+    renamed into place, so a file under its final name is always complete.
+    Files are named by their content (see ``make_output_file``): two takes
+    can never overwrite each other, and saving the same audio twice gives
+    the same file. Audio that spilled to disk (``SpilledAudio``) is
+    hard-linked or copied in the kernel instead of written. ``fsync`` is one of "none", "file" or "full"; with "full"
+    the directories of a batch are synced once, after all of its renames.
+    """
+
+    def __init__(self, fsync: str = "none", max_queued: int = 64):
+        if fsync not in _FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {_FSYNC_POLICIES}, got {fsync}.")
+        self.fsync = fsync
+        self._queue: "queue.Queue[Optional[_Write]]" = queue.Queue(max(max_queued, 1))
+        self._thread = threading.Thread(
+            target=self._run, name="daisys-output-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(
+        self, output_path: Path, text: str, extension: str, data, block: bool = True
+    ) -> Optional[Future]:
+        """
+        Queue ``data`` to be saved in ``output_path``; the future has the file's path.
+
+        Without ``block`` None is returned when the queue is full.
+        """
+        return self._put(_Write(Path(output_path), text, extension, data, None), block)
+
+    def finish(
+        self, part: Path, output_path: Path, text: str, extension: str, block=True
+    ) -> Optional[Future]:
+        """``write`` for a file that was streamed into ``part`` (see ``part_file``)."""
+        return self._put(_Write(Path(output_path), text, extension, None, part), block)
+
+    def _put(self, job: _Write, block: bool) -> Optional[Future]:
+        try:
+            self._queue.put(job, block=block)
+        except queue.Full:
+            return None
+        return job.future
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def close(self):
+        """Write what is queued and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < output_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            jobs = [job for job in batch if job is not None]
+            self._write_batch(jobs)
+            if len(jobs) < len(batch):
+                return
+
+    def _write_batch(self, jobs):
+        directories = set()
+        done = []
+        for job in jobs:
+            try:
+                with timed("file_write"):
+                    path = self._write_one(job)
+            except BaseException as e:
+                job.future.set_exception(e)
+                continue
+            directories.add(path.parent)
+            done.append((job, path))
+        if self.fsync == "full":
+            for directory in directories:
+                _fsync_directory(directory)
+        for job, path in done:
+            job.future.set_result(path)
+
+    def _write_one(self, job: _Write) -> Path:
+        if job.source is not None:
+            digest = file_hash(job.source)
+            tmp_path = job.source
+        else:
+            digest = content_hash(job.data)
+            tmp_path = part_file(job.output_path, job.extension)
+            try:
+                self._write_file(tmp_path, job.data)
+            except FileNotFoundError:
+                # the directory was removed since it was checked
+                forget_output_path(job.output_path)
+                job.output_path.mkdir(parents=True, exist_ok=True)
+                self._write_file(tmp_path, job.data)
+        if self.fsync != "none" and job.source is not None:
+            with open(tmp_path, "rb+") as f:
+                os.fsync(f.fileno())
+        path = make_output_file(job.text, job.output_path, job.extension, digest)
+        try:
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return path
+
+    def _write_file(self, path: Path, data):
+        if isinstance(data, SpilledAudio):
+            # a long take that is already on disk: linked into place, or
+            # copied when it is on another file system
+            try:
+                os.link(data.path, path)
+            except OSError:
+                _copy_file(data.path, path)
+            if self.fsync != "none":
+                with open(path, "rb+") as f:
+                    os.fsync(f.fileno())
+            return
+        with open(path, "wb") as f:
+            f.write(data)
+            if self.fsync != "none":
+                f.flush()
+                os.fsync(f.fileno())
+
+
+_writer: Optional[OutputWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_output_writer() -> OutputWriter:
+    """Return the process-wide output writer, starting its thread on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                if output_fsync not in _FSYNC_POLICIES:
+                    throw_mcp_error(
+                        f"DAISYS_OUTPUT_FSYNC must be one of {_FSYNC_POLICIES}."
+                    )
+                _writer = OutputWriter(output_fsync, output_max_queued)
+                atexit.register(_writer.close)
+    return _writer
+
+
+async def wait_for(future: Future) -> Path:
+    """Wait for a queued write on the event loop, without holding a worker thread."""
+    if not future.done():
+        event = anyio.Event()
+        token = anyio.lowlevel.current_token()
+        loop_thread = threading.get_ident()
+
+        def wake(_):
+            if threading.get_ident() == loop_thread:
+                # it finished before the callback was added
+                event.set()
+            else:
+                anyio.from_thread.run_sync(event.set, token=token)
+
+        future.add_done_callback(wake)
+        await event.wait()
+    return future.result()
+
+
+async def _queue(method, *args) -> Path:
+    future = method(*args, block=False)
+    if future is None:
+        # the writer is behind, wait for room off the event loop
+        future = await run_blocking(method, *args)
+    return await wait_for(future)
+
+
+async def save_output(
+    data: AudioData, output_path: Path, text: str, extension: str
+) -> Path:
+    """Save audio in ``output_path`` through the output writer; returns its path."""
+    return await _queue(get_output_writer().write, output_path, text, extension, data)
+
+
+async def finish_output(
+    part: Path, output_path: Path, text: str, extension: str
+) -> Path:
+    """Name a file streamed into ``part`` through the output writer; returns its path."""
+    return await _queue(get_output_writer().finish, part, output_path, text, extension)
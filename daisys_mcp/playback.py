@@ -0,0 +1,277 @@
+import io
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+from daisys_mcp.metrics import observe_stage, timed
+
+# Size of the ring buffer an utterance starts with; it grows when synthesis
+# runs ahead of playback (about 24 seconds of 22050 Hz mono audio).
+initial_buffer_bytes = 1024 * 1024
+
+# What the fill function tells the stream to do after a block
+CONTINUE, STOP, ABORT = "continue", "stop", "abort"
+
+
+class PcmRingBuffer:
+    """
+    Byte ring buffer between a producer thread and an audio callback.
+
+    Writes never block: when the producer runs ahead of playback the buffer
+    grows instead, so network receipt is never held up by the audio device.
+    """
+
+    def __init__(self, capacity: int = initial_buffer_bytes):
+        self._buffer = bytearray(max(capacity, 2))
+        self._read = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        with self._lock:
+            if self._size + len(data) > len(self._buffer):
+                self._grow(self._size + len(data))
+            capacity = len(self._buffer)
+            start = (self._read + self._size) % capacity
+            first = min(len(data), capacity - start)
+            self._buffer[start : start + first] = data[:first]
+            self._buffer[: len(data) - first] = data[first:]
+            self._size += len(data)
+
+    def _grow(self, needed: int):
+        capacity = len(self._buffer)
+        buffer = bytearray(max(needed, 2 * capacity))
+        first = min(self._size, capacity - self._read)
+        buffer[:first] = self._buffer[self._read : self._read + first]
+        buffer[first : self._size] = self._buffer[: self._size - first]
+        self._buffer = buffer
+        self._read = 0
+
+    def read_into(self, out) -> int:
+        """Move up to ``len(out)`` bytes into ``out`` and return how many were moved."""
+        out = memoryview(out).cast("B")
+        with self._lock:
+            n = min(len(out), self._size)
+            capacity = len(self._buffer)
+            first = min(n, capacity - self._read)
+            out[:first] = self._buffer[self._read : self._read + first]
+            out[first:n] = self._buffer[: n - first]
+            self._read = (self._read + n) % capacity
+            self._size -= n
+            return n
+
+    def clear(self):
+        with self._lock:
+            self._read = 0
+            self._size = 0
+
+
+class Utterance:
+    """
+    One queued piece of 16 bit PCM audio.
+
+    The synthesis side ``write``\\s chunks as they arrive and calls ``finish``
+    when there are no more; playback may start before that.
+    """
+
+    def __init__(
+        self, utterance_id: int, label: str, sample_rate: int, channels: int = 1
+    ):
+        self.utterance_id = utterance_id
+        self.label = label
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.buffer = PcmRingBuffer()
+        self.state = "queued"  # queued, playing, done, cancelled or failed
+        self.complete = False
+        self.cancelled = False
+        self.done = threading.Event()
+        self.created = time.perf_counter()
+
+    def write(self, pcm):
+        if not self.cancelled:
+            self.buffer.write(pcm)
+
+    def finish(self):
+        """No more audio will be written."""
+        self.complete = True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the utterance has played or was cancelled."""
+        return self.done.wait(timeout)
+
+    def describe(self) -> dict:
+        return {
+            "utterance_id": self.utterance_id,
+            "label": self.label,
+            "state": self.state,
+            "buffered_seconds": round(
+                len(self.buffer) / (2 * self.channels * self.sample_rate), 2
+            ),
+        }
+
+
+def _open_sounddevice_stream(utterance: Utterance, fill, finished_callback):
+    """Open a PortAudio output stream that asks ``fill`` for every block of audio."""
+    # PortAudio is only loaded once audio is actually played
+    import sounddevice as sd  # type: ignore
+
+    def callback(outdata, frames, time_info, status):
+        action = fill(outdata)
+        if action == STOP:
+            raise sd.CallbackStop()
+        if action == ABORT:
+            raise sd.CallbackAbort()
+
+    return sd.RawOutputStream(
+        samplerate=utterance.sample_rate,
+        channels=utterance.channels,
+        dtype="int16",
+        callback=callback,
+        finished_callback=finished_callback,
+    )
+
+
+class PlaybackEngine:
+    """
+    Plays queued utterances one after another on a background thread.
+
+    Synthesis only writes into an utterance's ring buffer, which never
+    blocks; a PortAudio callback drains it. Tools therefore return as soon
+    as their audio is generated, and the queue can be inspected, skipped,
+    cancelled or stopped while it plays.
+    """
+
+    def __init__(self, open_stream: Optional[Callable] = None):
+        self._open_stream = open_stream or _open_sounddevice_stream
+        self._queue: Deque[Utterance] = deque()
+        self._current: Optional[Utterance] = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, label: str, sample_rate: int, channels: int = 1) -> Utterance:
+        """Queue a new utterance, to be filled by the caller."""
+        utterance = Utterance(next(self._ids), label[:60], sample_rate, channels)
+        with self._lock:
+            self._queue.append(utterance)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="daisys-playback", daemon=True
+                )
+                self._thread.start()
+            self._lock.notify_all()
+        return utterance
+
+    def play(self, audio: bytes, label: str = "") -> Utterance:
+        """Decode an encoded audio file (wav or mp3) and queue it."""
+        import soundfile as sf  # type: ignore
+
+        data, sample_rate = sf.read(io.BytesIO(audio), dtype="int16", always_2d=True)
+        utterance = self.enqueue(label, sample_rate, data.shape[1])
+        utterance.write(data)
+        utterance.finish()
+        return utterance
+
+    def queue(self) -> List[dict]:
+        """The playing utterance followed by the queued ones."""
+        with self._lock:
+            utterances = ([self._current] if self._current else []) + list(self._queue)
+            return [utterance.describe() for utterance in utterances]
+
+    def skip(self) -> Optional[Utterance]:
+        """Stop the playing utterance and continue with the next one."""
+        with self._lock:
+            current = self._current
+        if current is not None:
+            self._cancel(current)
+        return current
+
+    def cancel(self, utterance_id: int) -> Optional[Utterance]:
+        """Remove an utterance from the queue, or stop it if it is playing."""
+        with self._lock:
+            for utterance in [self._current, *self._queue]:
+                if utterance is not None and utterance.utterance_id == utterance_id:
+                    self._cancel(utterance)
+                    return utterance
+        return None
+
+    def stop(self) -> int:
+        """Stop playback and clear the queue; returns the number of utterances dropped."""
+        with self._lock:
+            utterances = ([self._current] if self._current else []) + list(self._queue)
+            for utterance in utterances:
+                self._cancel(utterance)
+            return len(utterances)
+
+    def _cancel(self, utterance: Utterance):
+        with self._lock:
+            utterance.cancelled = True
+            utterance.buffer.clear()
+            if utterance in self._queue:
+                self._queue.remove(utterance)
+                utterance.state = "cancelled"
+                utterance.done.set()
+            self._lock.notify_all()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._lock.wait()
+                utterance = self._current = self._queue.popleft()
+                utterance.state = "playing"
+            observe_stage("playback_wait", time.perf_counter() - utterance.created)
+            try:
+                with timed("playback"):
+                    self._play(utterance)
+                utterance.state = "cancelled" if utterance.cancelled else "done"
+            except Exception:
+                # e.g. no audio device; drop the audio still being written
+                utterance.state = "failed"
+                utterance.cancelled = True
+                utterance.buffer.clear()
+            finally:
+                with self._lock:
+                    self._current = None
+                utterance.done.set()
+
+    def _play(self, utterance: Utterance):
+        finished = threading.Event()
+
+        def fill(outdata) -> str:
+            if utterance.cancelled:
+                return ABORT
+            n = utterance.buffer.read_into(outdata)
+            if n < len(outdata):
+                # not generated yet, or the end: play silence
+                outdata[n:] = b"\x00" * (len(outdata) - n)
+                if utterance.complete and not len(utterance.buffer):
+                    return STOP
+            return CONTINUE
+
+        stream = self._open_stream(utterance, fill, finished.set)
+        with stream:
+            while not finished.wait(0.1):
+                if utterance.cancelled:
+                    break
+
+
+_engine: Optional[PlaybackEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_playback_engine() -> PlaybackEngine:
+    """Return the process-wide playback engine."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PlaybackEngine()
+    return _engine
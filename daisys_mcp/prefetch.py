@@ -0,0 +1,204 @@
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from daisys_mcp.cache import SynthesisCache, get_synthesis_cache
+from daisys_mcp.concurrency import ActivityCounter, foreground_synthesis
+from daisys_mcp.scheduler import scheduling
+
+# Number of prefetch takes generating at the same time, apart from the
+# budget of text_to_speech and friends.
+prefetch_concurrency = int(os.getenv("DAISYS_PREFETCH_CONCURRENCY", "2"))
+# Texts waiting to be prefetched; further ones are refused.
+prefetch_max_queued = int(os.getenv("DAISYS_PREFETCH_MAX_QUEUED", "64"))
+
+
+class PrefetchJob:
+    """Background synthesis of one text, stored in the cache under ``key``."""
+
+    def __init__(self, key: str, generate: Callable[[], bytes]):
+        self.key = key
+        self.generate = generate
+        self.state = "queued"  # queued, running, done, failed or cancelled
+        self.result: Optional[bytes] = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+        # the client that asked for it, for the scheduler
+        self.context = contextvars.copy_context()
+        self._callbacks: List[Callable[[], None]] = []
+        self._callbacks_lock = threading.Lock()
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        """Call ``callback`` once the job is over; right away when it already is."""
+        with self._callbacks_lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def finish(self):
+        with self._callbacks_lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class Prefetcher:
+    """
+    Low priority background synthesis into the synthesis cache.
+
+    Jobs run on their own worker threads, so they never take a slot of the
+    synthesis limiter. A worker only starts a job while no foreground
+    synthesis is running; takes that already started are finished.
+    ``join`` lets a real request for the same audio wait for a running job
+    instead of generating it a second time, or take over a queued one.
+    """
+
+    def __init__(
+        self,
+        cache: SynthesisCache,
+        workers: int = 2,
+        max_queued: int = 64,
+        foreground: ActivityCounter = foreground_synthesis,
+    ):
+        self.cache = cache
+        self.workers = max(workers, 1)
+        self.max_queued = max_queued
+        self._foreground = foreground
+        self._lock = threading.Condition()
+        self._queued: "OrderedDict[str, PrefetchJob]" = OrderedDict()
+        self._running: dict[str, PrefetchJob] = {}
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, job: PrefetchJob) -> str:
+        """Queue a job; returns "queued", "in_progress" (same key already queued or running) or "full"."""
+        with self._lock:
+            if job.key in self._queued or job.key in self._running:
+                return "in_progress"
+            if len(self._queued) >= self.max_queued:
+                return "full"
+            self._queued[job.key] = job
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work, name="daisys-prefetch", daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+            self._lock.notify()
+            return "queued"
+
+    def join(self, key: str, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        The audio of a prefetch of ``key``, waiting for it if it is being generated.
+
+        A job that is still queued is dropped: the caller generates the audio
+        itself, right away. Returns None when there is no (successful) job.
+        """
+        job = self._claim(key)
+        if job is None or not job.done.wait(timeout):
+            return None
+        return job.result
+
+    async def join_async(
+        self, key: str, timeout: Optional[float] = None
+    ) -> Optional[bytes]:
+        """``join`` on the event loop, without holding a worker thread while it waits."""
+        import anyio  # type: ignore
+
+        job = self._claim(key)
+        if job is None:
+            return None
+        event = anyio.Event()
+        token = anyio.lowlevel.current_token()
+        loop_thread = threading.get_ident()
+
+        def wake():
+            if threading.get_ident() == loop_thread:
+                # it finished before the callback was added
+                event.set()
+                return
+            try:
+                anyio.from_thread.run_sync(event.set, token=token)
+            except RuntimeError:
+                pass  # the loop is gone, after the wait timed out
+
+        job.add_done_callback(wake)
+        with anyio.move_on_after(timeout):
+            await event.wait()
+        return job.result if job.done.is_set() else None
+
+    def _claim(self, key: str) -> Optional[PrefetchJob]:
+        """The running job of ``key``; a queued one is dropped for the caller to take over."""
+        with self._lock:
+            job = self._queued.pop(key, None)
+            if job is not None:
+                job.state = "cancelled"
+                job.finish()
+                return None
+            return self._running.get(key)
+
+    def cancel(self) -> int:
+        """Drop all queued jobs; returns how many were dropped."""
+        with self._lock:
+            jobs = list(self._queued.values())
+            self._queued.clear()
+        for job in jobs:
+            job.state = "cancelled"
+            job.finish()
+        return len(jobs)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"queued": len(self._queued), "running": len(self._running)}
+
+    def _work(self):
+        while True:
+            # yield to synthesis for clients, then take the oldest job
+            self._foreground.wait_idle()
+            with self._lock:
+                while not self._queued:
+                    self._lock.wait()
+                if self._foreground.active:
+                    continue
+                _, job = self._queued.popitem(last=False)
+                job.state = "running"
+                self._running[job.key] = job
+            try:
+                job.result = job.context.run(_generate, job)
+                self.cache.put(job.key, job.result)
+                job.state = "done"
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+                job.state = "failed"
+            finally:
+                with self._lock:
+                    self._running.pop(job.key, None)
+                job.finish()
+
+
+def _generate(job: PrefetchJob) -> bytes:
+    # takes of clients waiting for them go first
+    with scheduling(priority="prefetch"):
+        return job.generate()
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Optional[Prefetcher]:
+    """Return the process-wide prefetcher, or None when the synthesis cache is disabled."""
+    global _prefetcher
+    if _prefetcher is None:
+        cache = get_synthesis_cache()
+        if cache is None:
+            return None
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher(
+                    cache, prefetch_concurrency, prefetch_max_queued
+                )
+    return _prefetcher
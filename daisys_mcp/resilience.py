@@ -0,0 +1,247 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from daisys_mcp.metrics import registry, stage_seconds
+from daisys_mcp.utils import DaisysMcpConnectionError, DaisysMcpError
+
+# Attempts of an upstream call failing with a transient error, the first included.
+retry_attempts = int(os.getenv("DAISYS_RETRY_ATTEMPTS", "3"))
+# Backoff before the first retry, doubled for every next one (with full jitter).
+retry_backoff = float(os.getenv("DAISYS_RETRY_BACKOFF_SECONDS", "0.25"))
+retry_max_backoff = float(os.getenv("DAISYS_RETRY_MAX_BACKOFF_SECONDS", "4"))
+# Consecutive transient failures that open the circuit of an endpoint, and the
+# seconds it stays open before one trial call is let through.
+circuit_failure_threshold = int(os.getenv("DAISYS_CIRCUIT_FAILURE_THRESHOLD", "5"))
+circuit_reset_seconds = float(os.getenv("DAISYS_CIRCUIT_RESET_SECONDS", "30"))
+# Submit a websocket take again when its connection is lost before any audio
+# arrived. Off by default: the take may already have been accepted upstream,
+# and would then be generated (and billed) twice.
+resubmit_lost_takes = os.getenv("DAISYS_RESUBMIT_LOST_TAKES", "false").lower() == "true"
+# Generate a failed or unavailable websocket take over HTTP instead.
+http_fallback = os.getenv("DAISYS_HTTP_FALLBACK", "true").lower() == "true"
+# Submit a duplicate take when the first chunk takes longer than this quantile
+# (e.g. 0.95) of the first chunk latencies seen so far; 0 is off. Hedged takes
+# are billed twice.
+hedge_quantile = float(os.getenv("DAISYS_HEDGE_QUANTILE", "0"))
+# First chunk latencies to observe before takes are hedged.
+hedge_min_samples = 20
+
+T = TypeVar("T")
+
+# HTTP statuses worth sending the same request again for.
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# HTTP statuses of requests the server refused before doing anything.
+UNPROCESSED_STATUS_CODES = {429, 503}
+
+retries_total = registry.counter(
+    "daisys_retries_total", "Upstream calls sent again after a transient error."
+)
+fallbacks_total = registry.counter(
+    "daisys_fallbacks_total", "Websocket takes generated over HTTP instead."
+)
+hedges_total = registry.counter(
+    "daisys_hedges_total",
+    "Duplicate takes sent for slow first chunks, and how many streamed first.",
+)
+
+
+class CircuitOpenError(DaisysMcpError):
+    """An endpoint failed too often recently, calls to it are refused for now."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether ``error`` is a blip that sending the same request again may not hit.
+
+    Broken connections, network errors and overloaded servers (429, 5xx) are
+    transient. Rejected takes, bad credentials and timeouts are not; a timed
+    out take has used up its deadline.
+    """
+    import httpx  # type: ignore
+    from daisys.v1.speak import (  # type: ignore
+        DaisysWebsocketConnectError,
+        DaisysWebsocketStreamError,
+    )
+
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in TRANSIENT_STATUS_CODES
+    transient: tuple = (
+        DaisysMcpConnectionError,
+        DaisysWebsocketConnectError,
+        DaisysWebsocketStreamError,
+        httpx.TransportError,
+        ConnectionError,
+    )
+    try:
+        from httpx_ws import WebSocketDisconnect, WebSocketNetworkError  # type: ignore
+
+        transient += (WebSocketDisconnect, WebSocketNetworkError)
+    except ModuleNotFoundError:
+        pass
+    return isinstance(error, transient)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry ``attempt`` (0 is the first retry)."""
+    return random.uniform(0, min(retry_max_backoff, retry_backoff * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Refuses calls to an endpoint that keeps failing, instead of queueing on it.
+
+    ``failure_threshold`` consecutive transient failures open the circuit;
+    after ``reset_seconds`` it is half-open and a single trial call is let
+    through, which closes it again on success or reopens it on failure.
+    Errors that are not transient (a rejected take) say nothing about the
+    endpoint and do not count.
+    """
+
+    def __init__(
+        self, name: str, failure_threshold: int = 5, reset_seconds: float = 30
+    ):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half_open"."""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now; in half-open state only the trial call."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    def check(self):
+        """Raise ``CircuitOpenError`` unless a call may be sent now."""
+        if not self.allow():
+            raise CircuitOpenError(
+                f"The {self.name} endpoint of the Daisys API is failing, "
+                f"calls are paused for up to {self.reset_seconds:g} seconds."
+            )
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """Return the circuit breaker of an endpoint ("websocket", "http", "catalog")."""
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(
+                endpoint, circuit_failure_threshold, circuit_reset_seconds
+            )
+        return breaker
+
+
+def breaker_states() -> Dict[str, str]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.state for breaker in breakers}
+
+
+def is_unprocessed(error: BaseException) -> bool:
+    """
+    Whether a request failed before the server could have acted on it.
+
+    Only such failures may be retried for a request that is not idempotent,
+    like generating a take: a connection that was never made, or a server
+    that refused the request (429, 503). A response that was lost after the
+    request was sent may belong to a take that is generating.
+    """
+    import httpx  # type: ignore
+
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in UNPROCESSED_STATUS_CODES
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+
+
+def call_with_retry(
+    endpoint: str,
+    func: Callable[..., T],
+    *args: Any,
+    retryable: Optional[Callable[[BaseException], bool]] = None,
+    **kwargs: Any,
+) -> T:
+    """
+    Call ``func`` through the circuit breaker of ``endpoint``, retrying transient errors.
+
+    Up to ``retry_attempts`` calls are made, with jittered exponential backoff
+    in between. ``retryable`` can veto a retry, e.g. once audio of a failed
+    take was already handed on.
+    """
+    breaker = get_breaker(endpoint)
+    attempt = 0
+    while True:
+        breaker.check()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e):
+                # the endpoint answered, it is up
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            if attempt >= retry_attempts or (retryable and not retryable(e)):
+                raise
+            retries_total.inc(endpoint=endpoint)
+            time.sleep(backoff_delay(attempt - 1))
+            continue
+        breaker.record_success()
+        return result
+
+
+def can_fall_back(error: BaseException, audio_format: str) -> bool:
+    """Whether a websocket take that failed with ``error`` can be generated over HTTP."""
+    # the http api has no opus
+    if not http_fallback or audio_format == "opus":
+        return False
+    return isinstance(error, CircuitOpenError) or is_transient(error)
+
+
+def hedge_delay() -> Optional[float]:
+    """Seconds to wait for a first chunk before hedging a take, None when off."""
+    if hedge_quantile <= 0:
+        return None
+    if stage_seconds.count(stage="first_chunk") < hedge_min_samples:
+        return None
+    return stage_seconds.quantile(hedge_quantile, stage="first_chunk")
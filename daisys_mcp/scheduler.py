@@ -0,0 +1,230 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from daisys_mcp.metrics import observe_stage, registry
+from daisys_mcp.utils import throw_mcp_error
+
+# Takes and characters that may be sent to the API per second; 0 is unlimited.
+rate_limit_requests = float(os.getenv("DAISYS_RATE_LIMIT_REQUESTS_PER_SECOND", "0"))
+rate_limit_characters = float(os.getenv("DAISYS_RATE_LIMIT_CHARS_PER_SECOND", "0"))
+# Seconds of unused rate that may be spent at once after a quiet period.
+rate_limit_burst_seconds = float(os.getenv("DAISYS_RATE_LIMIT_BURST_SECONDS", "1"))
+
+# Lower is served first.
+PRIORITIES = ["interactive", "batch", "prefetch"]
+
+# Clients to remember when they were last served, for fair queuing.
+_max_clients = 1024
+
+scheduled_total = registry.counter(
+    "daisys_scheduled_total", "Takes let through by the scheduler, by priority."
+)
+
+_priority: ContextVar[str] = ContextVar("daisys_priority", default="interactive")
+_client: ContextVar[Any] = ContextVar("daisys_client", default=None)
+
+
+class TokenBucket:
+    """
+    ``rate`` tokens per second, up to ``capacity``; a rate of 0 is unlimited.
+
+    A request larger than the capacity is let through once the bucket is
+    full and leaves it in debt, so it is delayed rather than refused and
+    the requests after it pay for it.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens can be taken."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float):
+        if self.rate > 0:
+            self.tokens -= amount
+
+
+class _Ticket:
+    def __init__(self, sequence: int, characters: int, priority: str, client: Any):
+        self.sequence = sequence
+        self.characters = characters
+        self.priority = PRIORITIES.index(priority)
+        self.client = id(client) if client is not None else None
+
+
+class Scheduler:
+    """
+    Lets takes through to the API within a rate of requests and characters.
+
+    Takes wait in one queue. The highest priority class goes first; within
+    a class the clients take turns, the one served longest ago first, and
+    the takes of one client go in the order they came in. So a client
+    generating a long list cannot hold up another client's single take,
+    and prefetching only uses the rate that clients leave unused.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = 0,
+        characters_per_second: float = 0,
+        burst_seconds: float = 1,
+    ):
+        burst = max(burst_seconds, 0)
+        self._requests = TokenBucket(requests_per_second, requests_per_second * burst)
+        self._characters = TokenBucket(
+            characters_per_second, characters_per_second * burst
+        )
+        self._lock = threading.Condition()
+        self._waiting: List[_Ticket] = []
+        self._served: "OrderedDict[Any, int]" = OrderedDict()
+        self._sequence = itertools.count()
+
+    def acquire(
+        self, characters: int, priority: str = "interactive", client: Any = None
+    ) -> float:
+        """Wait for the turn of a take of ``characters``; returns the seconds waited."""
+        start = time.monotonic()
+        ticket = _Ticket(next(self._sequence), characters, priority, client)
+        with self._lock:
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    delay = self._delay(ticket)
+                    if delay == 0:
+                        break
+                    self._lock.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                self._lock.notify_all()
+        return time.monotonic() - start
+
+    def try_acquire(
+        self, characters: int, priority: str = "interactive", client: Any = None
+    ) -> bool:
+        """Take the turn of a take right away if it is free, without waiting."""
+        ticket = _Ticket(next(self._sequence), characters, priority, client)
+        with self._lock:
+            self._waiting.append(ticket)
+            try:
+                return self._delay(ticket) == 0
+            finally:
+                self._waiting.remove(ticket)
+
+    def _delay(self, ticket: _Ticket) -> Optional[float]:
+        """0 when ``ticket`` was let through, else how long to wait (None: until notified)."""
+        if self._next() is not ticket:
+            return None
+        now = time.monotonic()
+        delay = max(
+            self._requests.delay(1, now),
+            self._characters.delay(ticket.characters, now),
+        )
+        if delay > 0:
+            return delay
+        self._requests.take(1)
+        self._characters.take(ticket.characters)
+        self._served[ticket.client] = ticket.sequence
+        self._served.move_to_end(ticket.client)
+        if len(self._served) > _max_clients:
+            self._served.popitem(last=False)
+        scheduled_total.inc(priority=PRIORITIES[ticket.priority])
+        return 0
+
+    def _next(self) -> Optional[_Ticket]:
+        if not self._waiting:
+            return None
+        priority = min(ticket.priority for ticket in self._waiting)
+        # the oldest take of every client in the highest priority class
+        heads: Dict[Any, _Ticket] = {}
+        for ticket in self._waiting:
+            if ticket.priority == priority:
+                heads.setdefault(ticket.client, ticket)
+        return min(
+            heads.values(),
+            key=lambda ticket: (self._served.get(ticket.client, -1), ticket.sequence),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Takes waiting for their turn, per priority."""
+        with self._lock:
+            waiting = [ticket.priority for ticket in self._waiting]
+        return {name: waiting.count(i) for i, name in enumerate(PRIORITIES)}
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """Return the process-wide scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler(
+                    rate_limit_requests,
+                    rate_limit_characters,
+                    rate_limit_burst_seconds,
+                )
+    return _scheduler
+
+
+@contextmanager
+def scheduling(priority: Optional[str] = None, client: Any = None) -> Iterator[None]:
+    """
+    Schedule the takes generated in the block with ``priority``, for ``client``.
+
+    Both are kept in context variables, so they follow the work into
+    ``run_blocking`` threads; unset ones keep the value of the outer block.
+    """
+    if priority is not None and priority not in PRIORITIES:
+        throw_mcp_error(f"priority must be one of {PRIORITIES}, got {priority}.")
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if client is not None:
+        tokens.append((_client, _client.set(client)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def set_priority(priority: str):
+    """Schedule the rest of the current tool call with ``priority``; see ``scheduling``."""
+    if priority not in PRIORITIES:
+        throw_mcp_error(f"priority must be one of {PRIORITIES}, got {priority}.")
+    _priority.set(priority)
+
+
+def acquire(characters: int):
+    """Wait for the turn of a take of the current priority and client (see ``scheduling``)."""
+    priority = _priority.get()
+    waited = get_scheduler().acquire(characters, priority, _client.get())
+    observe_stage("scheduler_wait", waited)
+
+
+def try_acquire(characters: int) -> bool:
+    """``acquire`` without waiting; False when the take has to wait for its turn."""
+    return get_scheduler().try_acquire(characters, _priority.get(), _client.get())
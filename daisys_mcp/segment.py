@@ -0,0 +1,162 @@
+import contextvars
+import io
+import os
+import re
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional
+
+from daisys_mcp.audio import SpillingWavSink
+from daisys_mcp.cache import get_synthesis_cache, make_cache_key
+
+# Texts longer than this are split and their segments generated in parallel.
+segment_threshold = int(os.getenv("DAISYS_SEGMENT_THRESHOLD", "600"))
+segment_max_chars = int(os.getenv("DAISYS_SEGMENT_MAX_CHARS", "400"))
+segment_parallelism = int(os.getenv("DAISYS_SEGMENT_PARALLELISM", "4"))
+segment_silence_ms = int(os.getenv("DAISYS_SEGMENT_SILENCE_MS", "0"))
+segment_crossfade_ms = int(os.getenv("DAISYS_SEGMENT_CROSSFADE_MS", "0"))
+
+_paragraphs = re.compile(r"\n\s*\n")
+_sentences = re.compile(r"(?<=[.!?…;:])\s+")
+_clauses = re.compile(r"(?<=[,])\s+")
+
+
+def _pack(pieces: List[str], max_chars: int, separator: str = " ") -> List[str]:
+    """Greedily join consecutive pieces into chunks of at most ``max_chars``."""
+    packed: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(separator) + len(piece) > max_chars:
+            packed.append(current)
+            current = piece
+        else:
+            current = f"{current}{separator}{piece}" if current else piece
+    if current:
+        packed.append(current)
+    return packed
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces = []
+    for clause in _clauses.split(sentence):
+        if len(clause) <= max_chars:
+            pieces.append(clause)
+        else:
+            pieces.extend(_pack(clause.split(), max_chars))
+    return _pack(pieces, max_chars)
+
+
+def split_text(text: str, max_chars: int = 400) -> List[str]:
+    """
+    Split text into segments of at most ``max_chars`` characters.
+
+    Segments never cross a paragraph boundary and are cut between sentences
+    where possible; a sentence that is too long on its own is cut between
+    clauses or, as a last resort, between words.
+    """
+    segments = []
+    for paragraph in _paragraphs.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        sentences = []
+        for sentence in _sentences.split(paragraph):
+            sentences.extend(_split_long(sentence, max_chars))
+        segments.extend(_pack(sentences, max_chars))
+    return segments
+
+
+def _read_wav(audio: bytes):
+    with wave.open(io.BytesIO(audio), "rb") as wav_file:
+        return wav_file.getframerate(), wav_file.readframes(wav_file.getnframes())
+
+
+def join_segments(
+    segments: List[bytes], silence_ms: int = 0, crossfade_ms: int = 0
+) -> memoryview:
+    """
+    Concatenate the WAV files of consecutive segments into one WAV file.
+
+    Segments are either separated by ``silence_ms`` of silence or overlapped
+    by ``crossfade_ms`` with a linear crossfade. A long result is written to
+    a temporary file instead of memory, see ``SpillingWavSink``.
+    """
+    import numpy as np  # type: ignore
+
+    sample_rate = 22050
+    parts = []
+    for audio in segments:
+        sample_rate, pcm = _read_wav(audio)
+        parts.append(np.frombuffer(pcm, dtype=np.int16))
+
+    fade = int(sample_rate * crossfade_ms / 1000)
+    silence = np.zeros(int(sample_rate * silence_ms / 1000), dtype=np.int16)
+    pieces = []
+    tail = None
+    for part in parts:
+        if tail is None:
+            tail = part
+        elif fade and not len(silence):
+            overlap = min(fade, len(tail), len(part))
+            ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+            mixed = tail[len(tail) - overlap :] * (1 - ramp) + part[:overlap] * ramp
+            pieces.extend([tail[: len(tail) - overlap], mixed.astype(np.int16)])
+            tail = part[overlap:]
+        else:
+            pieces.extend([tail, silence])
+            tail = part
+    if tail is not None:
+        pieces.append(tail)
+
+    sink = SpillingWavSink(sample_rate, capacity=sum(p.nbytes for p in pieces))
+    for piece in pieces:
+        sink.write(piece.astype("<i2", copy=False))
+    sink.close()
+    return sink.getbuffer()
+
+
+def synthesize_segmented(
+    text: str,
+    voice_id: str,
+    synthesize: Callable[[str], bytes],
+    protocol: str,
+    prosody: Optional[str] = None,
+    on_segment: Optional[Callable[[int, int], None]] = None,
+) -> memoryview:
+    """
+    Generate a long text as parallel takes and reassemble the audio in order.
+
+    ``synthesize`` turns one segment into a WAV file. Finished segments are
+    kept in the synthesis cache, so when a text is generated again only the
+    segments that changed (or failed last time) are sent to the API.
+    ``on_segment`` is called with (segments done, total segments).
+    """
+    segments = split_text(text, segment_max_chars)
+    cache = get_synthesis_cache()
+
+    def run(segment: str) -> bytes:
+        key = make_cache_key(segment, voice_id, prosody, "wav", f"{protocol}-segment")
+        audio = cache.get(key) if cache else None
+        if audio is None:
+            # transient failures are retried by synthesize (see call_with_retry)
+            audio = synthesize(segment)
+            if cache:
+                cache.put(key, audio)
+        return audio
+
+    with ThreadPoolExecutor(max_workers=max(segment_parallelism, 1)) as executor:
+        # every segment is scheduled with the priority and client of the text
+        futures = [
+            executor.submit(contextvars.copy_context().run, run, segment)
+            for segment in segments
+        ]
+        # report from the calling thread, on_segment may need to reach the
+        # event loop and only the worker thread running this function can
+        for done, _ in enumerate(as_completed(futures), start=1):
+            if on_segment:
+                on_segment(done, len(segments))
+        results = [future.result() for future in futures]
+
+    return join_segments(results, segment_silence_ms, segment_crossfade_ms)
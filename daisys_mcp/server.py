@@ -1,19 +1,57 @@
+import argparse
+import functools
 import os
-from daisys import DaisysAPI  # type: ignore
+import subprocess
+import sys
+from pathlib import Path
 
 # from daisys.v1.speak.models import ProsodyFeaturesUnion, ProsodyType
-from mcp.server.fastmcp import FastMCP  # type: ignore
+from mcp.server.fastmcp import Context, FastMCP  # type: ignore
 from mcp.types import TextContent
 from typing import Literal
 
-from daisys_mcp.model import McpVoice, McpModel, VoiceGender
-from daisys_mcp.websocket_tts import text_to_speech_websocket
-from daisys_mcp.http_tts import text_to_speech_http
-from daisys_mcp.utils import throw_mcp_error, make_output_file, make_output_path
-
-from dotenv import load_dotenv  # type: ignore
-
-load_dotenv()
+from daisys_mcp.model import McpBatchItem, McpPrefetchResult, McpVoice, VoiceGender
+from daisys_mcp.websocket_tts import take_deadline, text_to_speech_websocket
+from daisys_mcp.http_tts import text_to_speech_http, default_prosody, play_audio
+from daisys_mcp.cache import get_synthesis_cache, make_cache_key
+from daisys_mcp.session import speak_client
+from daisys_mcp.concurrency import (
+    SingleFlight,
+    client_slot,
+    limiter_stats,
+    run_blocking,
+    run_async_from_thread,
+)
+from daisys_mcp.audio import ENCODED_FORMATS, resample_audio
+from daisys_mcp.catalog import voice_catalog, model_catalog, latest_voice_id
+from daisys_mcp.segment import segment_threshold, synthesize_segmented
+from daisys_mcp.batch import synthesize_batch
+from daisys_mcp.metrics import (
+    metrics_host,
+    metrics_port,
+    registry,
+    start_metrics_server,
+    track_tool,
+)
+from daisys_mcp.playback import get_playback_engine
+from daisys_mcp.output import finish_output, open_part_sink, save_output
+from daisys_mcp.prefetch import PrefetchJob, get_prefetcher
+from daisys_mcp.resilience import breaker_states, can_fall_back, fallbacks_total
+from daisys_mcp.scheduler import get_scheduler, scheduling, set_priority
+from daisys_mcp.takes import (
+    DOWNLOAD_FORMATS,
+    download_take,
+    get_take_index,
+    make_take_key,
+    remember_file,
+)
+from daisys_mcp.websocket_pool import get_websocket_pool
+from daisys_mcp.utils import (
+    DaisysMcpError,
+    DaisysMcpTimeoutError,
+    throw_mcp_error,
+    make_output_path,
+)
 
 # Initialize FastMCP server
 mcp = FastMCP("Daisys-mcp-server")
@@ -24,9 +62,318 @@ if not email or not password:
     throw_mcp_error("DAISYS_EMAIL, DAISYS_PASSWORD environment variable is required")
 
 storage_path = os.environ.get("DAISYS_BASE_STORAGE_PATH")
+disable_audio_playback = os.getenv("DISABLE_AUDIO_PLAYBACK", "false").lower() == "true"
+synthesis_flights = SingleFlight()
+
+
+transport = os.getenv("DAISYS_MCP_TRANSPORT", "stdio")
+host = os.getenv("DAISYS_MCP_HOST", "127.0.0.1")
+port = int(os.getenv("DAISYS_MCP_PORT", "8000"))
+
+
+def _client_session():
+    """The MCP session of the client whose request is being handled, if any."""
+    try:
+        request_context = mcp.get_context().request_context
+    except (ValueError, LookupError):
+        # called directly, outside of an MCP request
+        return None
+    return request_context.session
+
+
+def tool(name: str, description: str, synthesis: bool = False):
+    """
+    ``mcp.tool`` that also records the calls of the tool in the metrics.
+
+    Takes of a call are scheduled for its client, see ``scheduling``. Calls
+    of ``synthesis`` tools wait for a slot of their client first, see
+    ``client_slot``; metadata and control tools (voices, metrics, stopping
+    playback, ...) are never held up behind a client's own generations.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def limited(*args, **kwargs):
+            client = _client_session()
+            async with client_slot(client if synthesis else None):
+                with scheduling(priority="interactive", client=client):
+                    return await func(*args, **kwargs)
+
+        return mcp.tool(name, description=description)(track_tool(name)(limited))
+
+    return decorator
+
 
+async def _save_audio(
+    audiobuffer: bytes, text: str, output_dir: str | None, audio_format: str
+) -> Path:
+    """Save audio through the output writer, without blocking on the disk."""
+    output_path = await run_blocking(make_output_path, output_dir, storage_path)
+    return await save_output(audiobuffer, output_path, text, audio_format)
+
+
+def _progress_reporter(ctx: Context | None):
+    """Send an MCP progress notification for every received audio chunk."""
+    if ctx is None:
+        return None
+
+    def report(bytes_received: int):
+        try:
+            run_async_from_thread(ctx.report_progress, bytes_received)
+        except Exception:
+            pass
+
+    return report
+
+
+async def _stream_to_file(
+    text: str,
+    voice_id: str,
+    output_dir: str | None,
+    cache_key: str,
+    ctx: Context | None,
+    audio_format: str = "wav",
+    sample_rate: int | None = None,
+):
+    """Synthesize over the websocket, writing (and encoding) each chunk to the output file."""
+    output_path = await run_blocking(make_output_path, output_dir, storage_path)
+
+    # streamed into a hidden file, named after its content once complete
+    part, sink = await run_blocking(
+        open_part_sink, output_path, audio_format, sample_rate
+    )
+    if ctx is not None:
+        # the file can be read while it grows, under this name
+        await ctx.info(
+            f"Streaming audio to {part}; it is renamed in {output_path} once complete."
+        )
+    try:
+        await run_blocking(
+            text_to_speech_websocket,
+            text,
+            voice_id,
+            sink=sink,
+            on_chunk=_progress_reporter(ctx),
+            kind="synthesis",
+        )
+    except DaisysMcpTimeoutError as e:
+        # the sink is closed, so the file holds valid (partial) audio
+        output_file = await finish_output(part, output_path, text, audio_format)
+        throw_mcp_error(f"{e} Partial audio saved as: {output_file}")
+    except Exception as e:
+        sink.discard()
+        if not can_fall_back(e, audio_format):
+            throw_mcp_error("Error generating audio")
+        fallbacks_total.inc()
+        try:
+            audiobuffer = await run_blocking(
+                _http_take, text, voice_id, audio_format, sample_rate, kind="synthesis"
+            )
+            output_file = await save_output(
+                audiobuffer, output_path, text, audio_format
+            )
+        except Exception:
+            throw_mcp_error("Error generating audio")
+    else:
+        output_file = await finish_output(part, output_path, text, audio_format)
+        if not sample_rate:
+            await run_blocking(
+                _remember_file, text, voice_id, True, audio_format, output_file
+            )
 
-@mcp.tool(
+    cache = get_synthesis_cache()
+    if cache:
+        await run_blocking(cache.put_file, cache_key, output_file)
+    return output_file
+
+
+def _http_take(
+    text: str,
+    voice_id: str,
+    audio_format: str,
+    sample_rate: int | None,
+    playback: bool = True,
+) -> bytes:
+    audio = text_to_speech_http(
+        text, voice_id, audio_format=audio_format, playback=playback
+    )
+    if sample_rate:
+        audio = resample_audio(audio, audio_format, sample_rate)
+    return audio
+
+
+def _websocket_take(
+    text: str,
+    voice_id: str,
+    audio_format: str = "wav",
+    sample_rate: int | None = None,
+    playback: bool = True,
+    on_chunk=None,
+) -> bytes:
+    """
+    A websocket take in memory, generated over HTTP if the websocket fails.
+
+    A take falls back when the websocket stays unreachable after retries or
+    its circuit is open; opus, which the http api lacks, never does.
+    """
+    try:
+        return text_to_speech_websocket(
+            text,
+            voice_id,
+            on_chunk=on_chunk,
+            playback=playback,
+            audio_format=audio_format,
+            sample_rate=sample_rate,
+        )
+    except Exception as e:
+        if not can_fall_back(e, audio_format):
+            raise
+    fallbacks_total.inc()
+    return _http_take(text, voice_id, audio_format, sample_rate, playback)
+
+
+def _segments(text: str, voice_id: str, use_websocket: bool, on_segment=None) -> bytes:
+    """Generate a long text as parallel segments and join them into one wav file."""
+    if use_websocket:
+
+        def synthesize(segment: str) -> bytes:
+            return _websocket_take(segment, voice_id, playback=False)
+
+    else:
+
+        def synthesize(segment: str) -> bytes:
+            return text_to_speech_http(
+                segment, voice_id, audio_format="wav", playback=False
+            )
+
+    return synthesize_segmented(
+        text,
+        voice_id,
+        synthesize,
+        protocol="websocket" if use_websocket else "http",
+        prosody=_prosody(use_websocket),
+        on_segment=on_segment,
+    )
+
+
+async def _synthesize_long_text(
+    text: str,
+    voice_id: str,
+    use_websocket: bool,
+    ctx: Context | None,
+    sample_rate: int | None = None,
+) -> bytes:
+    def on_segment(done: int, total: int):
+        if ctx is not None:
+            try:
+                run_async_from_thread(ctx.report_progress, done, total)
+            except Exception:
+                pass
+
+    try:
+        audiobuffer = await run_blocking(
+            _segments, text, voice_id, use_websocket, on_segment, kind="synthesis"
+        )
+    except DaisysMcpTimeoutError as e:
+        throw_mcp_error(str(e))
+    except Exception:
+        throw_mcp_error("Error generating audio")
+    if sample_rate:
+        audiobuffer = await run_blocking(
+            resample_audio, audiobuffer, "wav", sample_rate
+        )
+    return audiobuffer
+
+
+async def _synthesize(
+    text: str,
+    voice_id: str,
+    audio_format: str,
+    use_websocket: bool,
+    sample_rate: int | None,
+    ctx: Context | None,
+) -> bytes:
+    """Generate a take in memory, playing it while it is generated."""
+    if use_websocket:
+        return await run_blocking(
+            _websocket_take,
+            text,
+            voice_id,
+            audio_format,
+            sample_rate,
+            on_chunk=_progress_reporter(ctx),
+            kind="synthesis",
+        )
+    # resampled once, over the whole take
+    return await run_blocking(
+        _http_take, text, voice_id, audio_format, sample_rate, kind="synthesis"
+    )
+
+
+def _plan(
+    text: str,
+    voice_id: str,
+    audio_format: str,
+    streaming: bool,
+    sample_rate: int | None,
+) -> tuple[bool, str]:
+    """Whether a request is generated over the websocket, and its cache key."""
+    # fast inference; compressed formats are encoded while the take streams in
+    # (the http api has no opus, so opus is always streamed)
+    use_websocket = audio_format == "opus" or (
+        streaming and audio_format in ["wav", *ENCODED_FORMATS]
+    )
+    cache_key = make_cache_key(
+        text,
+        voice_id,
+        _prosody(use_websocket),
+        audio_format,
+        "websocket" if use_websocket else "http",
+        sample_rate,
+    )
+    return use_websocket, cache_key
+
+
+def _prosody(use_websocket: bool) -> str | None:
+    """The prosody takes are generated with; websocket takes use the voice's own."""
+    return None if use_websocket else default_prosody().model_dump_json()
+
+
+def _remember_file(
+    text: str, voice_id: str, use_websocket: bool, audio_format: str, output_file
+):
+    """Record a saved take in the take index, so it is read instead of downloaded."""
+    remember_file(
+        text,
+        voice_id,
+        _prosody(use_websocket),
+        "websocket" if use_websocket else "http",
+        audio_format,
+        output_file,
+    )
+
+
+def _generate(
+    text: str,
+    voice_id: str,
+    audio_format: str,
+    use_websocket: bool,
+    sample_rate: int | None,
+) -> bytes:
+    """Generate the audio text_to_speech would, without playing or saving it."""
+    if audio_format == "wav" and len(text) > segment_threshold:
+        audio = _segments(text, voice_id, use_websocket)
+        if sample_rate:
+            audio = resample_audio(audio, audio_format, sample_rate)
+        return audio
+    if use_websocket:
+        return _websocket_take(
+            text, voice_id, audio_format, sample_rate, playback=False
+        )
+    return _http_take(text, voice_id, audio_format, sample_rate, playback=False)
+
+
+@tool(
     "text_to_speech",
     description=(
         """
@@ -38,46 +385,135 @@ storage_path = os.environ.get("DAISYS_BASE_STORAGE_PATH")
         Args:
             text (str): The text to convert to speech.
             voice_id (str, optional): The voice_id of the voice to use. If no voice specified use latest created voice.
-            audio_format (str, optional): Can be either "wav" or "mp3". Defaults to "wav" always use "wav" unless mp3 specified.
+            audio_format (str, optional): Can be "wav", "mp3" or "opus". Defaults to "wav" always use "wav" unless another format is specified.
             output_dir (str, optional): Directory where files should be saved. Defaults to $HOME/Desktop if not provided.
+            sample_rate (int, optional): Resample the audio to this rate, e.g. 8000 or 16000 for telephony or 48000 for media. Defaults to the rate of the voice model.
             streaming (bool, optional): Whether to use streaming or not. Set to True unless specifically asked to not stream. (streaming makes use of the websocket protocol which send and play audio in chunks)
-            Defaults don't store if not provided.
+            Defaults don't store if not provided. When streaming, the file is written (and mp3 or opus encoded) while it is generated, into a hidden .part file whose path is sent as a log message before the first chunk, and progress is reported per audio chunk. "opus" is always streamed.
+            Long wav texts are split into segments that are generated in parallel and joined in order; progress is then reported per segment.
+            priority (str, optional): "interactive", "batch" or "prefetch". When takes are rate limited, interactive takes are sent first and lower priorities use the rate that is left. Defaults to "interactive".
 
         Returns:
             Text content with the path to the output file and name of the voice used.
         """
     ),
+    synthesis=True,
 )
 # Disabled optional typing since its not yet supported by cursor's mcp client
-def text_to_speech(
+async def text_to_speech(
     text: str,
     voice_id: str = None,  # type: ignore
     audio_format: str = "wav",
     output_dir: str = None,  # type: ignore
     streaming: bool = True,
+    sample_rate: int = None,  # type: ignore
+    priority: str = "interactive",
+    ctx: Context = None,  # type: ignore
 ):
     if text in ["None", "", None]:
         throw_mcp_error("Text for TTS cannot be empty.")
 
+    # takes of this call are sent to the API in this priority class
+    set_priority(priority)
+
+    if sample_rate is not None and not 8000 <= sample_rate <= 48000:
+        throw_mcp_error(
+            f"sample_rate must be between 8000 and 48000, got {sample_rate}."
+        )
+
+    if audio_format not in ["wav", *ENCODED_FORMATS]:
+        throw_mcp_error(
+            f"audio_format must be one of {['wav', *ENCODED_FORMATS]}, "
+            f"got {audio_format}."
+        )
+
     # LLM sometimes send null as a string
     if isinstance(voice_id, str) and voice_id.lower() in ["null", "undefined"]:
         voice_id = None  # type: ignore
 
-    with DaisysAPI("speak", email=email, password=password) as speak:  # type: ignore
-        if not voice_id:
-            try:
-                voice_id = speak.get_voices()[-1].voice_id
-            except IndexError:
-                throw_mcp_error("No voices available. Try to generate a voice first.")
+    if not voice_id:
+        voice_id = await run_blocking(latest_voice_id)
 
-    try:
-        # this can create only a wav file but has fast inference
-        if audio_format == "wav" and streaming:
-            audiobuffer = text_to_speech_websocket(text, voice_id)
-        else:
-            audiobuffer = text_to_speech_http(text, voice_id)
-    except Exception:
-        throw_mcp_error("Error generating audio")
+    use_websocket, cache_key = _plan(
+        text, voice_id, audio_format, streaming, sample_rate
+    )
+    cache = get_synthesis_cache()
+    audiobuffer = await run_blocking(cache.get, cache_key) if cache else None
+    prefetcher = get_prefetcher()
+    if audiobuffer is None and prefetcher is not None:
+        # wait for a prefetch of this text, or take it over if it did not start
+        audiobuffer = await prefetcher.join_async(cache_key, take_deadline(text))
+
+    # identical requests arriving while one is generating share its take
+    played = False
+    if audiobuffer is None and audio_format == "wav" and len(text) > segment_threshold:
+        audiobuffer, shared = await synthesis_flights.do_async(
+            f"segments:{cache_key}",
+            _synthesize_long_text,
+            text,
+            voice_id,
+            use_websocket,
+            ctx,
+            sample_rate,
+        )
+        if cache and not shared:
+            await run_blocking(cache.put, cache_key, audiobuffer)
+    elif audiobuffer is None and use_websocket and storage_path:
+        output_file, shared = await synthesis_flights.do_async(
+            f"stream:{cache_key}",
+            _stream_to_file,
+            text,
+            voice_id,
+            output_dir,
+            cache_key,
+            ctx,
+            audio_format,
+            sample_rate,
+        )
+        if not shared:
+            return TextContent(
+                type="text",
+                text=f"Success. File saved as: {output_file}. Voice used: {voice_id}",
+            )
+        audiobuffer = await run_blocking(Path(output_file).read_bytes)
+        output_path = await run_blocking(make_output_path, output_dir, storage_path)
+        if Path(output_file).parent == output_path:
+            # the file the first caller streamed is the one we would write
+            if not disable_audio_playback:
+                await run_blocking(play_audio, audiobuffer, wait=False, label=text)
+            return TextContent(
+                type="text",
+                text=f"Success. File saved as: {output_file}. Voice used: {voice_id}",
+            )
+    elif audiobuffer is None:
+        try:
+            audiobuffer, shared = await synthesis_flights.do_async(
+                f"take:{cache_key}",
+                _synthesize,
+                text,
+                voice_id,
+                audio_format,
+                use_websocket,
+                sample_rate,
+                ctx,
+            )
+        except DaisysMcpTimeoutError as e:
+            message = str(e)
+            if storage_path:
+                output_file = await _save_audio(
+                    e.partial, text, output_dir, audio_format
+                )
+                message += f" Partial audio saved as: {output_file}"
+            throw_mcp_error(message)
+        except Exception:
+            throw_mcp_error("Error generating audio")
+        # streamed to the speakers while it was generated, for the first caller
+        played = not shared
+        if cache and not shared:
+            await run_blocking(cache.put, cache_key, audiobuffer)
+
+    if not played and not disable_audio_playback:
+        await run_blocking(play_audio, audiobuffer, wait=False, label=text)
 
     if not storage_path:
         return TextContent(
@@ -85,57 +521,283 @@ def text_to_speech(
             text=f"Success. Voice used: {voice_id}",
         )
     # Create the output file
-    output_path = make_output_path(output_dir, storage_path)
-    output_file_name = make_output_file(text, output_path, audio_format)
+    output_file = await _save_audio(audiobuffer, text, output_dir, audio_format)
+    if not sample_rate:
+        await run_blocking(
+            _remember_file, text, voice_id, use_websocket, audio_format, output_file
+        )
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path / output_file_name, "wb") as f:
-        f.write(audiobuffer)  # type: ignore
+    return TextContent(
+        type="text",
+        text=f"Success. File saved as: {output_file}. Voice used: {voice_id}",
+    )
 
+
+@tool(
+    "text_to_speech_batch",
+    description=(
+        """
+        Convert many texts to speech in one call and save each one to its own file.
+        Use this instead of calling text_to_speech repeatedly when several utterances are needed.
+        The audio is not played.
+
+        ⚠️ TOKEN WARNING: This tool makes API calls to Daisys API which may incur costs.
+
+        Args:
+            items (list): The utterances to generate. Each item has:
+                text (str): The text to convert to speech.
+                voice_id (str, optional): The voice_id of the voice to use. If not provided, the latest voice will be used.
+                audio_format (str, optional): Can be "wav", "mp3" or "opus". Defaults to "wav".
+            output_dir (str, optional): Directory where files should be saved. Defaults to $HOME/Desktop if not provided.
+
+        Returns:
+            One entry per item, in order, with its status ("ok", "cached" or "error"), output_file and error message.
+        """
+    ),
+    synthesis=True,
+)
+async def text_to_speech_batch(
+    items: list[McpBatchItem],
+    output_dir: str = None,  # type: ignore
+    ctx: Context = None,  # type: ignore
+):
+    if not items:
+        throw_mcp_error("The batch needs at least one item.")
+
+    default_voice_id = None
+    if any(not item.voice_id for item in items):
+        default_voice_id = await run_blocking(latest_voice_id)
+    output_path = await run_blocking(make_output_path, output_dir, storage_path)
+
+    def on_item(done: int, total: int):
+        if ctx is not None:
+            try:
+                run_async_from_thread(ctx.report_progress, done, total)
+            except Exception:
+                pass
+
+    return await run_blocking(
+        synthesize_batch,
+        items,
+        output_path,
+        default_voice_id,
+        on_item=on_item,
+        kind="synthesis",
+    )
+
+
+@tool(
+    "prefetch_speech",
+    description=(
+        """
+        Generate texts that will probably be spoken soon in the background, so a later text_to_speech call for them returns at once.
+        Use it for predictable utterances such as menu options or follow-up questions. Nothing is played or saved.
+        Prefetching has its own small concurrency budget and waits while text_to_speech requests are generating.
+        When text_to_speech is called for a text that is still being prefetched it waits for that take instead of generating it again.
+
+        ⚠️ TOKEN WARNING: This tool makes API calls to Daisys API which may incur costs.
+
+        Args:
+            items (list): The utterances to prefetch. Each item has:
+                text (str): The text to convert to speech.
+                voice_id (str, optional): The voice_id of the voice to use. If not provided, the latest voice will be used.
+                audio_format (str, optional): Can be "wav", "mp3" or "opus". Defaults to "wav".
+            streaming (bool, optional): The streaming argument the later text_to_speech calls will use. Defaults to True.
+            sample_rate (int, optional): The sample_rate argument the later text_to_speech calls will use.
+
+        Returns:
+            One entry per item, in order, with its status ("queued", "in_progress", "cached", "full" or "error").
+        """
+    ),
+)
+async def prefetch_speech(
+    items: list[McpBatchItem],
+    streaming: bool = True,
+    sample_rate: int = None,  # type: ignore
+):
+    cache = get_synthesis_cache()
+    prefetcher = get_prefetcher()
+    if cache is None or prefetcher is None:
+        throw_mcp_error("Prefetching needs the synthesis cache (DAISYS_CACHE_ENABLED).")
+    if sample_rate is not None and not 8000 <= sample_rate <= 48000:
+        throw_mcp_error(
+            f"sample_rate must be between 8000 and 48000, got {sample_rate}."
+        )
+
+    default_voice_id = None
+    if any(not item.voice_id for item in items):
+        default_voice_id = await run_blocking(latest_voice_id)
+
+    results = []
+    for index, item in enumerate(items):
+        voice_id = item.voice_id or default_voice_id
+        if not item.text.strip():
+            error = "Text for TTS cannot be empty."
+        elif item.audio_format not in ["wav", *ENCODED_FORMATS]:
+            error = f"Unsupported audio format: {item.audio_format}."
+        else:
+            error = None
+        if error:
+            results.append(
+                McpPrefetchResult(
+                    index=index, status="error", voice_id=voice_id, error=error
+                )
+            )
+            continue
+
+        use_websocket, cache_key = _plan(
+            item.text, voice_id, item.audio_format, streaming, sample_rate
+        )
+        if await run_blocking(cache.get, cache_key) is not None:
+            status = "cached"
+        else:
+            job = PrefetchJob(
+                cache_key,
+                functools.partial(
+                    _generate,
+                    item.text,
+                    voice_id,
+                    item.audio_format,
+                    use_websocket,
+                    sample_rate,
+                ),
+            )
+            status = prefetcher.submit(job)
+        results.append(McpPrefetchResult(index=index, status=status, voice_id=voice_id))
+    return results
+
+
+@tool(
+    "cancel_prefetch",
+    description="Drop all prefetches that have not started yet. Prefetches that are generating are finished and cached.",
+)
+async def cancel_prefetch():
+    prefetcher = get_prefetcher()
+    dropped = prefetcher.cancel() if prefetcher else 0
+    return TextContent(
+        type="text", text=f"Success. {dropped} queued prefetch(es) dropped."
+    )
+
+
+def _find_take(text: str, voice_id: str) -> str | None:
+    """The take_id of an earlier take of ``text`` by ``voice_id``, streamed or not."""
+    index = get_take_index()
+    if index is None:
+        return None
+    for use_websocket in [True, False]:
+        key = make_take_key(
+            text,
+            voice_id,
+            _prosody(use_websocket),
+            "websocket" if use_websocket else "http",
+        )
+        take_id = index.lookup(key)
+        if take_id is not None:
+            return take_id
+    return None
+
+
+@tool(
+    "get_take_audio",
+    description=(
+        """
+        Save the audio of a take that was generated before, without generating it again.
+        Downloading a take costs no credits and is faster than generating it, also in another format than the first time.
+        Give the take_id of the take, or the text and voice_id of an earlier text_to_speech call.
+
+        Args:
+            take_id (str, optional): The take_id of the take, as reported by text_to_speech_batch.
+            text (str, optional): The text of an earlier text_to_speech call, used when no take_id is given.
+            voice_id (str, optional): The voice_id of that call. If not provided, the latest voice is used.
+            audio_format (str, optional): Can be "wav" or "mp3". Defaults to "wav".
+            output_dir (str, optional): Directory where the file should be saved. Defaults to $HOME/Desktop if not provided.
+
+        Returns:
+            Text content with the path to the output file and the take_id.
+        """
+    ),
+    synthesis=True,
+)
+async def get_take_audio(
+    take_id: str = None,  # type: ignore
+    text: str = None,  # type: ignore
+    voice_id: str = None,  # type: ignore
+    audio_format: str = "wav",
+    output_dir: str = None,  # type: ignore
+):
+    if audio_format not in DOWNLOAD_FORMATS:
+        throw_mcp_error(f"audio_format must be one of {DOWNLOAD_FORMATS}.")
+    if not take_id:
+        if text in ["None", "", None]:
+            throw_mcp_error("Either take_id or text is required.")
+        if not voice_id:
+            voice_id = await run_blocking(latest_voice_id)
+        take_id = await run_blocking(_find_take, text, voice_id)
+        if take_id is None:
+            throw_mcp_error(
+                f"No earlier take of this text by voice {voice_id} found. "
+                "Use text_to_speech to generate it."
+            )
+
+    try:
+        audio = await run_blocking(download_take, take_id, audio_format)
+    except DaisysMcpError:
+        raise
+    except Exception:
+        throw_mcp_error(f"Error downloading take {take_id}")
+    output_file = await _save_audio(audio, text or take_id, output_dir, audio_format)
+    index = get_take_index()
+    if index is not None:
+        await run_blocking(index.add_file, take_id, audio_format, output_file)
     return TextContent(
         type="text",
-        text=f"Success. File saved as: {output_path / output_file_name}. Voice used: {voice_id}",
+        text=f"Success. File saved as: {output_file}. Take: {take_id}",
     )
 
 
-@mcp.tool(
+@tool(
     "get_voices",
-    description="Get available voices can be filtered by model and gender, and sorted by name or timestamp in ascending or descending order.",
+    description=(
+        """
+        Get available voices can be filtered by model and gender, and sorted by name or description in ascending or descending order.
+
+        Args:
+            model (str, optional): Only return voices of this model. Defaults to None.
+            gender (str, optional): Only return voices of this gender. Defaults to None.
+            sort_by (str, optional): can be "name" or "description". Defaults to "name".
+            sort_direction (str, optional): can be "asc" or "desc". Defaults to "asc".
+            offset (int, optional): Number of voices to skip, for paging through large accounts. Defaults to 0.
+            limit (int, optional): Maximum number of voices to return. Defaults to all voices.
+            refresh (bool, optional): Fetch the voices from Daisys API instead of the cached list, e.g. after voices were changed elsewhere. Defaults to False.
+
+        Returns:
+            voice_list: An object containing details of the matching voices
+        """
+    ),
 )
 # Disabled optional typing since its not yet supported by cursor's mcp client
-def get_voices(
+async def get_voices(
     model: str = None,
     gender: str = None,
     sort_by: Literal["description", "name"] = "name",
     sort_direction: Literal["asc", "desc"] = "asc",
+    offset: int = 0,
+    limit: int = None,  # type: ignore
+    refresh: bool = False,
 ):
-    with DaisysAPI("speak", email=email, password=password) as speak:
-        filtered_voices = [
-            voice
-            for voice in speak.get_voices()
-            if (model is None or voice.model == model)
-            and (gender is None or voice.gender == gender)
-        ]
-        voice_list = [
-            McpVoice(
-                voice_id=voice.voice_id,
-                name=voice.name,
-                gender=voice.gender,
-                model=voice.model,
-                description=voice.description,
-            )
-            for voice in filtered_voices
-        ]
-        if sort_direction == "asc":
-            voice_list.sort(key=lambda x: getattr(x, sort_by).lower())
-
-        else:
-            voice_list.sort(key=lambda x: getattr(x, sort_by).lower(), reverse=True)
-
-        return voice_list
+    if refresh:
+        voice_catalog.invalidate()
+    index = await run_blocking(voice_catalog.index)
+    return index.query(
+        {"model": model, "gender": gender},
+        sort_by=sort_by,
+        sort_direction=sort_direction,
+        offset=offset,
+        limit=limit,
+    )
 
 
-@mcp.tool(
+@tool(
     "get_models",
     description=(
         """
@@ -145,6 +807,9 @@ def get_voices(
             language (str, optional): needs to be "de" for german, "en" for english and "nl" for dutch. Defaults to None.
             sort_by (str, optional): can be "name" or "displayname". Defaults to "displayname".
             sort_direction (str, optional): can be "asc" or "desc". Defaults to "asc".
+            offset (int, optional): Number of models to skip. Defaults to 0.
+            limit (int, optional): Maximum number of models to return. Defaults to all models.
+            refresh (bool, optional): Fetch the models from Daisys API instead of the cached list. Defaults to False.
 
         Returns:
             model_list: An object containing details of all models
@@ -154,44 +819,31 @@ def get_voices(
 )
 
 # Disabled optional typing since its not yet supported by cursor's mcp client
-def get_models(
+async def get_models(
     language: str = None,
     sort_by: Literal["name", "displayname"] = "displayname",
     sort_direction: Literal["asc", "desc"] = "asc",
+    offset: int = 0,
+    limit: int = None,  # type: ignore
+    refresh: bool = False,
 ):
-    # make sure to only use the first 2 letters of the language
+    # "en" matches every english model, "en-GB" only the british one
     if language:
-        language = language.lower()[:1]
-
-    with DaisysAPI("speak", email=email, password=password) as speak:
-        filtered_models = [
-            model
-            for model in speak.get_models()
-            if language is None
-            or any(lang.startswith(language) for lang in model.languages)
-        ]
-        model_list = [
-            McpModel(
-                name=model.name,
-                displayname=model.displayname,
-                flags=model.flags,
-                languages=model.languages,
-                genders=model.genders,
-                styles=model.styles,
-                prosody_types=model.prosody_types,
-            )
-            for model in filtered_models
-        ]
-
-        if sort_direction == "asc":
-            model_list.sort(key=lambda x: getattr(x, sort_by).lower())
+        language = language.lower().replace("_", "-")
 
-        else:
-            model_list.sort(key=lambda x: getattr(x, sort_by).lower(), reverse=True)
-        return model_list
+    if refresh:
+        model_catalog.invalidate()
+    index = await run_blocking(model_catalog.index)
+    return index.query(
+        {"language": language},
+        sort_by=sort_by,
+        sort_direction=sort_direction,
+        offset=offset,
+        limit=limit,
+    )
 
 
-@mcp.tool(
+@tool(
     "create_voice",
     description=(
         """
@@ -215,8 +867,9 @@ def get_models(
 
         """
     ),
+    synthesis=True,
 )
-def create_voice(
+async def create_voice(
     name: str = "Daisy",
     gender: str = "female",
     model: str = "english-v3.0",
@@ -240,28 +893,37 @@ def create_voice(
             f"Invalid gender: {gender}. Must be one of {list(VoiceGender)}."
         )
 
-    with DaisysAPI("speak", email=email, password=password) as speak:
-        voice = speak.generate_voice(
-            name=name, gender=gender, model=model, default_prosody=prosody_params
-        )
-    return McpVoice(
+    def generate_voice():
+        with speak_client() as speak:
+            return speak.generate_voice(
+                name=name, gender=gender, model=model, default_prosody=prosody_params
+            )
+
+    voice = await run_blocking(generate_voice, kind="synthesis")
+    mcp_voice = McpVoice(
         voice_id=voice.voice_id,
         name=voice.name,
         gender=voice.gender,
         model=voice.model,
         description=voice.description,
     )
+    voice_catalog.add(mcp_voice)
+    return mcp_voice
 
 
-@mcp.tool(
+@tool(
     "remove_voice",
     description="Delete a voice.",
 )
-def remove_voice(
+async def remove_voice(
     voice_id: str,
 ):
-    with DaisysAPI("speak", email=email, password=password) as speak:
-        speak.delete_voice(voice_id)
+    def delete_voice():
+        with speak_client() as speak:
+            speak.delete_voice(voice_id)
+
+    await run_blocking(delete_voice)
+    voice_catalog.remove(voice_id)
 
     return TextContent(
         type="text",
@@ -269,7 +931,263 @@ def remove_voice(
     )
 
 
+@tool(
+    "get_playback_queue",
+    description=(
+        """
+        List the utterance that is playing and the utterances queued to play after it.
+
+        Returns:
+            A list with the utterance_id, label (start of the text), state and buffered seconds of each utterance.
+        """
+    ),
+)
+async def get_playback_queue():
+    return get_playback_engine().queue()
+
+
+@tool(
+    "skip_playback",
+    description="Stop the utterance that is playing and continue with the next one in the queue.",
+)
+async def skip_playback():
+    utterance = get_playback_engine().skip()
+    if utterance is None:
+        return TextContent(type="text", text="Nothing is playing.")
+    return TextContent(
+        type="text", text=f"Success. Skipped utterance {utterance.utterance_id}."
+    )
+
+
+@tool(
+    "cancel_playback",
+    description=(
+        """
+        Remove an utterance from the playback queue, or stop it if it is playing.
+
+        Args:
+            utterance_id (int): The utterance_id from get_playback_queue.
+        """
+    ),
+)
+async def cancel_playback(utterance_id: int):
+    utterance = get_playback_engine().cancel(utterance_id)
+    if utterance is None:
+        throw_mcp_error(f"Utterance {utterance_id} is not playing or queued.")
+    return TextContent(
+        type="text", text=f"Success. Utterance {utterance_id} cancelled."
+    )
+
+
+@tool(
+    "stop_playback",
+    description="Stop all audio playback and clear the playback queue.",
+)
+async def stop_playback():
+    stopped = get_playback_engine().stop()
+    return TextContent(
+        type="text", text=f"Success. Playback stopped, {stopped} utterance(s) dropped."
+    )
+
+
+def _runtime_metrics():
+    """Gauges and counters read from the components at collection time."""
+    cache = get_synthesis_cache()
+    if cache is not None:
+        stats = cache.stats()
+        for result in ["hits", "misses"]:
+            yield (
+                f"daisys_cache_{result}_total",
+                "counter",
+                f"Synthesis cache {result}.",
+                {},
+                stats[result],
+            )
+        for tier in ["memory", "disk"]:
+            yield (
+                "daisys_cache_bytes",
+                "gauge",
+                "Bytes of audio in the synthesis cache.",
+                {"tier": tier},
+                stats[f"{tier}_bytes"],
+            )
+    for kind, (running, waiting) in limiter_stats().items():
+        yield (
+            "daisys_work_running",
+            "gauge",
+            "Blocking calls running in worker threads.",
+            {"kind": kind},
+            running,
+        )
+        yield (
+            "daisys_work_waiting",
+            "gauge",
+            "Blocking calls waiting for a worker thread.",
+            {"kind": kind},
+            waiting,
+        )
+    for priority, waiting in get_scheduler().stats().items():
+        yield (
+            "daisys_scheduler_waiting",
+            "gauge",
+            "Takes waiting for their turn under the rate limit.",
+            {"priority": priority},
+            waiting,
+        )
+    pool = get_websocket_pool().stats()
+    yield (
+        "daisys_websocket_connections",
+        "gauge",
+        "Open websocket connections.",
+        {},
+        pool["connections"],
+    )
+    yield (
+        "daisys_websocket_takes_in_flight",
+        "gauge",
+        "Takes generating on the websocket connections.",
+        {},
+        pool["takes_in_flight"],
+    )
+    for endpoint, state in breaker_states().items():
+        yield (
+            "daisys_circuit_open",
+            "gauge",
+            "Whether the circuit of an upstream endpoint is open (1), half open (0.5) or closed (0).",
+            {"endpoint": endpoint},
+            {"open": 1, "half_open": 0.5}.get(state, 0),
+        )
+    index = get_take_index()
+    if index is not None:
+        for kind, count in index.stats().items():
+            yield (
+                "daisys_take_index_entries",
+                "gauge",
+                "Takes and saved files in the take index.",
+                {"kind": kind},
+                count,
+            )
+    prefetcher = get_prefetcher()
+    if prefetcher is not None:
+        for state, count in prefetcher.status().items():
+            yield (
+                "daisys_prefetch_jobs",
+                "gauge",
+                "Prefetch jobs by state.",
+                {"state": state},
+                count,
+            )
+
+
+registry.add_collector(_runtime_metrics)
+
+
+@tool(
+    "get_metrics",
+    description=(
+        """
+        Get the server's performance metrics: latency per stage (login, voice_lookup, websocket_connect, first_chunk, last_chunk, file_write, playback, scheduler_wait, ...) and per tool, bytes and characters synthesized, cache hits, errors by type, timeouts, work in flight and takes waiting for the rate limit.
+
+        Args:
+            format (str, optional): "summary" for counts, means and p50/p95/p99 latencies in seconds, or "prometheus" for the Prometheus text format. Defaults to "summary".
+        """
+    ),
+)
+async def get_metrics(format: Literal["summary", "prometheus"] = "summary"):
+    if format == "prometheus":
+        return TextContent(type="text", text=registry.render())
+    return registry.snapshot()
+
+
+def _import_profile(limit: int = 15):
+    """Import the server in a fresh interpreter and print where the startup time goes."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import daisys_mcp.server"],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative), depth, name.strip()))
+    total = next((us for us, _, name in rows if name == "daisys_mcp.server"), 0)
+    print(f"Importing daisys_mcp.server took {total / 1000:.1f} ms")
+    # the direct imports of the server and what they pull in
+    for us, _, name in sorted((r for r in rows if 1 <= r[1] <= 2), reverse=True)[
+        :limit
+    ]:
+        print(f"{us / 1000:>9.1f} ms  {name}")
+
+
+def _serve_sse(host: str, port: int):
+    """
+    Serve clients over HTTP with server-sent events until interrupted.
+
+    All clients share this process' sessions, caches and websocket
+    connections. Next to the MCP endpoints (/sse and /messages/) the app
+    serves /health for load balancers and /metrics in the Prometheus format.
+    """
+    import uvicorn  # type: ignore
+    from starlette.responses import PlainTextResponse  # type: ignore
+    from starlette.routing import Route  # type: ignore
+
+    async def health(request):
+        return PlainTextResponse("ok")
+
+    async def metrics(request):
+        return PlainTextResponse(
+            registry.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    app = mcp.sse_app()
+    app.router.routes.append(Route("/health", health))
+    app.router.routes.append(Route("/metrics", metrics))
+    uvicorn.run(app, host=host, port=port, log_level=mcp.settings.log_level.lower())
+
+
 def main():
+    parser = argparse.ArgumentParser(prog="daisys-mcp", description="Daisys MCP server")
+    parser.add_argument(
+        "--import-profile",
+        action="store_true",
+        help="Print how long starting the server takes per imported module and exit.",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse"],
+        default=transport,
+        help=(
+            "stdio serves the one client that started the process; sse serves "
+            "any number of clients over HTTP (env DAISYS_MCP_TRANSPORT)."
+        ),
+    )
+    parser.add_argument(
+        "--host",
+        default=host,
+        help="Address to listen on with sse (env DAISYS_MCP_HOST).",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=port,
+        help="Port to listen on with sse (env DAISYS_MCP_PORT).",
+    )
+    args = parser.parse_args()
+    if args.import_profile:
+        _import_profile()
+        return
+
+    if metrics_port:
+        start_metrics_server(metrics_host, int(metrics_port))
+
+    if args.transport == "sse":
+        print(f"Starting Daisys-mcp server on http://{args.host}:{args.port}/sse.")
+        _serve_sse(args.host, args.port)
+        return
+
     print("Starting Daisys-mcp server.")
     mcp.run(transport="stdio")
 
@@ -0,0 +1,160 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from daisys import DaisysAPI  # type: ignore
+
+if TYPE_CHECKING:
+    # importing daisys.v1.speak pulls in the websocket stack, keep it lazy
+    from daisys.v1.speak import DaisysSyncSpeakClientV1  # type: ignore
+
+from daisys_mcp.metrics import timed
+from daisys_mcp.utils import throw_mcp_error
+
+email = os.environ.get("DAISYS_EMAIL")
+password = os.environ.get("DAISYS_PASSWORD")
+pool_size = int(os.getenv("DAISYS_SESSION_POOL_SIZE", "16"))
+# Access tokens are refreshed proactively once they are older than this.
+token_refresh_seconds = float(os.getenv("DAISYS_TOKEN_REFRESH_SECONDS", "600"))
+
+
+class SessionPool:
+    """
+    Process-wide pool of authenticated speak clients.
+
+    The pool logs in once and shares the resulting tokens between all of its
+    clients, so checking out a client never costs a login round-trip. Each
+    client keeps its own keep-alive httpx connection pool. Tokens are refreshed
+    before they get stale; any refresh or re-login done by one client (the
+    daisys client does this by itself on a 401) is propagated to the others.
+    """
+
+    def __init__(
+        self,
+        email: Optional[str],
+        password: Optional[str],
+        size: int = 4,
+        refresh_seconds: float = 600,
+    ):
+        if not email or not password:
+            throw_mcp_error(
+                "DAISYS_EMAIL and DAISYS_PASSWORD environment variables must be set."
+            )
+        self.email = email
+        self.password = password
+        self.size = max(size, 1)
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.Lock()
+        # LIFO so the most recently used (warmest) connection is handed out first
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._clients: list = []
+        self._access_token: Optional[str] = None
+        self._refresh_token: Optional[str] = None
+        self._token_time = 0.0
+        self._closed = False
+
+    def _on_tokens(self, access_token: Optional[str], refresh_token: Optional[str]):
+        if not access_token:
+            return
+        self._access_token = access_token
+        self._refresh_token = refresh_token
+        self._token_time = time.monotonic()
+
+    def _new_client(self) -> "DaisysSyncSpeakClientV1":
+        client = DaisysAPI(
+            "speak",
+            email=self.email,
+            password=self.password,
+            access_token=self._access_token,
+            refresh_token=self._refresh_token,
+        ).get_client()
+        client.token_callback = self._on_tokens
+        return client
+
+    def _ensure_fresh(self, client: "DaisysSyncSpeakClientV1"):
+        with self._lock:
+            if self._access_token is None:
+                with timed("login"):
+                    client.login()
+            elif time.monotonic() - self._token_time > self.refresh_seconds:
+                client.access_token = self._access_token
+                client.refresh_token = self._refresh_token
+                with timed("token_refresh"):
+                    if not client.login_refresh():
+                        client.login()
+            # Tokens are shared, the pool does a single logout on close.
+            client.auto_logout = False
+            client.access_token = self._access_token
+            client.refresh_token = self._refresh_token
+
+    def _checkout(self) -> "DaisysSyncSpeakClientV1":
+        if self._closed:
+            throw_mcp_error("Daisys session pool is closed.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._clients) < self.size:
+                client = self._new_client()
+                self._clients.append(client)
+                return client
+        return self._idle.get()
+
+    @contextmanager
+    def client(self) -> Iterator["DaisysSyncSpeakClientV1"]:
+        """Borrow an authenticated speak client for the duration of the block."""
+        client = self._checkout()
+        try:
+            self._ensure_fresh(client)
+            yield client
+        finally:
+            self._idle.put(client)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            clients, self._clients = self._clients, []
+        for i, client in enumerate(clients):
+            try:
+                if i == 0 and self._refresh_token:
+                    client.refresh_token = self._refresh_token
+                    client.logout()
+                client.auto_logout = False
+                client.close()
+            except Exception:
+                pass
+
+
+_pool: Optional[SessionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> SessionPool:
+    """Return the process-wide session pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SessionPool(
+                    email,
+                    password,
+                    size=pool_size,
+                    refresh_seconds=token_refresh_seconds,
+                )
+                atexit.register(_pool.close)
+    return _pool
+
+
+@contextmanager
+def speak_client() -> Iterator["DaisysSyncSpeakClientV1"]:
+    """Shortcut for ``get_session_pool().client()``."""
+    with get_session_pool().client() as speak:
+        yield speak
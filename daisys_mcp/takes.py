@@ -0,0 +1,244 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from daisys_mcp.cache import normalize_text
+from daisys_mcp.metrics import registry, timed
+from daisys_mcp.resilience import call_with_retry
+from daisys_mcp.session import speak_client
+from daisys_mcp.utils import throw_mcp_error
+
+take_index_enabled = os.getenv("DAISYS_TAKE_INDEX_ENABLED", "true").lower() == "true"
+storage_path = os.environ.get("DAISYS_BASE_STORAGE_PATH")
+
+# Formats the API can download a finished take in.
+DOWNLOAD_FORMATS = ["wav", "mp3"]
+
+takes_reused_total = registry.counter(
+    "daisys_takes_reused_total",
+    "Takes served from an earlier take instead of generating them again.",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS takes (
+    key TEXT PRIMARY KEY,
+    take_id TEXT NOT NULL,
+    voice_id TEXT,
+    text TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS takes_take_id ON takes (take_id);
+CREATE TABLE IF NOT EXISTS files (
+    take_id TEXT NOT NULL,
+    format TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (take_id, format)
+);
+"""
+
+
+def make_take_key(
+    text: str, voice_id: Optional[str], prosody: Optional[str], protocol: str
+) -> str:
+    """Content address of a take: the same text, voice and prosody make the same audio."""
+    parts = [normalize_text(text), voice_id or "", prosody or "", protocol]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class TakeIndex:
+    """
+    SQLite index of generated takes and the local files saved from them.
+
+    A take is keyed by ``make_take_key``; any format of it can be downloaded
+    again by its take_id, which costs no credits. Files are recorded per
+    (take_id, format) with their size, and only reused while they still
+    exist with that size.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """The take_id of an earlier take with ``key``, if any."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT take_id FROM takes WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, key: str, take_id: str, voice_id: Optional[str], text: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO takes VALUES (?, ?, ?, ?, ?)",
+                (key, take_id, voice_id, text, time.time()),
+            )
+
+    def add_file(self, take_id: str, audio_format: str, path: Path):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (take_id, audio_format, str(path), os.path.getsize(path)),
+            )
+
+    def local_file(self, take_id: str, audio_format: str) -> Optional[Path]:
+        """A saved file of the take in ``audio_format``, unless it was removed or changed."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT path, size FROM files WHERE take_id = ? AND format = ?",
+                (take_id, audio_format),
+            ).fetchone()
+        if row is None:
+            return None
+        path = Path(row[0])
+        try:
+            if path.stat().st_size == row[1]:
+                return path
+        except OSError:
+            pass
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM files WHERE take_id = ? AND format = ?",
+                (take_id, audio_format),
+            )
+        return None
+
+    def forget(self, take_id: str):
+        """Drop a take that no longer exists upstream."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM takes WHERE take_id = ?", (take_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            takes = self._db.execute("SELECT COUNT(*) FROM takes").fetchone()[0]
+            files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {"takes": takes, "files": files}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_index: Optional[TakeIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_take_index() -> Optional[TakeIndex]:
+    """
+    Return the process-wide take index, or None when it is disabled.
+
+    The index is stored in ``$DAISYS_BASE_STORAGE_PATH/.daisys_takes.sqlite3``;
+    without a storage path it is kept in memory.
+    """
+    global _index
+    if not take_index_enabled:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                try:
+                    if not storage_path:
+                        raise OSError("no storage path")
+                    directory = Path(os.path.expanduser(storage_path))
+                    directory.mkdir(parents=True, exist_ok=True)
+                    _index = TakeIndex(str(directory / ".daisys_takes.sqlite3"))
+                except (OSError, sqlite3.Error):
+                    _index = TakeIndex()
+    return _index
+
+
+def download_take(take_id: str, audio_format: str = "wav") -> bytes:
+    """The audio of a take, from a saved file or downloaded from the API."""
+    index = get_take_index()
+    local = index.local_file(take_id, audio_format) if index else None
+    if local is not None:
+        try:
+            audio = local.read_bytes()
+        except OSError:
+            pass
+        else:
+            takes_reused_total.inc(source="file")
+            return audio
+    if audio_format not in DOWNLOAD_FORMATS:
+        throw_mcp_error(f"Takes can only be downloaded as {DOWNLOAD_FORMATS}.")
+
+    def download():
+        with speak_client() as speak, timed("take_download"):
+            return speak.get_take_audio(take_id, format=audio_format)
+
+    audio = call_with_retry("http", download)
+    takes_reused_total.inc(source="download")
+    return audio
+
+
+def reuse_take(
+    text: str,
+    voice_id: Optional[str],
+    prosody: Optional[str],
+    protocol: str,
+    audio_format: str,
+) -> Optional[bytes]:
+    """
+    The audio of an earlier take of the same text, voice and prosody, if there is one.
+
+    Returns None when there is no such take or it cannot be fetched; a take
+    that no longer exists upstream is dropped from the index.
+    """
+    import httpx  # type: ignore
+
+    index = get_take_index()
+    if index is None:
+        return None
+    take_id = index.lookup(make_take_key(text, voice_id, prosody, protocol))
+    if take_id is None:
+        return None
+    try:
+        return download_take(take_id, audio_format)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            index.forget(take_id)
+    except Exception:
+        pass
+    return None
+
+
+def remember_take(
+    text: str,
+    voice_id: Optional[str],
+    prosody: Optional[str],
+    protocol: str,
+    take_id: Optional[str],
+):
+    """Record a generated take so a repeat request can download it instead."""
+    index = get_take_index()
+    if index is None or not take_id:
+        return
+    index.record(
+        make_take_key(text, voice_id, prosody, protocol), take_id, voice_id, text
+    )
+
+
+def remember_file(
+    text: str,
+    voice_id: Optional[str],
+    prosody: Optional[str],
+    protocol: str,
+    audio_format: str,
+    path: Path,
+):
+    """Record a file saved from a take, so it is read instead of downloaded."""
+    index = get_take_index()
+    if index is None:
+        return
+    take_id = index.lookup(make_take_key(text, voice_id, prosody, protocol))
+    if take_id is not None:
+        index.add_file(take_id, audio_format, path)
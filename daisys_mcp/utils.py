@@ -1,13 +1,31 @@
+import re
 import shutil
 import os
+import uuid
 from pathlib import Path
-from datetime import datetime
+
+# Characters kept from the text in a file name.
+_unsafe_filename = re.compile(r"[^\w-]")
+# Output directories that were created and found writeable.
+_valid_output_paths: set[Path] = set()
 
 
 class DaisysMcpError(Exception):
     pass
 
 
+class DaisysMcpTimeoutError(DaisysMcpError):
+    """A take did not finish in time; ``partial`` holds the audio received so far."""
+
+    def __init__(self, message: str, partial=None):
+        super().__init__(message)
+        self.partial = partial
+
+
+class DaisysMcpConnectionError(DaisysMcpError):
+    """The connection to the API broke; the request may succeed when sent again."""
+
+
 def throw_mcp_error(message: str):
     raise DaisysMcpError(message)
 
@@ -26,12 +44,18 @@ def is_file_writeable(path: Path) -> bool:
     return os.access(parent_dir, os.W_OK) and parent_dir.exists()
 
 
-def make_output_file(text: str, output_path: Path, extension: str = "wav") -> Path:
-    text = text.replace(" ", "_")
-    output_file_name = (
-        f"{text[:5]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
-    )
-    return output_path / output_file_name
+def make_output_file(
+    text: str, output_path: Path, extension: str = "wav", digest: str | None = None
+) -> Path:
+    """
+    The path of an output file in ``output_path``, named after its text and content.
+
+    ``digest`` is the content hash of the audio: different audio never gets
+    the same name, and the same audio always does. Without it, the name is
+    made unique with a random suffix.
+    """
+    prefix = _unsafe_filename.sub("", text.replace(" ", "_")[:5]) or "audio"
+    return output_path / f"{prefix}_{(digest or uuid.uuid4().hex)[:16]}.{extension}"
 
 
 def make_output_path(
@@ -45,8 +69,18 @@ def make_output_path(
     else:
         output_path = Path(os.path.expanduser(output_directory))
 
+    # created and checked once, not on every request
+    if output_path in _valid_output_paths:
+        return output_path
+
     output_path.mkdir(parents=True, exist_ok=True)
 
     if not is_file_writeable(output_path):
         throw_mcp_error(f"Directory ({output_path}) is not writeable")
+    _valid_output_paths.add(output_path)
     return output_path
+
+
+def forget_output_path(output_path: Path):
+    """Check ``output_path`` again on its next use, e.g. after it was removed."""
+    _valid_output_paths.discard(output_path)
@@ -0,0 +1,355 @@
+import atexit
+import itertools
+import os
+import queue
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, Optional
+
+from daisys_mcp.catalog import voice_models
+from daisys_mcp.metrics import timed
+from daisys_mcp.session import speak_client
+from daisys_mcp.utils import DaisysMcpConnectionError, throw_mcp_error
+
+# A warm connection without takes is closed after this many seconds; 0 closes
+# every connection as soon as its last take is done.
+websocket_idle_seconds = float(os.getenv("DAISYS_WEBSOCKET_IDLE_SECONDS", "300"))
+# Attempts to open a connection, with exponential backoff in between.
+websocket_connect_attempts = int(os.getenv("DAISYS_WEBSOCKET_CONNECT_ATTEMPTS", "3"))
+websocket_connect_backoff = float(
+    os.getenv("DAISYS_WEBSOCKET_CONNECT_BACKOFF_SECONDS", "0.25")
+)
+
+
+class _Prefetched:
+    """
+    Stands in for the websocket session of a ``DaisysSyncSpeakWebsocketV1``.
+
+    The reader thread waits for a message without holding the connection
+    lock, then hands it to ``update()`` through this object while holding
+    it, so a take is never submitted halfway through routing a message.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.event = None
+
+    def receive(self, timeout=None):
+        event, self.event = self.event, None
+        if event is None:
+            raise queue.Empty()
+        return event
+
+    def send_text(self, data: str):
+        self.session.send_text(data)
+
+
+class WebsocketConnection:
+    """
+    One open websocket of a model, shared by every take of that model.
+
+    A reader thread receives all messages and routes them by request_id to
+    the lease that submitted the take. Keepalive pings are sent by httpx-ws
+    (every 20 seconds); when one goes unanswered, or the server closes the
+    connection, the leases with takes in flight get an error and the pool
+    opens a new connection for the next take.
+
+    ``client`` holds the speak client the websocket was opened with; the
+    websocket keeps using its http client and tokens, so it stays checked
+    out of the session pool until the connection is closed.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        websocket,
+        on_close=None,
+        client: Optional[ExitStack] = None,
+    ):
+        self.model = model
+        self._websocket = websocket
+        self._client = client
+        self._session = websocket.ws
+        self._prefetched = websocket.ws = _Prefetched(websocket.ws)
+        self._on_close = on_close
+        self._lock = threading.Lock()
+        self._owners: Dict[int, "WebsocketLease"] = {}
+        self._leases = 0
+        self.last_used = time.monotonic()
+        self.closed = False
+        self._thread = threading.Thread(
+            target=self._read, name=f"daisys-websocket-{model}", daemon=True
+        )
+        self._thread.start()
+
+    def lease(self) -> Optional["WebsocketLease"]:
+        """Start using the connection, unless it is already closed."""
+        with self._lock:
+            if self.closed:
+                return None
+            self._leases += 1
+            self.last_used = time.monotonic()
+            return WebsocketLease(self)
+
+    def _submit(self, lease: "WebsocketLease", **kwargs) -> int:
+        with self._lock:
+            if self.closed:
+                raise DaisysMcpConnectionError("Websocket connection is closed.")
+            try:
+                request_id = self._websocket.generate_take(**kwargs)
+            except Exception as e:
+                error = e
+            else:
+                self._owners[request_id] = lease
+                return request_id
+        self._fail(error)
+        raise DaisysMcpConnectionError(f"Websocket connection lost: {error}") from error
+
+    def _release(self, lease: "WebsocketLease"):
+        with self._lock:
+            for request_id in lease.request_ids:
+                self._owners.pop(request_id, None)
+                # the daisys client keeps the stream of every request forever
+                self._websocket.request_streams.pop(request_id, None)
+            self._leases -= 1
+            self.last_used = time.monotonic()
+            idle = not self._leases and websocket_idle_seconds <= 0
+        if idle:
+            self.close()
+
+    def _read(self):
+        while not self.closed:
+            try:
+                event = self._session.receive(timeout=1)
+            except queue.Empty:
+                with self._lock:
+                    idle = (
+                        not self._leases
+                        and time.monotonic() - self.last_used > websocket_idle_seconds
+                    )
+                if idle:
+                    self.close()
+                continue
+            except Exception as e:
+                # closed by the server, network error or missed keepalive pong
+                self._fail(e)
+                return
+            try:
+                self._dispatch(event)
+            except Exception as e:
+                self._fail(e)
+                return
+
+    def _dispatch(self, event):
+        """Let the daisys client route one message to the callbacks of its take."""
+        from daisys.v1.speak import (  # type: ignore
+            DaisysWebsocketGenerateError,
+            DaisysWebsocketStreamError,
+        )
+
+        with self._lock:
+            self._prefetched.event = event
+            try:
+                self._websocket.update(timeout=0)
+            except DaisysWebsocketGenerateError as e:
+                owner = self._owners.get(e.request_id)  # type: ignore
+                if owner is not None:
+                    owner._put(None, e)
+            except DaisysWebsocketStreamError as e:
+                # fails the take it belongs to, not the shared connection;
+                # audio of a take whose lease was already released is dropped
+                owner = self._owners.get(e.request_id)  # type: ignore
+                if owner is not None:
+                    owner._put(None, e)
+
+    def _fail(self, error: Exception):
+        if self.closed:
+            return
+        message = f"Websocket connection lost: {str(error) or type(error).__name__}"
+        with self._lock:
+            owners = set(self._owners.values())
+        for owner in owners:
+            owner._put(None, DaisysMcpConnectionError(message))
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        if self._on_close:
+            self._on_close(self)
+        try:
+            self._websocket.ws = self._session
+            self._websocket.disconnect()
+        except Exception:
+            pass
+        if self._client is not None:
+            self._client.close()
+
+
+class WebsocketLease:
+    """
+    A caller's use of a shared connection, with the interface of a daisys websocket.
+
+    ``generate_take`` submits a take on the shared connection; its callbacks
+    are queued and run by ``update`` on the caller's own thread, one message
+    per call, like ``DaisysSyncSpeakWebsocketV1.update``.
+    """
+
+    def __init__(self, connection: WebsocketConnection):
+        self.connection = connection
+        self.request_ids: list[int] = []
+        self._events: queue.Queue = queue.Queue()
+
+    def _put(self, callback, *args, **kwargs):
+        self._events.put((callback, args, kwargs))
+
+    def _queued(self, callback):
+        if callback is None:
+            return None
+        return lambda *args, **kwargs: self._put(callback, *args, **kwargs)
+
+    def generate_take(self, status_callback=None, audio_callback=None, **kwargs) -> int:
+        request_id = self.connection._submit(
+            self,
+            status_callback=self._queued(status_callback),
+            audio_callback=self._queued(audio_callback),
+            **kwargs,
+        )
+        self.request_ids.append(request_id)
+        return request_id
+
+    def update(self, timeout: Optional[float] = 1):
+        """Run the callback of the next message, waiting up to ``timeout`` seconds."""
+        try:
+            callback, args, kwargs = self._events.get(timeout=timeout)
+        except queue.Empty:
+            return
+        if callback is None:
+            raise args[0]
+        callback(*args, **kwargs)
+
+    def close(self):
+        self.connection._release(self)
+
+
+class WebsocketPool:
+    """
+    Warm websocket connections, one per model, reused across requests.
+
+    Opening a websocket costs a few round trips (voice lookup, worker URL,
+    TCP/TLS and websocket handshakes); on short utterances that dominates
+    the time to the first audio chunk. Connections are keyed by model, since
+    a websocket is bound to one model and serves all of its voices. Opening
+    one is retried with exponential backoff, and idle connections are
+    closed after ``idle_seconds``.
+    """
+
+    def __init__(self, connect_attempts: int = 3, connect_backoff: float = 0.25):
+        self.connect_attempts = max(connect_attempts, 1)
+        self.connect_backoff = connect_backoff
+        self._lock = threading.Lock()
+        self._connections: Dict[str, WebsocketConnection] = {}
+        self._connect_locks: Dict[str, threading.Lock] = {}
+        self._closed = False
+
+    def _forget(self, connection: WebsocketConnection):
+        with self._lock:
+            if self._connections.get(connection.model) is connection:
+                del self._connections[connection.model]
+
+    def _open(self, model: str) -> WebsocketConnection:
+        for attempt in itertools.count():
+            client = ExitStack()
+            try:
+                speak = client.enter_context(speak_client())
+                with timed("websocket_connect"):
+                    websocket = speak.websocket(model=model)
+                    websocket.reconnect()
+                return WebsocketConnection(
+                    model, websocket, on_close=self._forget, client=client
+                )
+            except Exception:
+                client.close()
+                if attempt + 1 >= self.connect_attempts:
+                    raise
+                time.sleep(self.connect_backoff * 2**attempt)
+        raise AssertionError("unreachable")
+
+    def lease(self, model: str) -> WebsocketLease:
+        """Use the warm connection of ``model``, opening one if there is none."""
+        with self._lock:
+            if self._closed:
+                throw_mcp_error("Websocket pool is closed.")
+            connect_lock = self._connect_locks.setdefault(model, threading.Lock())
+        # one caller opens the connection, the others wait for it
+        with connect_lock:
+            while True:
+                with self._lock:
+                    connection = self._connections.get(model)
+                if connection is None:
+                    connection = self._open(model)
+                    with self._lock:
+                        self._connections[model] = connection
+                lease = connection.lease()
+                if lease is not None:
+                    return lease
+                self._forget(connection)
+
+    @contextmanager
+    def websocket(
+        self, model: Optional[str] = None, voice_id: Optional[str] = None
+    ) -> Iterator[WebsocketLease]:
+        """Borrow the connection of a model, or of the model of ``voice_id``."""
+        if model is None:
+            model = voice_models([voice_id]).get(voice_id)  # type: ignore
+            if model is None:
+                throw_mcp_error(f"Voice {voice_id} not found.")
+        lease = self.lease(model)  # type: ignore
+        try:
+            yield lease
+        finally:
+            lease.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            connections = list(self._connections.values())
+        return {
+            "connections": len(connections),
+            "takes_in_flight": sum(len(c._owners) for c in connections),
+        }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            connections = list(self._connections.values())
+        for connection in connections:
+            connection.close()
+
+
+_pool: Optional[WebsocketPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_websocket_pool() -> WebsocketPool:
+    """Return the process-wide websocket pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WebsocketPool(
+                    websocket_connect_attempts, websocket_connect_backoff
+                )
+                atexit.register(_pool.close)
+    return _pool
+
+
+@contextmanager
+def pooled_websocket(
+    model: Optional[str] = None, voice_id: Optional[str] = None
+) -> Iterator[WebsocketLease]:
+    """Shortcut for ``get_websocket_pool().websocket(...)``."""
+    with get_websocket_pool().websocket(model=model, voice_id=voice_id) as ws:
+        yield ws
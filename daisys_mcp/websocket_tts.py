@@ -1,102 +1,284 @@
 import os
+import threading
 import time
-import numpy as np  # type: ignore
-import sounddevice as sd  # type: ignore
-import wave
-from typing import Optional
-
-from daisys import DaisysAPI  # type: ignore
-from daisys.v1.speak import (  # type: ignore
-    DaisysWebsocketGenerateError,
-    Status,
-    StreamOptions,
-    StreamMode,
-)
-
-from daisys_mcp.utils import throw_mcp_error
-import io
+from typing import Callable, Optional
 
-from dotenv import load_dotenv  # type: ignore
-
-load_dotenv()
+from daisys_mcp.websocket_pool import pooled_websocket
+from daisys_mcp.audio import (
+    AudioSink,
+    EncodedSink,
+    SpillingWavSink,
+    estimate_pcm_bytes,
+    parse_wav_header,
+    resample_audio,
+    split_wav_header,
+)
+from daisys_mcp.metrics import (
+    audio_bytes_total,
+    characters_total,
+    observe_stage,
+    record_error,
+    timed,
+)
+from daisys_mcp.model import Status
+from daisys_mcp.resilience import (
+    call_with_retry,
+    hedge_delay,
+    hedges_total,
+    resubmit_lost_takes,
+)
+from daisys_mcp.scheduler import acquire, try_acquire
+from daisys_mcp.playback import get_playback_engine
+from daisys_mcp.takes import remember_take, reuse_take
+from daisys_mcp.utils import DaisysMcpTimeoutError, throw_mcp_error
 
 disable_audio_playback = os.getenv("DISABLE_AUDIO_PLAYBACK", "false").lower() == "true"
-email = os.environ.get("DAISYS_EMAIL")
-password = os.environ.get("DAISYS_PASSWORD")
 storage_path = os.environ.get("DAISYS_BASE_STORAGE_PATH")
+# A take may run for the base timeout plus the per character timeout times its length.
+websocket_timeout_seconds = float(os.getenv("DAISYS_WEBSOCKET_TIMEOUT_SECONDS", "30"))
+websocket_timeout_per_char = float(
+    os.getenv("DAISYS_WEBSOCKET_TIMEOUT_PER_CHAR_SECONDS", "0.1")
+)
 
 
-def text_to_speech_websocket(text: str, voice_id: Optional[str] = None):
+def take_deadline(text: str) -> float:
+    """Seconds a take of ``text`` may run before it is considered timed out."""
+    return websocket_timeout_seconds + websocket_timeout_per_char * len(text)
+
+
+def text_to_speech_websocket(
+    text: str,
+    voice_id: Optional[str] = None,
+    sink: Optional[AudioSink] = None,
+    on_chunk: Optional[Callable[[int], None]] = None,
+    playback: bool = True,
+    audio_format: str = "wav",
+    sample_rate: Optional[int] = None,
+):
     """
-    Generate and return WAV audio from text using DaisysAPI's WebSocket protocol.
+    Generate audio from text using DaisysAPI's WebSocket protocol.
+
+    Every PCM chunk is handed to ``sink`` as soon as it arrives and
+    ``on_chunk`` is called with the number of audio bytes received so far.
+    Without a sink the audio is collected in memory, encoded as
+    ``audio_format`` ("wav", "mp3" or "opus") while it streams, and a
+    read-only view of the file is returned (a long WAV take spills to a
+    temporary file and is returned mapped from it, see ``SpillingWavSink``);
+    otherwise the closed sink is returned. ``playback=False`` skips playing
+    the audio while it streams in.
+    ``sample_rate`` resamples the collected audio: compressed audio on its way
+    into the encoder, WAV once the take is complete.
+
+    The format of the audio (sample rate, channels) is read from the WAV
+    header the stream starts with and handed to the sink before the first
+    chunk; only 16 bit audio is supported.
+
+    The take may run for ``take_deadline(text)`` seconds; after that
+    ``DaisysMcpTimeoutError`` is raised with the audio received so far.
+    A broken connection is retried within that deadline, as long as the
+    take was not submitted yet (or, with ``DAISYS_RESUBMIT_LOST_TAKES``,
+    no audio was received yet). With hedging on, a duplicate take is submitted
+    when the first chunk is late and the first one to stream is kept.
+
+    A take of the same text and voice generated before is downloaded again
+    and handed to the sink (and played) at once, instead of generated.
     """
+    from daisys.v1.speak import (  # type: ignore
+        DaisysWebsocketGenerateError,
+        StreamOptions,
+        StreamMode,
+    )
 
-    if not email or not password:
-        raise throw_mcp_error("DAISYS_EMAIL and DAISYS_PASSWORD must be set.")
+    return_bytes = sink is None
+    if sink is None and audio_format == "wav":
+        sink = SpillingWavSink(capacity=estimate_pcm_bytes(text))
+    elif sink is None:
+        sink = EncodedSink(audio_format=audio_format, output_rate=sample_rate)
+    utterance = None
+    play = playback and not disable_audio_playback
 
-    wav_buffer = io.BytesIO()
-    audio_chunks = []
-    stream = None
+    finished = threading.Event()
+    submitted = first_chunk = 0.0
+    # whether the take reached the connection, it may be generating upstream
+    sent = False
+    ready = False
+    done = False
+    failed = None
+    # request ids of the take and its hedge, the one that streams first wins
+    requests: list = []
+    failures: set = set()
+    winner = None
+    take_id = None
 
-    if not disable_audio_playback:
-        stream = sd.OutputStream(
-            samplerate=22050,  # or check from the actual stream
-            channels=1,
-            dtype="int16",
-        )
-        stream.start()
-
-    with DaisysAPI("speak", email=email, password=password) as speak:
-        with speak.websocket(voice_id=voice_id) as ws:
-            done = False
-            ready = False
-            generated_take = None
-            t0 = time.time()
-
-            def audio_cb(request_id, take_id, part_id, chunk_id, audio):
-                nonlocal done
-
-                if audio:
-                    audio_np = np.frombuffer(audio, dtype=np.int16)
-                    if not disable_audio_playback:
-                        stream.write(audio_np) if stream else None
-                    audio_chunks.append(audio)
-
-                else:
-                    if chunk_id in [0, None]:
-                        done = True
-
-            def status_cb(request_id, take):
-                nonlocal ready, generated_take
-                generated_take = take
-                if take.status == Status.READY:
-                    ready = True
-
-            ws.generate_take(
+    def owns(request_id) -> bool:
+        nonlocal winner
+        if winner is None:
+            winner = request_id
+        return request_id == winner
+
+    def outlived(request_id) -> bool:
+        """Whether a failed request can be ignored, its hedge still running."""
+        if winner is not None:
+            return request_id != winner
+        failures.add(request_id)
+        return len(failures) < len(requests)
+
+    def begin(header: bytes):
+        nonlocal utterance
+        sample_rate, channels, sample_width = parse_wav_header(header)
+        if sample_width != 2:
+            throw_mcp_error(f"Unsupported sample width of {sample_width} bytes.")
+        sink.set_format(sample_rate, channels)
+        if play:
+            # Chunks are handed to the playback engine, which never
+            # blocks, so a slow audio device cannot hold up the take.
+            utterance = get_playback_engine().enqueue(text, sample_rate, channels)
+
+    def write(audio):
+        if utterance:
+            utterance.write(audio)
+        sink.write(audio)
+        if on_chunk:
+            on_chunk(sink.bytes_written)
+
+    def audio_cb(request_id, take_id, part_id, chunk_id, audio):
+        nonlocal done, first_chunk
+
+        if not owns(request_id):
+            return
+        if audio:
+            if not first_chunk:
+                first_chunk = time.perf_counter()
+                observe_stage("first_chunk", first_chunk - submitted)
+            # the first chunk of every part carries its own wav header
+            if chunk_id in [0, None]:
+                header, audio = split_wav_header(audio)
+                if header is not None and not sink.bytes_written:
+                    begin(header)
+            write(audio)
+
+        elif chunk_id in [0, None]:
+            done = True
+            if ready:
+                finished.set()
+
+    def status_cb(request_id, take):
+        nonlocal ready, failed, take_id
+        if take.status == Status.READY and owns(request_id):
+            ready = True
+            take_id = take.take_id
+            if done:
+                finished.set()
+        elif take.status in [Status.ERROR, Status.TIMEOUT]:
+            if outlived(request_id):
+                return
+            failed = take.status.value
+            finished.set()
+
+    def stream_take():
+        nonlocal submitted, first_chunk, ready, done, failed, winner, take_id
+        nonlocal finished, sent
+        # a retry starts over, nothing of the failed attempt was handed on
+        finished = threading.Event()
+        first_chunk = 0.0
+        ready = done = sent = False
+        failed = winner = take_id = None
+        requests.clear()
+        failures.clear()
+
+        # wait for our turn before holding a connection
+        acquire(len(text))
+        # a warm connection of the voice's model, shared with other takes
+        with timed("websocket_take"), pooled_websocket(voice_id=voice_id) as ws:
+            take = dict(
                 voice_id=voice_id,
                 text=text,
                 status_callback=status_cb,
                 audio_callback=audio_cb,
                 stream_options=StreamOptions(mode=StreamMode.CHUNKS),
             )
+            submitted = time.perf_counter()
+            requests.append(ws.generate_take(**take))
+            sent = True
+            hedge_after = hedge_delay()
 
-            while not (ready and done) and (time.time() - t0) < 60:
+            # update() returns as soon as a message arrives, so the loop
+            # ends right after the message that completes the take.
+            while not finished.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if hedge_after is not None and not first_chunk:
+                    wait = submitted + hedge_after - time.perf_counter()
+                    if wait <= 0:
+                        # slower than usual, a duplicate may overtake it; not
+                        # when it would have to wait for a turn of its own
+                        if try_acquire(len(text)):
+                            hedges_total.inc(outcome="sent")
+                            requests.append(ws.generate_take(**take))
+                        hedge_after = None
+                        continue
+                    remaining = min(remaining, wait)
                 try:
-                    ws.update(timeout=5)
+                    ws.update(timeout=remaining)
                 except DaisysWebsocketGenerateError as e:
-                    throw_mcp_error(e)
-                    break
+                    if not outlived(e.request_id):
+                        throw_mcp_error(e)
+            if finished.is_set():
+                observe_stage("last_chunk", time.perf_counter() - submitted)
+                if len(requests) > 1 and winner == requests[-1]:
+                    hedges_total.inc(outcome="won")
 
-    # Combine audio chunks and write to wav buffer
-    combined_audio = b"".join(audio_chunks)
-    with wave.open(wav_buffer, "wb") as wav_file:
-        wav_file.setnchannels(1)
-        wav_file.setsampwidth(2)
-        wav_file.setframerate(22050)
-        wav_file.writeframes(combined_audio)
+    def retryable(error: BaseException) -> bool:
+        # a submitted take is only sent again when that is allowed, it may
+        # have been accepted before the connection was lost
+        return (
+            utterance is None
+            and not sink.bytes_written
+            and time.monotonic() < deadline
+            and (not sent or resubmit_lost_takes)
+        )
 
-    if not disable_audio_playback:
-        stream.stop() if stream else None
-        stream.close() if stream else None
+    timeout = take_deadline(text)
+    deadline = time.monotonic() + timeout
+    # an earlier take of the same text is downloaded instead of generated
+    reused = reuse_take(text, voice_id, None, "websocket", "wav")
+    header, pcm = split_wav_header(reused) if reused is not None else (None, b"")
+    try:
+        if header is not None:
+            begin(header)
+            # the data size, if set, excludes sections after the audio
+            size = int.from_bytes(header[-4:], "little")
+            write(pcm[:size] if 0 < size < len(pcm) else pcm)
+            finished.set()
+        else:
+            # connection failures before any audio arrived are retried
+            call_with_retry("websocket", stream_take, retryable=retryable)
+    except BaseException:
+        if utterance:
+            get_playback_engine().cancel(utterance.utterance_id)
+        raise
+    finally:
+        sink.close()
+        if utterance:
+            utterance.finish()
 
-    return wav_buffer.getvalue()
+    if header is None:
+        characters_total.inc(len(text), protocol="websocket")
+        audio_bytes_total.inc(sink.bytes_written, protocol="websocket")
+    if failed:
+        throw_mcp_error(f"Take ended with status {failed}.")
+    if finished.is_set() and header is None:
+        remember_take(text, voice_id, None, "websocket", take_id)
+    result = sink.getbuffer() if return_bytes else sink
+    if return_bytes and audio_format == "wav" and sample_rate:
+        result = resample_audio(result, "wav", sample_rate)
+    if not finished.is_set():
+        error = DaisysMcpTimeoutError(
+            f"Take did not finish within {timeout:g} seconds, "
+            f"received {sink.bytes_written} bytes of audio.",
+            partial=result,
+        )
+        record_error("websocket_take", error)
+        raise error
+    return result
@@ -0,0 +1,350 @@
+"""Offline benchmark for the MCP tools, against the fake speak service.
+
+Starts ``fake_speak`` in a background thread, launches the MCP server over
+stdio exactly like a client would and drives it through ``ClientSession``.
+For every scenario it reports p50/p95/p99 latency, the time until the first
+progress notification (time-to-first-chunk for streaming tools) and
+throughput.
+
+    python tests/benchmark/bench.py --iterations 20 --concurrency 4
+    python tests/benchmark/bench.py --json results.json
+    python tests/benchmark/bench.py --baseline results.json --max-regression 0.5
+
+With ``--baseline`` the run fails when a scenario's p95 grew by more than
+``--max-regression`` (a fraction) compared to the baseline results.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, TextIO
+
+import mcp.types as types  # type: ignore
+import uvicorn  # type: ignore
+from mcp import ClientSession  # type: ignore
+from mcp.client.stdio import StdioServerParameters, stdio_client  # type: ignore
+
+from fake_speak import FakeSpeakConfig, create_app
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+# Seconds the fake speak service may take to start listening.
+STARTUP_TIMEOUT_SECONDS = 10.0
+
+LONG_TEXT = " ".join(
+    f"This is sentence number {i} of a longer text that gets segmented."
+    for i in range(15)
+)
+
+
+@dataclass
+class Scenario:
+    name: str
+    tool: str
+    arguments: dict
+    # arguments that contain "{i}" get the iteration number, so every call
+    # is a distinct request
+    unique: bool = True
+
+
+def default_scenarios() -> List[Scenario]:
+    return [
+        Scenario("get_voices", "get_voices", {}, unique=False),
+        Scenario("get_models", "get_models", {"language": "en"}, unique=False),
+        Scenario(
+            "tts_websocket",
+            "text_to_speech",
+            {"text": "Benchmark sentence {i}, streamed over the websocket."},
+        ),
+        Scenario(
+            "tts_http_mp3",
+            "text_to_speech",
+            {
+                "text": "Benchmark sentence {i}, over http.",
+                "audio_format": "mp3",
+                "streaming": False,
+            },
+        ),
+        Scenario("tts_segmented", "text_to_speech", {"text": "{i}. " + LONG_TEXT}),
+        Scenario(
+            "tts_batch",
+            "text_to_speech_batch",
+            {"items": [{"text": f"Batch item {n} of call {{i}}."} for n in range(8)]},
+        ),
+    ]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    calls: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    first_progress_p50_ms: Optional[float]
+    throughput_per_s: float
+    error_messages: List[str] = field(default_factory=list)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class FakeSpeakServer:
+    """Runs the fake speak service with uvicorn in a background thread."""
+
+    def __init__(self, config: Optional[FakeSpeakConfig] = None):
+        self.config = config or FakeSpeakConfig.from_env()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(create_app(self.config), ws="wsproto", log_level="warning")
+        )
+        self._thread = threading.Thread(
+            target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError(
+                    "The fake speak service exited during startup; "
+                    "is a websocket backend (wsproto) installed?"
+                )
+            if time.monotonic() > deadline:
+                self._server.should_exit = True
+                raise RuntimeError(
+                    "The fake speak service did not start within "
+                    f"{STARTUP_TIMEOUT_SECONDS:g} seconds."
+                )
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+class ProgressRecordingSession(ClientSession):
+    """Client session that records when the first progress notification of a call arrives."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first_progress: Dict[int, float] = {}
+
+    async def _received_notification(self, notification):
+        root = notification.root
+        if isinstance(root, types.ProgressNotification):
+            self.first_progress.setdefault(
+                root.params.progressToken, time.perf_counter()
+            )
+
+
+def _format(arguments, i: int):
+    if isinstance(arguments, str):
+        return arguments.replace("{i}", str(i))
+    if isinstance(arguments, dict):
+        return {key: _format(value, i) for key, value in arguments.items()}
+    if isinstance(arguments, list):
+        return [_format(value, i) for value in arguments]
+    return arguments
+
+
+async def _run_scenario(
+    session: ProgressRecordingSession,
+    scenario: Scenario,
+    iterations: int,
+    concurrency: int,
+    tokens,
+) -> ScenarioResult:
+    latencies: List[float] = []
+    first_progress: List[float] = []
+    errors: List[str] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(i: int):
+        arguments = (
+            _format(scenario.arguments, i) if scenario.unique else scenario.arguments
+        )
+        token = next(tokens)
+        request = types.ClientRequest(
+            types.CallToolRequest(
+                method="tools/call",
+                params=types.CallToolRequestParams(
+                    name=scenario.tool,
+                    arguments=arguments,
+                    _meta={"progressToken": token},
+                ),
+            )
+        )
+        async with semaphore:
+            start = time.perf_counter()
+            result = await session.send_request(request, types.CallToolResult)
+            latencies.append(time.perf_counter() - start)
+        if result.isError:
+            errors.append(result.content[0].text if result.content else "error")
+        if token in session.first_progress:
+            first_progress.append(session.first_progress.pop(token) - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(iterations)))
+    elapsed = time.perf_counter() - start
+
+    return ScenarioResult(
+        name=scenario.name,
+        calls=iterations,
+        errors=len(errors),
+        p50_ms=percentile(latencies, 50) * 1000,
+        p95_ms=percentile(latencies, 95) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        first_progress_p50_ms=(
+            percentile(first_progress, 50) * 1000 if first_progress else None
+        ),
+        throughput_per_s=iterations / elapsed if elapsed else math.inf,
+        error_messages=errors[:5],
+    )
+
+
+async def run_benchmark(
+    scenarios: Optional[List[Scenario]] = None,
+    iterations: int = 10,
+    concurrency: int = 4,
+    config: Optional[FakeSpeakConfig] = None,
+    server_env: Optional[Dict[str, str]] = None,
+    server_log: Optional[TextIO] = None,
+) -> List[ScenarioResult]:
+    """Run the scenarios against a fresh MCP server and fake speak service."""
+    scenarios = scenarios or default_scenarios()
+    results = []
+    with (
+        FakeSpeakServer(config) as fake,
+        tempfile.TemporaryDirectory() as storage,
+        open(os.devnull, "w") as devnull,
+    ):
+        env = dict(os.environ)
+        env.update(
+            {
+                "DAISYS_EMAIL": "benchmark@example.com",
+                "DAISYS_PASSWORD": "benchmark",
+                "DAISYS_API_URL": fake.url,
+                "DAISYS_AUTH_URL": fake.url,
+                "DISABLE_AUDIO_PLAYBACK": "true",
+                "DAISYS_BASE_STORAGE_PATH": storage,
+                "DAISYS_CACHE_ENABLED": "false",
+            }
+        )
+        env.update(server_env or {})
+        params = StdioServerParameters(
+            command=sys.executable,
+            args=["-m", "daisys_mcp.server"],
+            env=env,
+            cwd=str(REPO_ROOT),
+        )
+        tokens = itertools.count(1)
+        async with stdio_client(params, errlog=server_log or devnull) as (
+            reader,
+            writer,
+        ):
+            async with ProgressRecordingSession(reader, writer) as session:
+                await session.initialize()
+                for scenario in scenarios:
+                    # warm up sessions, catalogs and connections first
+                    await _run_scenario(session, scenario, 1, 1, tokens)
+                    results.append(
+                        await _run_scenario(
+                            session, scenario, iterations, concurrency, tokens
+                        )
+                    )
+    return results
+
+
+def print_results(results: List[ScenarioResult]):
+    header = f"{'scenario':<16}{'calls':>6}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'first ms':>10}{'calls/s':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        first = f"{r.first_progress_p50_ms:.1f}" if r.first_progress_p50_ms else "-"
+        print(
+            f"{r.name:<16}{r.calls:>6}{r.errors:>7}{r.p50_ms:>9.1f}{r.p95_ms:>9.1f}"
+            f"{r.p99_ms:>9.1f}{first:>10}{r.throughput_per_s:>9.2f}"
+        )
+        for message in r.error_messages:
+            print(f"    {message[:120]}")
+
+
+def compare(
+    results: List[ScenarioResult], baseline: List[dict], max_regression: float
+) -> List[str]:
+    """Scenarios whose p95 regressed more than ``max_regression`` against the baseline."""
+    previous = {entry["name"]: entry for entry in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get(r.name)
+        if before and r.p95_ms > before["p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"{r.name}: p95 {r.p95_ms:.1f} ms, baseline {before['p95_ms']:.1f} ms"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenario", action="append", help="Only run these scenarios")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.5)
+    parser.add_argument(
+        "--server-log", action="store_true", help="Show the MCP server's log output"
+    )
+    args = parser.parse_args()
+
+    scenarios = default_scenarios()
+    if args.scenario:
+        scenarios = [s for s in scenarios if s.name in args.scenario]
+    results = asyncio.run(
+        run_benchmark(
+            scenarios,
+            args.iterations,
+            args.concurrency,
+            server_log=sys.stderr if args.server_log else None,
+        )
+    )
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+    failed = any(r.errors for r in results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
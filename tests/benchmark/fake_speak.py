@@ -0,0 +1,387 @@
+"""Local stand-in for the Daisys speak API used by the offline benchmarks.
+
+Implements just enough of the auth, voices, models, takes and websocket
+endpoints for the ``daisys`` client to talk to it. Latency, chunk sizes and
+failure rates are configurable so the benchmarks can model a slow or flaky
+upstream without spending credits.
+
+Run standalone with ``python tests/benchmark/fake_speak.py --port 8765`` and
+point the server at it with ``DAISYS_API_URL=http://127.0.0.1:8765``; the
+``FAKE_SPEAK_*`` environment variables tune the simulated upstream.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import time
+import uuid
+import wave
+from dataclasses import dataclass
+
+import numpy as np  # type: ignore
+import uvicorn  # type: ignore
+from starlette.applications import Starlette  # type: ignore
+from starlette.requests import Request  # type: ignore
+from starlette.responses import JSONResponse, Response  # type: ignore
+from starlette.routing import Route, WebSocketRoute  # type: ignore
+from starlette.websockets import WebSocket, WebSocketDisconnect  # type: ignore
+
+
+@dataclass
+class FakeSpeakConfig:
+    sample_rate: int = 22050
+    chunk_bytes: int = 8820
+    chunk_delay: float = 0.01
+    first_chunk_delay: float = 0.05
+    take_delay: float = 0.05
+    seconds_per_char: float = 0.06
+    failure_rate: float = 0.0
+
+    @classmethod
+    def from_env(cls) -> "FakeSpeakConfig":
+        return cls(
+            sample_rate=int(os.getenv("FAKE_SPEAK_SAMPLE_RATE", 22050)),
+            chunk_bytes=int(os.getenv("FAKE_SPEAK_CHUNK_BYTES", 8820)),
+            chunk_delay=float(os.getenv("FAKE_SPEAK_CHUNK_DELAY", 0.01)),
+            first_chunk_delay=float(os.getenv("FAKE_SPEAK_FIRST_CHUNK_DELAY", 0.05)),
+            take_delay=float(os.getenv("FAKE_SPEAK_TAKE_DELAY", 0.05)),
+            seconds_per_char=float(os.getenv("FAKE_SPEAK_SECONDS_PER_CHAR", 0.06)),
+            failure_rate=float(os.getenv("FAKE_SPEAK_FAILURE_RATE", 0.0)),
+        )
+
+
+MODELS = [
+    {
+        "name": "english-v3.0",
+        "displayname": "English v3.0",
+        "flags": [],
+        "languages": ["en-GB", "en-US"],
+        "genders": ["male", "female", "nonbinary"],
+        "styles": [["base"]],
+        "prosody_types": ["simple", "affect"],
+        "voice_inputs": ["gender"],
+    },
+    {
+        "name": "dutch-v1.0",
+        "displayname": "Dutch v1.0",
+        "flags": [],
+        "languages": ["nl-NL"],
+        "genders": ["male", "female"],
+        "styles": [["base"]],
+        "prosody_types": ["simple"],
+        "voice_inputs": ["gender"],
+    },
+    {
+        "name": "german-v1.0",
+        "displayname": "German v1.0",
+        "flags": [],
+        "languages": ["de-DE"],
+        "genders": ["male", "female"],
+        "styles": [["base"]],
+        "prosody_types": ["simple"],
+        "voice_inputs": ["gender"],
+    },
+]
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class FakeSpeakState:
+    def __init__(self, config: FakeSpeakConfig):
+        self.config = config
+        self.voices: dict[str, dict] = {}
+        self.takes: dict[str, dict] = {}
+        self.audio: dict[str, bytes] = {}
+        self.counters = {"login": 0, "generate_take": 0, "websocket": 0}
+        for name, gender, model in [
+            ("Alice", "female", "english-v3.0"),
+            ("Bob", "male", "english-v3.0"),
+            ("Daan", "male", "dutch-v1.0"),
+        ]:
+            self.add_voice(name, gender, model)
+
+    def add_voice(self, name: str, gender: str, model: str, **extra) -> dict:
+        voice = {
+            "voice_id": f"v{uuid.uuid4().hex[:16]}",
+            "name": name,
+            "gender": gender,
+            "model": model,
+            "description": extra.get("description"),
+            "default_prosody": extra.get("default_prosody"),
+            "status": "ready",
+            "timestamp_ms": _now_ms(),
+        }
+        self.voices[voice["voice_id"]] = voice
+        return voice
+
+    def pcm_for(self, text: str) -> bytes:
+        cfg = self.config
+        n = max(int(len(text) * cfg.seconds_per_char * cfg.sample_rate), 1)
+        t = np.arange(n, dtype=np.float32) / cfg.sample_rate
+        tone = 0.2 * np.sin(2 * np.pi * (220 + (hash(text) % 200)) * t)
+        return (tone * 32767).astype("<i2").tobytes()
+
+    def new_take(self, data: dict) -> dict:
+        self.counters["generate_take"] += 1
+        take = {
+            "take_id": f"t{uuid.uuid4().hex[:16]}",
+            "voice_id": data.get("voice_id"),
+            "text": data.get("text", ""),
+            "status": "started",
+            "timestamp_ms": _now_ms(),
+        }
+        if data.get("prosody"):
+            take["prosody"] = data["prosody"]
+        self.takes[take["take_id"]] = take
+        return take
+
+    def finish_take(self, take: dict, pcm: bytes) -> None:
+        take["status"] = "ready"
+        take["info"] = {
+            "duration": len(pcm) // 2,
+            "audio_rate": self.config.sample_rate,
+            "normalized_text": [take["text"]],
+        }
+        self.audio[take["take_id"]] = pcm
+
+    def should_fail(self) -> bool:
+        return random.random() < self.config.failure_rate
+
+
+def wav_bytes(pcm: bytes, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def encode_audio(pcm: bytes, sample_rate: int, audio_format: str) -> bytes:
+    if audio_format == "wav":
+        return wav_bytes(pcm, sample_rate)
+    import soundfile as sf  # type: ignore
+
+    buffer = io.BytesIO()
+    subtype = {"mp3": "MPEG_LAYER_III", "flac": "PCM_16"}.get(audio_format)
+    sf.write(
+        buffer,
+        np.frombuffer(pcm, dtype="<i2"),
+        sample_rate,
+        format=audio_format.upper(),
+        subtype=subtype,
+    )
+    return buffer.getvalue()
+
+
+def create_app(config: FakeSpeakConfig | None = None) -> Starlette:
+    state = FakeSpeakState(config or FakeSpeakConfig.from_env())
+
+    async def login(request: Request):
+        state.counters["login"] += 1
+        body = await request.json()
+        if not body.get("email") or not body.get("password"):
+            return JSONResponse({"detail": "bad credentials"}, status_code=401)
+        return JSONResponse(
+            {"access_token": uuid.uuid4().hex, "refresh_token": uuid.uuid4().hex}
+        )
+
+    async def refresh(request: Request):
+        return JSONResponse(
+            {"access_token": uuid.uuid4().hex, "refresh_token": uuid.uuid4().hex}
+        )
+
+    async def logout(request: Request):
+        return JSONResponse(True)
+
+    async def voices(request: Request):
+        ids = request.query_params.get("voice_id")
+        found = list(state.voices.values())
+        if ids:
+            found = [state.voices[i] for i in ids.split(",") if i in state.voices]
+        return JSONResponse(found)
+
+    async def voice(request: Request):
+        voice_id = request.path_params["voice_id"]
+        if voice_id not in state.voices:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        if request.method == "DELETE":
+            del state.voices[voice_id]
+            return JSONResponse(True)
+        return JSONResponse(state.voices[voice_id])
+
+    async def generate_voice(request: Request):
+        body = await request.json()
+        voice = state.add_voice(
+            body["name"],
+            body["gender"],
+            body["model"],
+            description=body.get("description"),
+            default_prosody=body.get("default_prosody"),
+        )
+        return JSONResponse(voice)
+
+    async def models(request: Request):
+        return JSONResponse(MODELS)
+
+    async def model(request: Request):
+        for m in MODELS:
+            if m["name"] == request.path_params["name"]:
+                return JSONResponse(m)
+        return JSONResponse({"detail": "not found"}, status_code=404)
+
+    async def generate_take(request: Request):
+        body = await request.json()
+        take = state.new_take(body)
+        await asyncio.sleep(state.config.take_delay)
+        if state.should_fail():
+            take["status"] = "error"
+        else:
+            state.finish_take(take, state.pcm_for(take["text"]))
+        return JSONResponse(take)
+
+    async def takes(request: Request):
+        ids = request.query_params.get("take_id", "")
+        return JSONResponse(
+            [state.takes[i] for i in ids.split(",") if i in state.takes]
+        )
+
+    async def take(request: Request):
+        take_id = request.path_params["take_id"]
+        if take_id not in state.takes:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        return JSONResponse(state.takes[take_id])
+
+    async def take_audio(request: Request):
+        take_id = request.path_params["take_id"]
+        if take_id not in state.audio:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        audio_format = request.path_params["format"]
+        return Response(
+            encode_audio(state.audio[take_id], state.config.sample_rate, audio_format),
+            media_type=f"audio/{audio_format}",
+        )
+
+    async def websocket_url(request: Request):
+        host = request.url.hostname
+        port = request.url.port
+        return JSONResponse({"worker_websocket_url": f"ws://{host}:{port}/ws"})
+
+    async def counters(request: Request):
+        return JSONResponse(state.counters)
+
+    async def stream_take(
+        ws: WebSocket, request_id: int, data: dict, lock, stream: bool = True
+    ):
+        cfg = state.config
+        take = state.new_take(data)
+
+        async def send_status():
+            async with lock:
+                await ws.send_text(json.dumps({"request_id": request_id, "data": take}))
+
+        async def send_chunk(part_id: int, chunk_id: int, audio: bytes):
+            meta = json.dumps(
+                {"request_id": request_id, "part_id": part_id, "chunk_id": chunk_id}
+            ).encode()
+            message = b"JSON" + len(meta).to_bytes(4, "little") + meta + audio
+            async with lock:
+                await ws.send_bytes(message)
+
+        await send_status()
+        if state.should_fail():
+            async with lock:
+                await ws.send_text(
+                    json.dumps(
+                        {
+                            "status": "error",
+                            "message": "Simulated failure",
+                            "request_id": request_id,
+                        }
+                    )
+                )
+            return
+
+        pcm = state.pcm_for(take["text"])
+        await asyncio.sleep(cfg.first_chunk_delay)
+        if not stream:
+            # without stream options only the status messages are sent
+            await asyncio.sleep(cfg.chunk_delay * len(pcm) / cfg.chunk_bytes)
+            state.finish_take(take, pcm)
+            await send_status()
+            return
+        header = wav_bytes(b"", cfg.sample_rate)
+        step = max(cfg.chunk_bytes - cfg.chunk_bytes % 2, 2)
+        for chunk_id, offset in enumerate(range(0, len(pcm), step)):
+            chunk = pcm[offset : offset + step]
+            if chunk_id == 0:
+                chunk = header + chunk
+            await send_chunk(0, chunk_id, chunk)
+            await asyncio.sleep(cfg.chunk_delay)
+        await send_chunk(0, chunk_id + 1, b"")
+        await send_chunk(1, 0, b"")
+        state.finish_take(take, pcm)
+        await send_status()
+
+    async def websocket(ws: WebSocket):
+        state.counters["websocket"] += 1
+        await ws.accept()
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                message = json.loads(await ws.receive_text())
+                if message.get("command") != "/takes/generate":
+                    continue
+                task = asyncio.create_task(
+                    stream_take(
+                        ws,
+                        message["request_id"],
+                        message["data"],
+                        lock,
+                        stream="stream" in message,
+                    )
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except WebSocketDisconnect:
+            for task in tasks:
+                task.cancel()
+
+    return Starlette(
+        routes=[
+            Route("/auth/login", login, methods=["POST"]),
+            Route("/auth/refresh", refresh, methods=["POST"]),
+            Route("/auth/logout", logout, methods=["POST"]),
+            Route("/v1/speak/voices", voices),
+            Route("/v1/speak/voices/generate", generate_voice, methods=["POST"]),
+            Route("/v1/speak/voices/{voice_id}", voice, methods=["GET", "DELETE"]),
+            Route("/v1/speak/models", models),
+            Route("/v1/speak/models/{name}", model),
+            Route("/v1/speak/takes", takes),
+            Route("/v1/speak/takes/generate", generate_take, methods=["POST"]),
+            Route("/v1/speak/takes/{take_id}", take),
+            Route("/v1/speak/takes/{take_id}/{format}", take_audio),
+            Route("/v1/speak/websocket/{model}", websocket_url),
+            Route("/_counters", counters),
+            WebSocketRoute("/ws", websocket),
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Daisys speak API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port, ws="wsproto")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest  # type: ignore
+
+from bench import (
+    ScenarioResult,
+    compare,
+    default_scenarios,
+    percentile,
+    run_benchmark,
+)
+
+# Generous ceilings against the local fake service, they catch hangs and
+# order-of-magnitude regressions rather than noise.
+MAX_P95_MS = {
+    "get_voices": 500,
+    "get_models": 500,
+    "tts_websocket": 3000,
+    "tts_http_mp3": 3000,
+    "tts_segmented": 10000,
+    "tts_batch": 5000,
+}
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_compare_flags_p95_regressions():
+    def result(name, p95):
+        return ScenarioResult(name, 10, 0, p95, p95, p95, None, 1.0)
+
+    baseline = [{"name": "fast", "p95_ms": 100.0}, {"name": "slow", "p95_ms": 100.0}]
+    results = [result("fast", 140.0), result("slow", 160.0), result("new", 999.0)]
+    regressions = compare(results, baseline, max_regression=0.5)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("slow")
+
+
+@pytest.mark.benchmark
+def test_tools_against_fake_speak_service():
+    results = asyncio.run(run_benchmark(default_scenarios(), iterations=5))
+    by_name = {r.name: r for r in results}
+    assert set(by_name) == set(MAX_P95_MS)
+    for name, result in by_name.items():
+        assert result.errors == 0, result.error_messages
+        assert result.p95_ms < MAX_P95_MS[name], f"{name} p95 {result.p95_ms:.0f} ms"
+
+    # streaming tools report their first chunk well before they finish
+    streamed = by_name["tts_websocket"]
+    assert streamed.first_progress_p50_ms is not None
+    assert streamed.first_progress_p50_ms < streamed.p50_ms
+    assert by_name["tts_segmented"].first_progress_p50_ms is not None
@@ -0,0 +1,9 @@
+import pytest
+
+import daisys_mcp.takes as takes
+
+
+@pytest.fixture(autouse=True)
+def no_take_index(monkeypatch):
+    """Takes generated by one test must not be downloaded again by another."""
+    monkeypatch.setattr(takes, "take_index_enabled", False)
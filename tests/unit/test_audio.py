@@ -0,0 +1,175 @@
+import gc
+import io
+import wave
+
+import numpy as np  # type: ignore
+import soundfile  # type: ignore
+
+from daisys_mcp.audio import (
+    Resampler,
+    SpilledAudio,
+    SpillingWavSink,
+    WavBufferSink,
+    WavFileSink,
+    open_file_sink,
+    parse_wav_header,
+    resample,
+    split_wav_header,
+    wav_header,
+)
+
+
+def read_wav(source):
+    with wave.open(source, "rb") as wav_file:
+        return wav_file.getframerate(), wav_file.readframes(wav_file.getnframes())
+
+
+def test_split_wav_header():
+    header = wav_header(4, 16000)
+    found, pcm = split_wav_header(header + b"\x01\x00\x02\x00")
+    assert found == header
+    assert pcm == b"\x01\x00\x02\x00"
+    assert split_wav_header(b"\x01\x00") == (None, b"\x01\x00")
+
+
+def test_buffer_sink_produces_valid_wav():
+    sink = WavBufferSink(sample_rate=16000)
+    sink.write(b"\x01\x00" * 10)
+    sink.write(b"\x02\x00" * 10)
+    sink.close()
+    rate, frames = read_wav(io.BytesIO(sink.getvalue()))
+    assert rate == 16000
+    assert frames == b"\x01\x00" * 10 + b"\x02\x00" * 10
+
+
+def test_file_sink_patches_header(tmp_path):
+    path = tmp_path / "out.wav"
+    sink = WavFileSink(path)
+    sink.write(b"\x01\x00" * 10)
+    sink.flush()
+    # readable while streaming, with a placeholder length
+    assert path.stat().st_size == 44 + 20
+    sink.write(b"\x02\x00" * 5)
+    sink.close()
+    rate, frames = read_wav(str(path))
+    assert rate == 22050
+    assert frames == b"\x01\x00" * 10 + b"\x02\x00" * 5
+
+
+def test_file_sink_discard(tmp_path):
+    path = tmp_path / "out.wav"
+    sink = WavFileSink(path)
+    sink.write(b"\x01\x00")
+    sink.discard()
+    assert not path.exists()
+
+
+def test_buffer_sink_grows_past_capacity_and_trims():
+    sink = WavBufferSink(capacity=4)
+    sink.write(b"\x01\x00" * 2)
+    sink.write(memoryview(b"\x02\x00" * 100)[2:])
+    sink.close()
+    view = sink.getbuffer()
+    assert view.readonly
+    assert len(view) == 44 + 4 + 198
+    rate, frames = read_wav(io.BytesIO(view))
+    assert frames == b"\x01\x00" * 2 + b"\x02\x00" * 99
+
+
+def test_spilling_sink_stays_in_memory_below_threshold(tmp_path):
+    sink = SpillingWavSink(threshold=100, directory=tmp_path)
+    sink.write(b"\x01\x00" * 50)
+    sink.close()
+    assert not isinstance(sink.getbuffer(), SpilledAudio)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spilling_sink_moves_to_a_file_past_threshold(tmp_path):
+    sink = SpillingWavSink(sample_rate=16000, threshold=64, directory=tmp_path)
+    for i in range(10):
+        sink.write(bytes([i, 0]) * 20)
+    # the in-memory buffer is released once the audio is on disk
+    assert len(sink._buffer) == 0
+    sink.close()
+
+    audio = sink.getbuffer()
+    assert isinstance(audio, SpilledAudio) and audio.path.parent == tmp_path
+    rate, frames = read_wav(io.BytesIO(audio))
+    assert rate == 16000
+    assert frames == b"".join(bytes([i, 0]) * 20 for i in range(10))
+
+    # the file goes away with the last reference to the audio
+    path = audio.path
+    del sink, audio
+    gc.collect()
+    assert not path.exists()
+
+
+def test_split_wav_header_does_not_copy_audio():
+    chunk = wav_header(4) + b"\x01\x00\x02\x00"
+    _, pcm = split_wav_header(chunk)
+    assert isinstance(pcm, memoryview)
+    assert pcm.obj is chunk
+
+
+def sine_pcm(seconds, sample_rate=22050):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (np.sin(2 * np.pi * 440 * t) * 10000).astype("<i2").tobytes()
+
+
+def test_encoded_sink_encodes_while_streaming(tmp_path):
+    pcm = sine_pcm(1)
+    for audio_format, sample_rate in [("mp3", 22050), ("opus", 24000)]:
+        sink = open_file_sink(tmp_path / f"take.{audio_format}", audio_format)
+        # odd chunk sizes split samples between chunks
+        for i in range(0, len(pcm), 4097):
+            sink.write(pcm[i : i + 4097])
+        sink.close()
+
+        assert sink.bytes_written == len(pcm)
+        info = soundfile.info(str(sink.path))
+        assert info.samplerate == sample_rate
+        assert abs(info.duration - 1) < 0.1
+        assert sink.path.stat().st_size < len(pcm) / 4
+
+
+def test_resampling_in_chunks_matches_bulk():
+    samples = np.frombuffer(sine_pcm(0.5), dtype=np.int16)
+    for rate in [8000, 16000, 48000]:
+        bulk = resample(samples, 22050, rate)
+        resampler = Resampler(22050, rate)
+        chunked = np.concatenate(
+            [resampler.process(samples[i : i + 997]) for i in range(0, 11025, 997)]
+            + [resampler.process(samples[:0], final=True)]
+        )
+        assert len(bulk) == rate // 2
+        assert np.array_equal(bulk, chunked)
+        t = np.arange(len(bulk)) / rate
+        expected = np.sin(2 * np.pi * 440 * t) * 10000
+        assert np.abs(bulk[50:-50, 0] - expected[50:-50]).max() < 5
+
+
+def test_downsampling_removes_frequencies_above_nyquist():
+    t = np.arange(22050) / 22050
+    tone = (np.sin(2 * np.pi * 10000 * t) * 10000).astype(np.int16)
+    assert np.abs(resample(tone, 22050, 8000)[50:-50]).max() < 10
+
+
+def test_sink_format_comes_from_stream_header(tmp_path):
+    header = wav_header(0, sample_rate=16000, channels=2)
+    assert parse_wav_header(header) == (16000, 2, 2)
+
+    sink = WavFileSink(tmp_path / "take.wav")
+    sink.set_format(*parse_wav_header(header)[:2])
+    sink.write(b"\x01\x00\x02\x00")
+    sink.close()
+    with wave.open(str(sink.path), "rb") as wav_file:
+        assert (wav_file.getframerate(), wav_file.getnchannels()) == (16000, 2)
+
+
+def test_file_sink_resamples_on_close(tmp_path):
+    sink = open_file_sink(tmp_path / "take.wav", "wav", output_rate=8000)
+    sink.write(sine_pcm(1))
+    sink.close()
+    rate, pcm = read_wav(str(sink.path))
+    assert (rate, len(pcm)) == (8000, 16000)
@@ -0,0 +1,210 @@
+import contextlib
+import wave
+from collections import deque
+from types import SimpleNamespace
+
+import soundfile  # type: ignore
+
+from daisys.v1.speak import DaisysWebsocketGenerateError, Status  # type: ignore
+
+import daisys_mcp.batch as batch
+import daisys_mcp.catalog as catalog
+import daisys_mcp.resilience as resilience
+from daisys_mcp.audio import wav_header
+from daisys_mcp.catalog import CatalogCache
+from daisys_mcp.model import McpBatchItem, McpVoice
+from daisys_mcp.utils import DaisysMcpConnectionError
+
+
+class FakeWebsocket:
+    """Replays the messages of all submitted takes interleaved, one per update."""
+
+    def __init__(self, model, fail_texts=()):
+        self.model = model
+        self.fail_texts = fail_texts
+        self.requests = []
+        # the messages of every take, in order; takes are interleaved
+        self.messages = []
+
+    def generate_take(self, voice_id, text, status_callback, audio_callback=None, **_):
+        request_id = len(self.requests)
+        self.requests.append(text)
+        take = SimpleNamespace(take_id=f"take-{request_id}", status=Status.READY)
+        if text in self.fail_texts:
+            error = DaisysWebsocketGenerateError("failed", request_id)
+            self.messages.append(deque([("error", error)]))
+            return request_id
+        messages = deque()
+        if audio_callback:
+            pcm = bytes([request_id, 0]) * 4
+            messages += [
+                (audio_callback, (request_id, take.take_id, 0, 0, wav_header(4) + pcm)),
+                (audio_callback, (request_id, take.take_id, 0, 1, pcm)),
+                (audio_callback, (request_id, take.take_id, 0, 2, None)),
+                (audio_callback, (request_id, take.take_id, 1, 0, None)),
+            ]
+        messages.append((status_callback, (request_id, take)))
+        self.messages.append(messages)
+        return request_id
+
+    def update(self, timeout=1):
+        self.messages = [messages for messages in self.messages if messages]
+        if not self.messages:
+            return
+        # round robin between the takes, so they finish out of order
+        self.messages.append(self.messages.pop(0))
+        callback, args = self.messages[-1].popleft()
+        if callback == "error":
+            raise args
+        callback(*args)
+
+
+class FakePool:
+    def __init__(self, fail_texts=()):
+        self.fail_texts = fail_texts
+        self.sockets = []
+
+    @contextlib.contextmanager
+    def websocket(self, model):
+        ws = FakeWebsocket(model, self.fail_texts)
+        self.sockets.append(ws)
+        yield ws
+
+
+def setup(monkeypatch, fail_texts=()):
+    pool = FakePool(fail_texts)
+    voices = [
+        McpVoice(
+            voice_id="en", name="A", gender="female", model="english", description=None
+        ),
+        McpVoice(
+            voice_id="nl", name="B", gender="male", model="dutch", description=None
+        ),
+    ]
+    monkeypatch.setattr(batch, "pooled_websocket", pool.websocket)
+    monkeypatch.setattr(
+        catalog,
+        "voice_catalog",
+        CatalogCache(lambda: voices, key=lambda v: v.voice_id),
+    )
+    monkeypatch.setattr(batch, "get_synthesis_cache", lambda: None)
+    return pool
+
+
+def test_batch_multiplexes_takes_per_model(monkeypatch, tmp_path):
+    pool = setup(monkeypatch)
+    items = [
+        McpBatchItem(text="one", voice_id="en"),
+        McpBatchItem(text="two", voice_id="en"),
+        McpBatchItem(text="drie", voice_id="nl"),
+        McpBatchItem(text="four", audio_format="mp3"),
+    ]
+    progress = []
+    results = batch.synthesize_batch(
+        items, tmp_path, "en", on_item=lambda done, total: progress.append(done)
+    )
+
+    assert [r.status for r in results] == ["ok"] * 4
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert sorted(ws.model for ws in pool.sockets) == ["dutch", "english"]
+    english = next(ws for ws in pool.sockets if ws.model == "english")
+    assert english.requests == ["one", "two", "four"]
+    assert progress == [1, 2, 3, 4]
+
+    with wave.open(results[1].output_file, "rb") as wav_file:
+        assert wav_file.readframes(wav_file.getnframes()) == bytes([1, 0]) * 8
+    # compressed items are encoded from the stream, not downloaded
+    assert results[3].output_file.endswith(".mp3")
+    assert soundfile.info(results[3].output_file).format == "MP3"
+
+
+def test_batch_reports_failures_per_item(monkeypatch, tmp_path):
+    setup(monkeypatch, fail_texts=["bad"])
+    items = [
+        McpBatchItem(text="good", voice_id="en"),
+        McpBatchItem(text="bad", voice_id="en"),
+        McpBatchItem(text="", voice_id="en"),
+        McpBatchItem(text="x", voice_id="missing"),
+        McpBatchItem(text="  \n", voice_id="en"),
+        McpBatchItem(text="x", voice_id="null", audio_format="ogg"),
+    ]
+    results = batch.synthesize_batch(items, tmp_path, "en")
+
+    assert [r.status for r in results] == ["ok"] + ["error"] * 5
+    assert "failed" in results[1].error
+    assert "missing" in results[3].error
+    assert "empty" in results[4].error
+    assert results[5].voice_id == "en"
+    # failed wav takes leave no partial files behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        results[0].output_file.split("/")[-1]
+    ]
+
+
+def test_batch_resubmits_takes_cut_off_by_a_lost_connection(monkeypatch, tmp_path):
+    pool = setup(monkeypatch)
+    monkeypatch.setattr(resilience, "retry_backoff", 0)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    updates = []
+    update = FakeWebsocket.update
+
+    def lose_connection(self, timeout=1):
+        updates.append(1)
+        if len(updates) == 3:
+            raise DaisysMcpConnectionError("Websocket connection lost: closed")
+        update(self, timeout)
+
+    monkeypatch.setattr(FakeWebsocket, "update", lose_connection)
+    monkeypatch.setattr(batch, "resubmit_lost_takes", True)
+    items = [McpBatchItem(text="one"), McpBatchItem(text="two")]
+    results = batch.synthesize_batch(items, tmp_path, "en")
+
+    assert [r.status for r in results] == ["ok", "ok"]
+    assert [ws.requests for ws in pool.sockets] == [["one", "two"], ["two", "one"]]
+    with wave.open(results[0].output_file, "rb") as wav_file:
+        assert wav_file.readframes(wav_file.getnframes()) == bytes([1, 0]) * 8
+
+
+def test_batch_does_not_resubmit_cut_off_takes_by_default(monkeypatch, tmp_path):
+    pool = setup(monkeypatch)
+    monkeypatch.setattr(resilience, "retry_backoff", 0)
+    monkeypatch.setattr(resilience, "_breakers", {})
+
+    def lose_connection(self, timeout=1):
+        raise DaisysMcpConnectionError("Websocket connection lost: closed")
+
+    monkeypatch.setattr(FakeWebsocket, "update", lose_connection)
+    items = [McpBatchItem(text="one"), McpBatchItem(text="two")]
+    results = batch.synthesize_batch(items, tmp_path, "en")
+
+    # the takes may have been accepted, they are not generated twice
+    assert [r.status for r in results] == ["error", "error"]
+    assert "twice" in results[0].error
+    assert [ws.requests for ws in pool.sockets] == [["one", "two"]]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_batch_retries_a_take_whose_submit_failed(monkeypatch, tmp_path):
+    pool = setup(monkeypatch)
+    monkeypatch.setattr(resilience, "retry_backoff", 0)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    submits = []
+    generate_take = FakeWebsocket.generate_take
+
+    def lose_connection(self, *args, **kwargs):
+        submits.append(1)
+        if len(submits) == 2:
+            raise DaisysMcpConnectionError("Websocket connection lost: closed")
+        return generate_take(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeWebsocket, "generate_take", lose_connection)
+    items = [McpBatchItem(text="one"), McpBatchItem(text="two")]
+    results = batch.synthesize_batch(items, tmp_path, "en")
+
+    # "one" was generating on the lost connection, "two" never reached it
+    assert [r.status for r in results] == ["error", "ok"]
+    assert pool.sockets[-1].requests == ["two"]
+    # no partial file of the failed submit is left behind
+    assert [p.name for p in tmp_path.iterdir()] == [
+        results[1].output_file.split("/")[-1]
+    ]
@@ -0,0 +1,119 @@
+import gc
+import threading
+import time
+
+import daisys_mcp.cache as cache_module
+from daisys_mcp.audio import SpilledAudio
+from daisys_mcp.cache import SynthesisCache, make_cache_key
+
+
+def test_key_normalizes_whitespace():
+    a = make_cache_key("One  moment\nplease ", "v1", None, "wav", "websocket")
+    b = make_cache_key("One moment please", "v1", None, "wav", "websocket")
+    assert a == b
+    assert a != make_cache_key("One moment please", "v2", None, "wav", "websocket")
+    assert a != make_cache_key("One moment please", "v1", None, "mp3", "http")
+
+
+def test_memory_hit_and_miss_counters():
+    cache = SynthesisCache()
+    assert cache.get("a") is None
+    cache.put("a", b"audio")
+    assert cache.get("a") == b"audio"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] == 1
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = SynthesisCache(max_entries=2, max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    cache.get("a")
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+
+    cache.put("d", b"123456789")
+    assert cache.stats()["memory_bytes"] <= 10
+    assert cache.get("d") == b"123456789"
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    cache = SynthesisCache(directory=tmp_path, max_entries=1)
+    cache.put("a", b"first")
+    cache.put("b", b"second")
+    # "a" was evicted from memory but is still on disk
+    assert cache.get("a") == b"first"
+    assert cache.stats()["disk_hits"] == 1
+
+    restarted = SynthesisCache(directory=tmp_path)
+    assert restarted.get("b") == b"second"
+
+
+def test_disk_bounds(tmp_path):
+    cache = SynthesisCache(directory=tmp_path, max_entries=0, disk_max_bytes=8)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") is None
+    assert cache.get("b") == b"12345"
+    assert len(list(tmp_path.glob("*/*.audio"))) == 1
+
+
+def test_ttl_expires_entries(tmp_path):
+    cache = SynthesisCache(directory=tmp_path, ttl=0.05)
+    cache.put("a", b"audio")
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert not list(tmp_path.glob("*/*.audio"))
+
+
+def test_put_file(tmp_path):
+    source = tmp_path / "take.wav"
+    source.write_bytes(b"audio")
+    cache = SynthesisCache(directory=tmp_path / "cache", max_bytes=2)
+    cache.put_file("a", source)
+    # too large for memory, served from disk
+    assert cache.get("a") == b"audio"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_spilled_audio_skips_the_memory_tier(tmp_path):
+    spill = tmp_path / "spill.wav"
+    spill.write_bytes(b"audio")
+    audio = SpilledAudio.open(spill)
+    cache = SynthesisCache(directory=tmp_path / "cache")
+    cache.put("a", audio)
+    assert cache.stats()["memory_bytes"] == 0
+    del audio
+    gc.collect()
+    # the spill file is gone, the cached copy is not
+    assert not spill.exists()
+    assert cache.get("a") == b"audio"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_memory_hits_do_not_wait_for_disk_writes(tmp_path, monkeypatch):
+    copying, release = threading.Event(), threading.Event()
+
+    def slow_copy(source, target):
+        copying.set()
+        release.wait(5)
+        target.write_bytes(source.read_bytes())
+
+    monkeypatch.setattr(cache_module.shutil, "copyfile", slow_copy)
+    source = tmp_path / "take.wav"
+    source.write_bytes(b"audio")
+    cache = SynthesisCache(directory=tmp_path / "cache", max_bytes=2)
+    cache.put("hot", b"x")
+
+    writer = threading.Thread(target=cache.put_file, args=("a", source))
+    writer.start()
+    assert copying.wait(5)
+    start = time.monotonic()
+    assert cache.get("hot") == b"x"
+    assert time.monotonic() - start < 1
+    release.set()
+    writer.join(5)
+    assert cache.get("a") == b"audio"
@@ -0,0 +1,188 @@
+import threading
+import time
+
+from daisys_mcp.catalog import CatalogCache
+from daisys_mcp.model import McpModel, McpVoice, model_index, voice_index
+
+
+class CountingFetch:
+    def __init__(self, items):
+        self.items = items
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return list(self.items)
+
+
+def make_catalog(fetch, **kwargs):
+    return CatalogCache(fetch, key=lambda item: item, **kwargs)
+
+
+def test_fresh_catalog_is_served_from_memory():
+    fetch = CountingFetch(["a", "b"])
+    catalog = make_catalog(fetch)
+    assert catalog.get() == ["a", "b"]
+    assert catalog.get() == ["a", "b"]
+    assert fetch.calls == 1
+
+
+def test_stale_catalog_is_served_while_refreshing():
+    fetch = CountingFetch(["a"])
+    catalog = make_catalog(fetch, ttl=0, max_stale=60)
+    assert catalog.get() == ["a"]
+
+    fetch.items = ["a", "b"]
+    assert catalog.get() == ["a"]
+    for _ in range(100):
+        if fetch.calls == 2 and not catalog._refreshing:
+            break
+        time.sleep(0.01)
+    assert fetch.calls == 2
+    assert catalog._items == ["a", "b"]
+
+
+def test_expired_catalog_is_fetched_again():
+    fetch = CountingFetch(["a"])
+    catalog = make_catalog(fetch, ttl=0, max_stale=0)
+    catalog.get()
+    time.sleep(0.01)
+    catalog.get()
+    assert fetch.calls == 2
+
+
+def test_invalidate_forces_refetch():
+    fetch = CountingFetch(["a"])
+    catalog = make_catalog(fetch)
+    catalog.get()
+    catalog.invalidate()
+    catalog.get()
+    assert fetch.calls == 2
+
+
+def test_add_and_remove_update_in_place():
+    fetch = CountingFetch(["a", "b"])
+    catalog = make_catalog(fetch)
+    catalog.get()
+    catalog.add("c")
+    catalog.remove("a")
+    assert catalog.get() == ["b", "c"]
+    assert fetch.calls == 1
+
+
+def test_concurrent_cold_calls_share_one_fetch():
+    gate = threading.Event()
+
+    def slow_fetch():
+        gate.wait()
+        slow_fetch.calls += 1
+        return ["a"]
+
+    slow_fetch.calls = 0
+    catalog = make_catalog(slow_fetch)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(catalog.get())) for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join()
+    assert results == [["a"]] * 4
+    assert slow_fetch.calls == 1
+
+
+def make_voices():
+    return [
+        McpVoice(voice_id="1", name="bob", gender="male", model="en", description="b"),
+        McpVoice(
+            voice_id="2", name="Alice", gender="female", model="en", description=None
+        ),
+        McpVoice(voice_id="3", name="carl", gender="male", model="nl", description="a"),
+        McpVoice(
+            voice_id="4", name="dora", gender="female", model="nl", description="c"
+        ),
+    ]
+
+
+def names(voices):
+    return [voice.name for voice in voices]
+
+
+def test_voice_index_filters_and_sorts():
+    index = voice_index(make_voices())
+    assert names(index.query({}, "name")) == ["Alice", "bob", "carl", "dora"]
+    assert names(index.query({}, "name", "desc")) == ["dora", "carl", "bob", "Alice"]
+    assert names(index.query({"gender": "male"}, "name")) == ["bob", "carl"]
+    assert names(index.query({"gender": "male", "model": "nl"}, "name")) == ["carl"]
+    assert index.query({"gender": "nonbinary"}, "name") == []
+    assert names(index.query({}, "description")) == ["Alice", "carl", "bob", "dora"]
+
+
+def test_voice_index_pagination():
+    index = voice_index(make_voices())
+    assert names(index.query({}, "name", offset=1, limit=2)) == ["bob", "carl"]
+    assert names(index.query({"model": "nl"}, "name", offset=1, limit=5)) == ["dora"]
+    assert index.query({}, "name", offset=10) == []
+
+
+def test_model_index_language_prefix():
+    def model(name, languages):
+        return McpModel(
+            name=name,
+            displayname=name.title(),
+            flags=[],
+            languages=languages,
+            genders=["male"],
+            styles=[],
+            prosody_types=["simple"],
+        )
+
+    index = model_index(
+        [
+            model("english", ["en-GB", "en-US"]),
+            model("dutch", ["nl-NL"]),
+            model("german", ["de-DE"]),
+        ]
+    )
+    assert [m.name for m in index.query({"language": "en"}, "name")] == ["english"]
+    assert [m.name for m in index.query({"language": "en-us"}, "name")] == ["english"]
+    # a single letter no longer matches every language starting with it
+    assert index.query({"language": "e"}, "name") == []
+    assert [m.name for m in index.query({"language": None}, "name")] == [
+        "dutch",
+        "english",
+        "german",
+    ]
+
+
+def test_concurrent_refreshes_share_one_fetch_and_its_error():
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        raise ConnectionError("rate limited")
+
+    catalog = make_catalog(fetch)
+    errors = []
+
+    def get():
+        try:
+            catalog.get()
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(errors) == 4
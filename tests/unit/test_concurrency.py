@@ -0,0 +1,155 @@
+import threading
+import time
+
+import anyio
+
+import daisys_mcp.concurrency as concurrency
+from daisys_mcp.concurrency import SingleFlight, client_slot
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["a"]
+
+    results = []
+
+    def call():
+        results.append(flights.do("k", fetch))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    # every caller gets the same object
+    assert len({id(result) for result, _ in results}) == 1
+    # a call after the flight finished runs again
+    assert flights.do("k", lambda: ["b"]) == (["b"], False)
+
+
+def test_errors_fan_out_to_waiting_callers():
+    flights = SingleFlight()
+    calls, errors = [], []
+
+    async def generate():
+        calls.append(1)
+        await anyio.sleep(0.05)
+        raise RuntimeError("upstream failed")
+
+    async def call():
+        try:
+            await flights.do_async("k", generate)
+        except RuntimeError as e:
+            errors.append(e)
+
+    async def main():
+        async with anyio.create_task_group() as tg:
+            for _ in range(3):
+                tg.start_soon(call)
+
+    anyio.run(main)
+    assert len(calls) == 1
+    assert len(errors) == 3 and all(e is errors[0] for e in errors)
+
+
+def test_cancelled_leader_hands_over_to_a_waiting_caller():
+    flights = SingleFlight()
+    calls, results = [], []
+
+    async def generate(name):
+        calls.append(name)
+        await anyio.sleep(0.05)
+        return name
+
+    async def main():
+        async with anyio.create_task_group() as tg:
+            leader = anyio.CancelScope()
+
+            async def lead():
+                with leader:
+                    await flights.do_async("k", generate, "leader")
+
+            async def follow():
+                results.append(await flights.do_async("k", generate, "follower"))
+
+            tg.start_soon(lead)
+            await anyio.sleep(0.01)
+            tg.start_soon(follow)
+            await anyio.sleep(0.01)
+            leader.cancel()
+
+    anyio.run(main)
+    assert calls == ["leader", "follower"]
+    assert results == [("follower", False)]
+
+
+def test_client_slots_limit_each_client_separately(monkeypatch):
+    monkeypatch.setattr(concurrency, "max_concurrent_per_client", 2)
+    running = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0}
+
+    class Client:
+        def __init__(self, name):
+            self.name = name
+
+    async def call(client):
+        async with client_slot(client):
+            running[client.name] += 1
+            peak[client.name] = max(peak[client.name], running[client.name])
+            await anyio.sleep(0.01)
+            running[client.name] -= 1
+
+    async def main():
+        clients = [Client("a"), Client("b")]
+        async with anyio.create_task_group() as tg:
+            for client in clients:
+                for _ in range(5):
+                    tg.start_soon(call, client)
+            # calls outside a client session are not limited
+            tg.start_soon(call_without_client)
+
+    async def call_without_client():
+        async with client_slot(None):
+            pass
+
+    anyio.run(main)
+    assert peak == {"a": 2, "b": 2}
+
+
+def test_slow_synthesis_does_not_block_metadata_calls(monkeypatch):
+    monkeypatch.setattr(concurrency, "_limiters", {})
+    monkeypatch.setattr(concurrency, "max_concurrent_synthesis", 1)
+    release = threading.Event()
+    finished = []
+
+    async def synthesize():
+        await concurrency.run_blocking(release.wait, 5, kind="synthesis")
+        finished.append("synthesis")
+
+    async def main():
+        async with anyio.create_task_group() as tg:
+            # one running and one waiting for the only synthesis slot
+            tg.start_soon(synthesize)
+            tg.start_soon(synthesize)
+            await anyio.sleep(0.05)
+            with anyio.fail_after(1):
+                assert await concurrency.run_blocking(lambda: "voices") == "voices"
+            finished.append("request")
+            release.set()
+
+    anyio.run(main)
+    assert finished == ["request", "synthesis", "synthesis"]
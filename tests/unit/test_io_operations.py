@@ -26,3 +26,20 @@ def test_make_output_path_absolute(tmp_path):
     assert path.exists()
     assert path.name == "absolute_output"
     assert is_file_writeable(path)
+
+
+def test_make_output_path_checks_a_directory_once(monkeypatch, tmp_path):
+    import daisys_mcp.utils as utils
+
+    checks = []
+    monkeypatch.setattr(
+        utils, "is_file_writeable", lambda path: checks.append(path) or True
+    )
+    first = make_output_path(str(tmp_path / "cached"))
+    second = make_output_path(str(tmp_path / "cached"))
+    assert first == second
+    assert checks == [first]
+
+    utils.forget_output_path(first)
+    make_output_path(str(tmp_path / "cached"))
+    assert len(checks) == 2
@@ -0,0 +1,93 @@
+import urllib.request
+
+import anyio
+import pytest
+
+from daisys_mcp.metrics import (
+    Histogram,
+    MetricsRegistry,
+    start_metrics_server,
+    timed,
+    track_tool,
+    errors_total,
+    stage_seconds,
+    timeouts_total,
+    tool_seconds,
+    tools_in_flight,
+)
+from daisys_mcp.utils import DaisysMcpTimeoutError
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = Histogram("h", "help", buckets=[0.1, 1.0])
+    for value in [0.05] * 50 + [0.5] * 49 + [5.0]:
+        histogram.observe(value, stage="x")
+    assert histogram.count(stage="x") == 100
+    assert histogram.quantile(0.5, stage="x") == pytest.approx(0.1)
+    assert histogram.quantile(0.75, stage="x") == pytest.approx(0.1 + 0.9 * 25 / 49)
+    # beyond the largest bucket only the bound is known
+    assert histogram.quantile(1.0, stage="x") == 1.0
+    assert histogram.quantile(0.5, stage="other") is None
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter("c_total", "A counter.").inc(3, kind='say "hi"')
+    registry.histogram("h_seconds", "A histogram.", buckets=[1.0]).observe(0.5)
+    registry.add_collector(lambda: [("g", "gauge", "A gauge.", {"tier": "disk"}, 7)])
+    text = registry.render()
+
+    assert '# TYPE c_total counter\nc_total{kind="say \\"hi\\""} 3\n' in text
+    assert 'h_seconds_bucket{le="1"} 1\nh_seconds_bucket{le="+Inf"} 1\n' in text
+    assert "h_seconds_sum 0.5\nh_seconds_count 1\n" in text
+    assert '# TYPE g gauge\ng{tier="disk"} 7\n' in text
+
+    snapshot = registry.snapshot()
+    assert snapshot["c_total"] == {'kind=say "hi"': 3}
+    assert snapshot["h_seconds"][""]["count"] == 1
+    assert snapshot["g"] == {"tier=disk": 7}
+
+
+def test_timed_records_duration_errors_and_timeouts():
+    count = stage_seconds.count(stage="test_stage")
+    with timed("test_stage"):
+        pass
+    with pytest.raises(DaisysMcpTimeoutError):
+        with timed("test_stage"):
+            raise DaisysMcpTimeoutError("too slow")
+
+    assert stage_seconds.count(stage="test_stage") == count + 2
+    assert errors_total.value(stage="test_stage", type="DaisysMcpTimeoutError") >= 1
+    assert timeouts_total.value(stage="test_stage") >= 1
+
+
+def test_track_tool_counts_calls_in_flight():
+    seen = []
+
+    @track_tool("test_tool")
+    async def call(fail: bool = False):
+        seen.append(tools_in_flight.value(tool="test_tool"))
+        if fail:
+            raise ValueError("bad")
+        return "ok"
+
+    assert anyio.run(call) == "ok"
+    with pytest.raises(ValueError):
+        anyio.run(call, True)
+    assert seen == [1, 1]
+    assert tools_in_flight.value(tool="test_tool") == 0
+    assert tool_seconds.count(tool="test_tool") == 2
+    assert errors_total.value(stage="test_tool", type="ValueError") == 1
+
+
+def test_metrics_endpoint_serves_the_registry():
+    server = start_metrics_server("127.0.0.1", 0)
+    try:
+        with timed("endpoint_stage"):
+            pass
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode()
+        assert 'daisys_stage_seconds_count{stage="endpoint_stage"} 1' in body
+    finally:
+        server.shutdown()
@@ -0,0 +1,106 @@
+import os
+
+import anyio
+import pytest
+
+import daisys_mcp.output as output
+from daisys_mcp.audio import SpillingWavSink
+from daisys_mcp.output import OutputWriter, part_file
+
+
+@pytest.fixture
+def writer():
+    writer = OutputWriter()
+    yield writer
+    writer.close()
+
+
+def test_files_are_named_by_content(writer, tmp_path):
+    first = writer.write(tmp_path, "Hello world", "wav", b"one").result()
+    second = writer.write(tmp_path, "Hello there", "wav", b"two").result()
+    again = writer.write(tmp_path, "Hello world", "wav", b"one").result()
+
+    # same opening words within the same second no longer collide
+    assert first != second and first.name.startswith("Hello_")
+    assert again == first
+    assert first.read_bytes() == b"one" and second.read_bytes() == b"two"
+    # no temporary files are left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [first.name, second.name]
+    )
+
+
+def test_streamed_files_are_renamed_once_complete(writer, tmp_path):
+    part = part_file(tmp_path, "mp3")
+    part.write_bytes(b"streamed")
+    assert part.name.startswith(".")
+
+    path = writer.finish(part, tmp_path, "Hi", "mp3").result()
+    assert path.suffix == ".mp3" and path.read_bytes() == b"streamed"
+    assert not part.exists()
+
+
+def test_spilled_audio_is_linked_into_place(writer, tmp_path):
+    sink = SpillingWavSink(threshold=8, directory=tmp_path / "spill")
+    sink.write(b"\x01\x00" * 100)
+    sink.close()
+    audio = sink.getbuffer()
+
+    path = writer.write(tmp_path / "out", "Long", "wav", audio).result()
+    assert path.read_bytes() == bytes(audio)
+    assert os.path.samefile(path, audio.path)
+
+
+def test_copy_file_copies_without_reading(tmp_path):
+    source = tmp_path / "source"
+    source.write_bytes(b"audio" * 1000)
+    output._copy_file(source, tmp_path / "target")
+    assert (tmp_path / "target").read_bytes() == source.read_bytes()
+
+
+def test_removed_directory_is_created_again(writer, tmp_path):
+    directory = tmp_path / "out"
+    path = writer.write(directory, "Hi", "wav", b"audio").result()
+    assert path.parent == directory
+
+
+def test_full_fsync_syncs_each_directory_once_per_batch(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(output.os, "fsync", lambda fd: synced.append(fd))
+    writer = OutputWriter(fsync="full")
+    writer.close()
+    jobs = [output._Write(tmp_path, "Hi", "wav", bytes([i]), None) for i in range(4)]
+    writer._write_batch(jobs)
+
+    assert len({job.future.result() for job in jobs}) == 4
+    # a sync per file, and one for the directory they were renamed in
+    assert len(synced) == 4 + 1
+
+
+def test_save_output_waits_on_the_event_loop(tmp_path, monkeypatch):
+    writer = OutputWriter()
+    monkeypatch.setattr(output, "_writer", writer)
+
+    async def main():
+        paths = []
+
+        async def save(i):
+            paths.append(await output.save_output(bytes([i]), tmp_path, "Hi", "wav"))
+
+        async with anyio.create_task_group() as tg:
+            for i in range(10):
+                tg.start_soon(save, i)
+        return paths
+
+    paths = anyio.run(main)
+    writer.close()
+    assert len(set(paths)) == 10
+    assert all(os.path.exists(path) for path in paths)
+
+
+def test_part_sink_recreates_a_removed_directory(tmp_path):
+    directory = tmp_path / "out"
+    part, sink = output.open_part_sink(directory, "wav")
+    sink.write(b"\x01\x00")
+    sink.close()
+    assert part.parent == directory and part.exists()
@@ -0,0 +1,119 @@
+import threading
+import time
+
+from daisys_mcp.playback import ABORT, STOP, PcmRingBuffer, PlaybackEngine
+
+
+class FakeStream:
+    """Pulls blocks from the fill function on a thread, like PortAudio does."""
+
+    played = []
+
+    def __init__(self, utterance, fill, finished_callback, block=8, delay=0.001):
+        self.utterance = utterance
+        self.fill = fill
+        self.finished_callback = finished_callback
+        self.block = block
+        self.delay = delay
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            out = bytearray(self.block)
+            action = self.fill(out)
+            if action != ABORT:
+                FakeStream.played.append((self.utterance.utterance_id, bytes(out)))
+            if action in [STOP, ABORT]:
+                break
+            time.sleep(self.delay)
+        self.finished_callback()
+
+
+def played_audio(utterance_id):
+    audio = b"".join(out for uid, out in FakeStream.played if uid == utterance_id)
+    # drop the silence played while waiting for audio
+    return audio.replace(b"\x00", b"")
+
+
+def make_engine(**kwargs):
+    FakeStream.played = []
+    return PlaybackEngine(
+        open_stream=lambda u, fill, done: FakeStream(u, fill, done, **kwargs)
+    )
+
+
+def test_ring_buffer_wraps_and_grows():
+    ring = PcmRingBuffer(capacity=8)
+    ring.write(b"abcdef")
+    out = bytearray(4)
+    assert ring.read_into(out) == 4 and out == b"abcd"
+    ring.write(b"ghijkl")  # wraps around the end
+    ring.write(b"mnopqrstuv")  # grows, keeping the order
+    out = bytearray(32)
+    n = ring.read_into(out)
+    assert out[:n] == b"efghijklmnopqrstuv"
+    assert len(ring) == 0
+
+
+def test_plays_utterances_in_order_while_they_are_written():
+    engine = make_engine()
+    first = engine.enqueue("first", 22050)
+    second = engine.enqueue("second", 22050)
+    second.write(b"\x02\x02" * 20)
+    second.finish()
+    for _ in range(10):
+        first.write(b"\x01\x01" * 4)
+        time.sleep(0.002)
+    first.finish()
+
+    assert second.wait(5)
+    assert first.state == "done" and second.state == "done"
+    assert played_audio(first.utterance_id) == b"\x01\x01" * 40
+    assert played_audio(second.utterance_id) == b"\x02\x02" * 20
+    # the first utterance finished before the second started
+    ids = [uid for uid, _ in FakeStream.played]
+    assert (
+        ids.index(second.utterance_id)
+        > len(ids) - ids[::-1].index(first.utterance_id) - 1
+    )
+
+
+def test_writing_never_waits_for_playback():
+    engine = make_engine(delay=0.05)
+    utterance = engine.enqueue("slow device", 22050)
+    start = time.perf_counter()
+    for _ in range(100):
+        utterance.write(b"\x01\x00" * 4096)
+    assert time.perf_counter() - start < 0.5
+    engine.stop()
+
+
+def test_skip_cancel_and_stop():
+    engine = make_engine(delay=0.01)
+    playing = engine.enqueue("playing", 22050)
+    playing.write(b"\x01\x00" * 1000)
+    queued = engine.enqueue("queued", 22050)
+    last = engine.enqueue("last", 22050)
+    for _ in range(100):
+        if playing.state == "playing":
+            break
+        time.sleep(0.01)
+
+    assert [u["utterance_id"] for u in engine.queue()] == [1, 2, 3]
+    assert engine.cancel(queued.utterance_id) is queued
+    assert queued.state == "cancelled" and queued.wait(0)
+
+    assert engine.skip() is playing
+    assert playing.wait(5) and playing.state == "cancelled"
+
+    assert engine.stop() == 1
+    assert last.wait(5) and last.state == "cancelled"
+    assert engine.queue() == []
+    assert engine.cancel(99) is None
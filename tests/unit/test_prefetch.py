@@ -0,0 +1,106 @@
+import threading
+
+import anyio
+
+from daisys_mcp.concurrency import ActivityCounter
+from daisys_mcp.prefetch import PrefetchJob, Prefetcher
+
+
+class DictCache:
+    def __init__(self):
+        self.entries = {}
+
+    def put(self, key, data):
+        self.entries[key] = data
+
+
+def blocked_job(key):
+    """A job that generates b"<key>" once ``release`` is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def generate():
+        started.set()
+        release.wait(5)
+        return key.encode()
+
+    return PrefetchJob(key, generate), started, release
+
+
+def test_jobs_are_cached_and_deduplicated():
+    cache = DictCache()
+    prefetcher = Prefetcher(cache, workers=1)
+    job, started, release = blocked_job("a")
+    assert prefetcher.submit(job) == "queued"
+    assert started.wait(5)
+    assert prefetcher.submit(PrefetchJob("a", lambda: b"again")) == "in_progress"
+
+    release.set()
+    # a request for the running job waits for it instead of generating again
+    assert prefetcher.join("a", timeout=5) == b"a"
+    assert cache.entries == {"a": b"a"}
+    assert prefetcher.join("missing") is None
+
+
+def test_join_async_waits_on_the_event_loop():
+    prefetcher = Prefetcher(DictCache(), workers=1)
+    job, started, release = blocked_job("a")
+    prefetcher.submit(job)
+    assert started.wait(5)
+
+    async def main():
+        # times out without the job, then gets it once it finishes
+        assert await prefetcher.join_async("a", timeout=0.05) is None
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(anyio.to_thread.run_sync, release.set)
+            return await prefetcher.join_async("a", timeout=5)
+
+    assert anyio.run(main) == b"a"
+
+
+def test_foreground_synthesis_preempts_queued_jobs():
+    foreground = ActivityCounter()
+    prefetcher = Prefetcher(DictCache(), workers=1, foreground=foreground)
+    first, started, release = blocked_job("first")
+    second = PrefetchJob("second", lambda: b"second")
+
+    with foreground:
+        prefetcher.submit(first)
+        prefetcher.submit(second)
+        assert not started.wait(0.2)
+        assert prefetcher.status() == {"queued": 2, "running": 0}
+    assert started.wait(5)
+
+    # the foreground takes over a job that has not started yet
+    assert prefetcher.join("second") is None
+    assert second.state == "cancelled"
+    release.set()
+    assert prefetcher.join("first", timeout=5) == b"first"
+
+
+def test_cancel_drops_queued_jobs():
+    prefetcher = Prefetcher(DictCache(), workers=1, max_queued=2)
+    running, started, release = blocked_job("running")
+    prefetcher.submit(running)
+    assert started.wait(5)
+    jobs = [PrefetchJob(key, lambda: b"") for key in "abc"]
+    assert [prefetcher.submit(job) for job in jobs] == ["queued", "queued", "full"]
+
+    assert prefetcher.cancel() == 2
+    assert all(job.done.is_set() for job in jobs[:2])
+    release.set()
+    assert prefetcher.join("running", timeout=5) == b"running"
+    assert prefetcher.status() == {"queued": 0, "running": 0}
+
+
+def test_failed_jobs_are_not_cached():
+    cache = DictCache()
+    prefetcher = Prefetcher(cache, workers=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    job = PrefetchJob("a", fail)
+    prefetcher.submit(job)
+    assert job.done.wait(5)
+    assert (job.state, job.error) == ("failed", "boom")
+    assert cache.entries == {}
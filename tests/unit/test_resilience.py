@@ -0,0 +1,150 @@
+import httpx
+import pytest
+from daisys.v1.speak import (  # type: ignore
+    DaisysTakeGenerateError,
+    DaisysWebsocketConnectError,
+    DaisysWebsocketGenerateError,
+)
+
+import daisys_mcp.resilience as resilience
+from daisys_mcp.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    call_with_retry,
+    can_fall_back,
+    is_transient,
+    is_unprocessed,
+)
+from daisys_mcp.utils import (
+    DaisysMcpConnectionError,
+    DaisysMcpError,
+    DaisysMcpTimeoutError,
+)
+
+
+def http_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://api.daisys.ai/v1/speak/voices")
+    response = httpx.Response(status, request=request)
+    return httpx.HTTPStatusError("failed", request=request, response=response)
+
+
+def test_errors_are_classified():
+    assert is_transient(DaisysMcpConnectionError("Websocket connection lost"))
+    assert is_transient(DaisysWebsocketConnectError("no worker"))
+    assert is_transient(httpx.ConnectError("refused"))
+    assert is_transient(http_error(503))
+    assert is_transient(http_error(429))
+
+    assert not is_transient(http_error(401))
+    assert not is_transient(DaisysWebsocketGenerateError("rejected", 1))
+    assert not is_transient(DaisysTakeGenerateError("rejected", response=None))
+    assert not is_transient(DaisysMcpTimeoutError("too slow"))
+    assert not is_transient(DaisysMcpError("Voice v1 not found."))
+
+
+def test_only_unprocessed_requests_may_be_sent_again():
+    request = httpx.Request("POST", "https://api.daisys.ai/v1/speak/takes/generate")
+    assert is_unprocessed(httpx.ConnectError("refused"))
+    assert is_unprocessed(httpx.ConnectTimeout("slow handshake"))
+    assert is_unprocessed(http_error(429))
+    assert is_unprocessed(http_error(503))
+
+    # the take may have been accepted before these
+    assert not is_unprocessed(httpx.ReadError("reset", request=request))
+    assert not is_unprocessed(httpx.ReadTimeout("no answer", request=request))
+    assert not is_unprocessed(http_error(502))
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "retry_backoff", 0)
+    monkeypatch.setattr(resilience, "_breakers", {})
+
+
+def test_transient_errors_are_retried(no_backoff):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise DaisysMcpConnectionError("lost")
+        return "audio"
+
+    assert call_with_retry("test", flaky) == "audio"
+    assert len(calls) == 3
+
+    calls.clear()
+
+    def rejected():
+        calls.append(1)
+        raise DaisysMcpError("Take ended with status error.")
+
+    with pytest.raises(DaisysMcpError):
+        call_with_retry("test", rejected)
+    assert len(calls) == 1
+
+
+def test_retries_stop_at_the_attempt_limit_or_when_vetoed(no_backoff, monkeypatch):
+    monkeypatch.setattr(resilience, "retry_attempts", 2)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        call_with_retry("test", down)
+    assert len(calls) == 2
+
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        call_with_retry("other", down, retryable=lambda e: False)
+    assert len(calls) == 1
+
+
+def test_circuit_opens_after_failures_and_closes_after_a_trial(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=10)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    now[0] = 10
+    assert breaker.state == "half_open"
+    # one trial call at a time
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_open_circuit_refuses_calls_and_allows_fallback(no_backoff, monkeypatch):
+    monkeypatch.setattr(resilience, "circuit_failure_threshold", 1)
+    monkeypatch.setattr(resilience, "retry_attempts", 1)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        call_with_retry("websocket", down)
+    with pytest.raises(CircuitOpenError) as error:
+        call_with_retry("websocket", down)
+    assert len(calls) == 1
+    assert resilience.breaker_states() == {"websocket": "open"}
+
+    assert can_fall_back(error.value, "wav")
+    assert can_fall_back(DaisysMcpConnectionError("lost"), "mp3")
+    # the http api has no opus
+    assert not can_fall_back(error.value, "opus")
+    assert not can_fall_back(DaisysMcpError("Voice v1 not found."), "wav")
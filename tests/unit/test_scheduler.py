@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from daisys_mcp.scheduler import Scheduler, TokenBucket
+
+
+def test_token_bucket_delays_beyond_capacity():
+    bucket = TokenBucket(rate=10, capacity=2)
+    now = time.monotonic()
+    assert bucket.delay(2, now) == 0
+    bucket.take(2)
+    assert bucket.delay(1, now) == pytest.approx(0.1, abs=0.01)
+    # larger than the capacity: waits for a full bucket, not refused
+    assert bucket.delay(50, now) == pytest.approx(0.2, abs=0.01)
+
+
+def test_unlimited_scheduler_does_not_wait():
+    scheduler = Scheduler()
+    assert scheduler.acquire(10_000) < 0.05
+    assert scheduler.try_acquire(10_000)
+
+
+def test_try_acquire_refuses_when_rate_is_spent():
+    scheduler = Scheduler(requests_per_second=1, burst_seconds=1)
+    assert scheduler.try_acquire(5)
+    assert not scheduler.try_acquire(5)
+
+
+def _run_waiting(scheduler, jobs):
+    """Start ``jobs`` of (name, priority, client) behind a spent bucket; return the order served."""
+    order = []
+    scheduler.acquire(1)  # spend the burst, so the jobs below queue up
+    threads = []
+    for name, priority, client in jobs:
+        thread = threading.Thread(
+            target=lambda n=name, p=priority, c=client: (
+                scheduler.acquire(1, p, c),
+                order.append(n),
+            )
+        )
+        thread.start()
+        threads.append(thread)
+        # wait until it is queued, so the arrival order is fixed
+        while sum(scheduler.stats().values()) < len(threads):
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_interactive_takes_overtake_lower_priorities():
+    scheduler = Scheduler(requests_per_second=50, burst_seconds=0)
+    order = _run_waiting(
+        scheduler,
+        [
+            ("prefetch", "prefetch", "a"),
+            ("batch", "batch", "a"),
+            ("interactive", "interactive", "b"),
+        ],
+    )
+    assert order == ["interactive", "batch", "prefetch"]
+
+
+def test_clients_take_turns_within_a_priority():
+    scheduler = Scheduler(requests_per_second=50, burst_seconds=0)
+    order = _run_waiting(
+        scheduler,
+        [
+            ("a1", "batch", "a"),
+            ("a2", "batch", "a"),
+            ("a3", "batch", "a"),
+            ("b1", "batch", "b"),
+        ],
+    )
+    # b is let in before the rest of a's list
+    assert order.index("b1") < order.index("a3")
+    assert [n for n in order if n.startswith("a")] == ["a1", "a2", "a3"]
+
+
+def test_stats_report_waiting_takes_per_priority():
+    scheduler = Scheduler()
+    assert scheduler.stats() == {"interactive": 0, "batch": 0, "prefetch": 0}
@@ -0,0 +1,106 @@
+import io
+import threading
+import wave
+
+import numpy as np
+import pytest
+
+from daisys_mcp import segment
+from daisys_mcp.audio import WavBufferSink
+from daisys_mcp.cache import SynthesisCache
+from daisys_mcp.segment import join_segments, split_text, synthesize_segmented
+
+
+def make_wav(samples, sample_rate=1000):
+    sink = WavBufferSink(sample_rate=sample_rate)
+    sink.write(np.asarray(samples, dtype="<i2").tobytes())
+    sink.close()
+    return sink.getvalue()
+
+
+def read_samples(audio):
+    with wave.open(io.BytesIO(audio), "rb") as wav_file:
+        frames = wav_file.readframes(wav_file.getnframes())
+        return wav_file.getframerate(), np.frombuffer(frames, dtype="<i2")
+
+
+def test_split_text_respects_sentences_and_paragraphs():
+    text = "One two. Three four five. Six.\n\nSeven eight."
+    assert split_text(text, max_chars=20) == [
+        "One two.",
+        "Three four five.",
+        "Six.",
+        "Seven eight.",
+    ]
+    assert split_text(text, max_chars=100) == [
+        "One two. Three four five. Six.",
+        "Seven eight.",
+    ]
+
+
+def test_split_text_cuts_long_sentences():
+    text = "alpha beta, gamma delta epsilon zeta eta theta"
+    segments = split_text(text, max_chars=12)
+    assert all(len(s) <= 12 for s in segments)
+    assert " ".join(segments).replace(",", "") == text.replace(",", "")
+
+
+def test_join_segments_with_silence():
+    rate, samples = read_samples(
+        join_segments([make_wav([1, 2]), make_wav([3])], silence_ms=3)
+    )
+    assert rate == 1000
+    assert samples.tolist() == [1, 2, 0, 0, 0, 3]
+
+
+def test_join_segments_with_crossfade():
+    first = make_wav([100] * 10)
+    second = make_wav([200] * 10)
+    _, samples = read_samples(join_segments([first, second], crossfade_ms=4))
+    assert len(samples) == 16
+    assert samples[0] == 100 and samples[-1] == 200
+    assert all(100 <= s <= 200 for s in samples[6:10])
+
+
+def test_synthesize_segmented_keeps_order_and_reuses_segments(monkeypatch):
+    cache = SynthesisCache()
+    monkeypatch.setattr(segment, "get_synthesis_cache", lambda: cache)
+    monkeypatch.setattr(segment, "segment_max_chars", 10)
+    calls = []
+    lock = threading.Lock()
+
+    def synthesize(text):
+        with lock:
+            calls.append(text)
+        return make_wav([len(calls)] * len(text))
+
+    progress = []
+    audio = synthesize_segmented(
+        "aaaa. bbbbbb. cc.",
+        "v1",
+        synthesize,
+        "websocket",
+        on_segment=lambda done, total: progress.append((done, total)),
+    )
+    _, samples = read_samples(audio)
+    assert len(samples) == len("aaaa.") + len("bbbbbb.") + len("cc.")
+    assert sorted(calls) == ["aaaa.", "bbbbbb.", "cc."]
+    assert progress[-1] == (3, 3)
+
+    # only the changed segment is generated again
+    calls.clear()
+    synthesize_segmented("aaaa. bbbbbb. dd.", "v1", synthesize, "websocket")
+    assert calls == ["dd."]
+
+
+def test_synthesize_segmented_does_not_retry_on_top_of_synthesize(monkeypatch):
+    monkeypatch.setattr(segment, "get_synthesis_cache", lambda: None)
+    attempts = []
+
+    def failing(text):
+        attempts.append(text)
+        raise RuntimeError("take rejected")
+
+    with pytest.raises(RuntimeError):
+        synthesize_segmented("Hi.", "v1", failing, "http")
+    assert len(attempts) == 1
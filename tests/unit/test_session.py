@@ -0,0 +1,95 @@
+import threading
+
+import daisys_mcp.session as session
+from daisys_mcp.session import SessionPool
+
+
+class FakeClient:
+    logins = 0
+
+    def __init__(self, access_token=None, refresh_token=None):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.auto_logout = False
+        self.token_callback = None
+        self.closed = False
+
+    def login(self):
+        FakeClient.logins += 1
+        self.access_token = f"access-{FakeClient.logins}"
+        self.refresh_token = f"refresh-{FakeClient.logins}"
+        self.auto_logout = True
+        self.token_callback(self.access_token, self.refresh_token)
+
+    def login_refresh(self):
+        self.access_token = self.access_token + "-refreshed"
+        self.token_callback(self.access_token, self.refresh_token)
+        return True
+
+    def logout(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFactory:
+    def __init__(self, product, email, password, access_token, refresh_token):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+
+    def get_client(self):
+        return FakeClient(self.access_token, self.refresh_token)
+
+
+def make_pool(monkeypatch, **kwargs):
+    FakeClient.logins = 0
+    monkeypatch.setattr(session, "DaisysAPI", FakeFactory)
+    return SessionPool("user@example.com", "secret", **kwargs)
+
+
+def test_logs_in_once_for_many_checkouts(monkeypatch):
+    pool = make_pool(monkeypatch, size=2)
+    for _ in range(5):
+        with pool.client() as speak:
+            assert speak.access_token == "access-1"
+            assert not speak.auto_logout
+    assert FakeClient.logins == 1
+
+
+def test_concurrent_clients_share_tokens(monkeypatch):
+    pool = make_pool(monkeypatch, size=3)
+    barrier = threading.Barrier(3)
+    tokens = []
+
+    def worker():
+        with pool.client() as speak:
+            barrier.wait()
+            tokens.append(speak.access_token)
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert FakeClient.logins == 1
+    assert tokens == ["access-1"] * 3
+    assert len(pool._clients) == 3
+
+
+def test_stale_tokens_are_refreshed(monkeypatch):
+    pool = make_pool(monkeypatch, size=1, refresh_seconds=0)
+    with pool.client():
+        pass
+    with pool.client() as speak:
+        assert speak.access_token.endswith("-refreshed")
+    assert FakeClient.logins == 1
+
+
+def test_close_closes_all_clients(monkeypatch):
+    pool = make_pool(monkeypatch, size=1)
+    with pool.client() as speak:
+        pass
+    pool.close()
+    assert speak.closed
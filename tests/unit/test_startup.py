@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+# Every MCP client spawn pays the import before the handshake; keep an eye on it.
+IMPORT_BUDGET_SECONDS = 3.0
+
+CHECK = """
+import json, sys, time
+start = time.perf_counter()
+import daisys_mcp.server
+elapsed = time.perf_counter() - start
+heavy = ["numpy", "sounddevice", "soundfile", "daisys.v1.speak"]
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in heavy if m in sys.modules]}))
+"""
+
+
+def test_server_import_is_lazy_and_fast():
+    env = dict(os.environ, DAISYS_EMAIL="user@example.com", DAISYS_PASSWORD="secret")
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    # audio and websocket dependencies load on first use, not at startup
+    assert report["loaded"] == []
+    assert report["elapsed"] < IMPORT_BUDGET_SECONDS
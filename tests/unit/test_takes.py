@@ -0,0 +1,113 @@
+import contextlib
+
+import httpx
+import pytest
+
+import daisys_mcp.takes as takes
+from daisys_mcp.takes import TakeIndex, make_take_key, remember_take, reuse_take
+
+
+class FakeSpeak:
+    def __init__(self, missing=()):
+        self.missing = missing
+        self.downloads = []
+
+    def get_take_audio(self, take_id, format="wav"):
+        self.downloads.append((take_id, format))
+        if take_id in self.missing:
+            request = httpx.Request("GET", f"https://api.daisys.ai/takes/{take_id}")
+            response = httpx.Response(404, request=request)
+            raise httpx.HTTPStatusError("not found", request=request, response=response)
+        return f"{take_id}.{format}".encode()
+
+
+@pytest.fixture
+def index(monkeypatch):
+    index = TakeIndex()
+    monkeypatch.setattr(takes, "take_index_enabled", True)
+    monkeypatch.setattr(takes, "_index", index)
+    return index
+
+
+def use_speak(monkeypatch, speak):
+    monkeypatch.setattr(
+        takes, "speak_client", contextlib.contextmanager(lambda: (yield speak))
+    )
+
+
+def test_index_persists_takes_and_files(tmp_path):
+    path = str(tmp_path / "takes.sqlite3")
+    index = TakeIndex(path)
+    key = make_take_key("Hello  world", "v1", None, "websocket")
+    index.record(key, "t1", "v1", "Hello world")
+    audio = tmp_path / "hello.wav"
+    audio.write_bytes(b"RIFF")
+    index.add_file("t1", "wav", audio)
+    index.close()
+
+    index = TakeIndex(path)
+    # whitespace differences make the same take
+    assert index.lookup(make_take_key("Hello world", "v1", None, "websocket")) == "t1"
+    assert index.lookup(make_take_key("Hello world", "v2", None, "websocket")) is None
+    assert index.local_file("t1", "wav") == audio
+    assert index.stats() == {"takes": 1, "files": 1}
+
+    # a changed file is not reused
+    audio.write_bytes(b"RIFF....")
+    assert index.local_file("t1", "wav") is None
+    assert index.stats() == {"takes": 1, "files": 0}
+
+
+def test_repeat_requests_download_the_take_instead_of_generating(index, monkeypatch):
+    speak = FakeSpeak()
+    use_speak(monkeypatch, speak)
+    assert reuse_take("Hi", "v1", None, "websocket", "wav") is None
+
+    remember_take("Hi", "v1", None, "websocket", "t1")
+    assert reuse_take("Hi", "v1", None, "websocket", "mp3") == b"t1.mp3"
+    # takes of the http api have their own prosody, they are not the same
+    assert reuse_take("Hi", "v1", '{"pace": 0}', "http", "mp3") is None
+    assert speak.downloads == [("t1", "mp3")]
+
+
+def test_saved_files_are_read_instead_of_downloaded(index, monkeypatch, tmp_path):
+    speak = FakeSpeak()
+    use_speak(monkeypatch, speak)
+    remember_take("Hi", "v1", None, "websocket", "t1")
+    audio = tmp_path / "hi.wav"
+    audio.write_bytes(b"saved")
+    takes.remember_file("Hi", "v1", None, "websocket", "wav", audio)
+
+    assert reuse_take("Hi", "v1", None, "websocket", "wav") == b"saved"
+    assert speak.downloads == []
+    # opus cannot be downloaded
+    assert reuse_take("Hi", "v1", None, "websocket", "opus") is None
+
+
+def test_takes_removed_upstream_are_forgotten(index, monkeypatch):
+    use_speak(monkeypatch, FakeSpeak(missing=["t1"]))
+    remember_take("Hi", "v1", None, "websocket", "t1")
+    assert reuse_take("Hi", "v1", None, "websocket", "wav") is None
+    assert index.stats()["takes"] == 0
+
+
+def test_websocket_take_is_replayed_from_an_earlier_take(index, monkeypatch):
+    import daisys_mcp.websocket_tts as websocket_tts
+    from daisys_mcp.audio import wav_header
+
+    pcm = b"\x01\x00\x02\x00"
+    monkeypatch.setattr(
+        websocket_tts, "reuse_take", lambda *args: wav_header(4) + pcm + b"LIST"
+    )
+    monkeypatch.setattr(
+        websocket_tts,
+        "pooled_websocket",
+        lambda **_: pytest.fail("the take must not be generated again"),
+    )
+    chunks = []
+    audio = websocket_tts.text_to_speech_websocket(
+        "Hi", "v1", on_chunk=chunks.append, playback=False, audio_format="wav"
+    )
+    assert audio[44:] == pcm
+    assert chunks == [4]
+    assert bytes(audio[:4]) == b"RIFF"
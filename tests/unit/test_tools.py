@@ -0,0 +1,74 @@
+import importlib
+
+import anyio
+import pytest
+
+from daisys_mcp.catalog import CatalogCache
+from daisys_mcp.model import McpVoice, voice_index
+from daisys_mcp.utils import DaisysMcpError
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("DAISYS_EMAIL", "user@example.com")
+    monkeypatch.setenv("DAISYS_PASSWORD", "secret")
+    return importlib.import_module("daisys_mcp.server")
+
+
+def test_tools_can_be_called_outside_of_a_request(server):
+    assert server._client_session() is None
+    result = anyio.run(server.get_metrics)
+    assert result is not None
+
+
+def test_text_to_speech_rejects_unsupported_formats(server, monkeypatch):
+    def no_lookup():
+        raise AssertionError("validated after the voice lookup")
+
+    monkeypatch.setattr(server, "latest_voice_id", no_lookup)
+    with pytest.raises(DaisysMcpError, match="audio_format must be one of"):
+        anyio.run(lambda: server.text_to_speech("Hello", audio_format="flac"))
+
+
+def test_get_voices_refresh_fetches_the_catalog_again(server, monkeypatch):
+    voices = [
+        McpVoice(voice_id="1", name="bob", gender="male", model="en", description="")
+    ]
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return list(voices)
+
+    catalog = CatalogCache(fetch, key=lambda v: v.voice_id, build_index=voice_index)
+    monkeypatch.setattr(server, "voice_catalog", catalog)
+
+    anyio.run(server.get_voices)
+    # a voice added elsewhere only shows up when asked to refresh
+    voices.append(
+        McpVoice(voice_id="2", name="ann", gender="female", model="en", description="")
+    )
+    assert len(anyio.run(server.get_voices)) == 1
+    assert len(anyio.run(lambda: server.get_voices(refresh=True))) == 2
+    assert len(calls) == 2
+
+
+def test_control_tools_skip_the_client_slots(server, monkeypatch):
+    import daisys_mcp.concurrency as concurrency
+
+    monkeypatch.setattr(concurrency, "max_concurrent_per_client", 1)
+
+    class Session:
+        pass
+
+    client = Session()
+    monkeypatch.setattr(server, "_client_session", lambda: client)
+
+    async def main():
+        async with concurrency.client_slot(client):
+            # the client's only slot is taken by a generation
+            with anyio.fail_after(1):
+                await server.get_metrics()
+                await server.get_playback_queue()
+
+    anyio.run(main)
@@ -0,0 +1,203 @@
+import contextlib
+import queue
+import threading
+
+import pytest
+
+import daisys_mcp.websocket_pool as websocket_pool
+from daisys_mcp.utils import DaisysMcpError
+
+
+class FakeSession:
+    """httpx-ws session whose server answers every take with one status message."""
+
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def receive(self, timeout=None):
+        event = self.events.get(timeout=timeout)
+        if isinstance(event, Exception):
+            raise event
+        return event
+
+    def send_text(self, data):
+        self.events.put(data)
+
+
+class FakeDaisysWebsocket:
+    def __init__(self, speak, model):
+        self.speak = speak
+        self.model = model
+        self.ws = None
+        self.request_streams = {}
+        self.current_request_id = 0
+        self.disconnected = False
+
+    def reconnect(self):
+        self.speak.connects += 1
+        if self.speak.connect_failures:
+            self.speak.connect_failures -= 1
+            raise ConnectionError("handshake failed")
+        self.session = self.ws = FakeSession()
+        self.speak.sockets.append(self)
+
+    def disconnect(self):
+        self.disconnected = True
+
+    def generate_take(self, text, status_callback, **_):
+        request_id = self.current_request_id
+        self.current_request_id += 1
+        # like the daisys client: send first, then register the stream
+        self.ws.send_text(f"{request_id}:{text}")
+        self.request_streams[request_id] = status_callback
+        return request_id
+
+    def update(self, timeout=1):
+        from daisys.v1.speak import DaisysWebsocketStreamError  # type: ignore
+
+        request_id, text = self.ws.receive(timeout=timeout).split(":")
+        if text == "broken":
+            raise DaisysWebsocketStreamError("bad stream", int(request_id))
+        self.request_streams[int(request_id)](int(request_id), text)
+
+
+class FakeSpeak:
+    def __init__(self, connect_failures=0):
+        self.connects = 0
+        self.connect_failures = connect_failures
+        self.sockets = []
+        self.checked_out = 0
+
+    @contextlib.contextmanager
+    def client(self):
+        self.checked_out += 1
+        try:
+            yield self
+        finally:
+            self.checked_out -= 1
+
+    def websocket(self, model):
+        return FakeDaisysWebsocket(self, model)
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    pools = []
+
+    def make(connect_failures=0, idle_seconds=300):
+        speak = FakeSpeak(connect_failures)
+        monkeypatch.setattr(websocket_pool, "speak_client", speak.client)
+        monkeypatch.setattr(
+            websocket_pool, "voice_models", lambda ids: {"v1": "english"}
+        )
+        monkeypatch.setattr(websocket_pool, "websocket_idle_seconds", idle_seconds)
+        pool = websocket_pool.WebsocketPool(connect_attempts=3, connect_backoff=0.01)
+        pools.append(pool)
+        return pool, speak
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def take(ws, text):
+    received = []
+    ws.generate_take(
+        text=text,
+        status_callback=lambda request_id, take: received.append(
+            (take, threading.get_ident())
+        ),
+    )
+    while not received:
+        ws.update(timeout=1)
+    return received[0]
+
+
+def test_connection_is_reused_across_takes(make_pool):
+    pool, speak = make_pool()
+    for text in ["one", "two", "three"]:
+        with pool.websocket(voice_id="v1") as ws:
+            # callbacks run on the caller's thread, not the reader's
+            assert take(ws, text) == (text, threading.get_ident())
+    assert speak.connects == 1
+
+
+def test_speak_client_stays_checked_out_while_connected(make_pool):
+    pool, speak = make_pool(connect_failures=1)
+    with pool.websocket(voice_id="v1") as ws:
+        take(ws, "one")
+    # the failed attempt gave its client back, the connection keeps its own
+    assert speak.checked_out == 1
+    pool.close()
+    assert speak.checked_out == 0
+
+
+def test_concurrent_takes_are_routed_by_request_id(make_pool):
+    pool, speak = make_pool()
+    results = {}
+
+    def run(name):
+        with pool.websocket(model="english") as ws:
+            results[name] = [take(ws, f"{name}{i}")[0] for i in range(20)]
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {name: [f"{name}{i}" for i in range(20)] for name in "abcd"}
+    assert speak.connects == 1
+
+
+def test_lost_connection_fails_takes_and_reconnects(make_pool):
+    pool, speak = make_pool()
+    with pool.websocket(model="english") as ws:
+        ws.generate_take(text="lost", status_callback=lambda *_: None)
+        speak.sockets[0].session.events.put(ConnectionResetError("reset"))
+        with pytest.raises(DaisysMcpError, match="connection lost"):
+            while True:
+                ws.update(timeout=1)
+
+    with pool.websocket(model="english") as ws:
+        assert take(ws, "again")[0] == "again"
+    assert speak.connects == 2
+    assert speak.sockets[0].disconnected
+
+
+def test_stream_error_fails_only_its_own_take(make_pool):
+    from daisys.v1.speak import DaisysWebsocketStreamError  # type: ignore
+
+    pool, speak = make_pool()
+    with pool.websocket(model="english") as ws:
+        ws.generate_take(text="broken", status_callback=lambda *_: None)
+        with pytest.raises(DaisysWebsocketStreamError):
+            while True:
+                ws.update(timeout=1)
+
+    # the shared connection stays up for the other takes
+    with pool.websocket(model="english") as ws:
+        assert take(ws, "fine")[0] == "fine"
+    assert speak.connects == 1
+
+
+def test_connect_retries_with_backoff(make_pool):
+    pool, speak = make_pool(connect_failures=2)
+    with pool.websocket(model="english") as ws:
+        assert take(ws, "hello")[0] == "hello"
+    assert speak.connects == 3
+
+    pool, speak = make_pool(connect_failures=3)
+    with pytest.raises(ConnectionError):
+        with pool.websocket(model="english"):
+            pass
+
+
+def test_idle_connections_are_evicted(make_pool):
+    pool, speak = make_pool(idle_seconds=0)
+    with pool.websocket(model="english") as ws:
+        take(ws, "one")
+    assert speak.sockets[0].disconnected
+    with pool.websocket(model="english") as ws:
+        take(ws, "two")
+    assert speak.connects == 2
@@ -0,0 +1,187 @@
+import contextlib
+import time
+from types import SimpleNamespace
+
+import pytest
+from daisys.v1.speak import Status  # type: ignore
+
+import daisys_mcp.resilience as resilience
+import daisys_mcp.websocket_tts as websocket_tts
+from daisys_mcp.audio import parse_wav_header, wav_header
+from daisys_mcp.utils import (
+    DaisysMcpConnectionError,
+    DaisysMcpError,
+    DaisysMcpTimeoutError,
+)
+
+
+class FakeWebsocket:
+    def __init__(self, script):
+        self.script = script
+        self.updates = []
+
+    def generate_take(self, status_callback, audio_callback, **_):
+        self.status_cb = status_callback
+        self.audio_cb = audio_callback
+        return 0
+
+    def update(self, timeout=1):
+        self.updates.append(timeout)
+        if not self.script:
+            # nothing arrives, like a stalled take
+            time.sleep(timeout)
+            return
+        kind, *args = self.script.pop(0)
+        if kind == "audio":
+            self.audio_cb(0, "take", *args)
+        else:
+            self.status_cb(0, SimpleNamespace(take_id="take", status=args[0]))
+
+
+def run(monkeypatch, script, text="Hello", **kwargs):
+    ws = FakeWebsocket(script)
+    monkeypatch.setattr(
+        websocket_tts,
+        "pooled_websocket",
+        contextlib.contextmanager(lambda voice_id: (yield ws)),
+    )
+    return ws, websocket_tts.text_to_speech_websocket(
+        text, "v1", playback=False, **kwargs
+    )
+
+
+def test_returns_as_soon_as_take_completes(monkeypatch):
+    ws, audio = run(
+        monkeypatch,
+        [
+            ("status", Status.STARTED),
+            ("audio", 0, 0, wav_header(4) + b"\x01\x00\x02\x00"),
+            ("audio", 0, 1, None),
+            ("audio", 1, 0, None),
+            ("status", Status.READY),
+        ],
+    )
+    assert audio[44:] == b"\x01\x00\x02\x00"
+    assert len(ws.updates) == 5
+
+
+def test_format_is_read_from_stream_and_resampled(monkeypatch):
+    script = [
+        ("audio", 0, 0, wav_header(3200, sample_rate=16000) + bytes(3200)),
+        ("audio", 1, 0, None),
+        ("status", Status.READY),
+    ]
+    _, audio = run(monkeypatch, list(script))
+    assert parse_wav_header(audio[:44]) == (16000, 1, 2)
+
+    _, audio = run(monkeypatch, list(script), sample_rate=8000)
+    assert parse_wav_header(audio[:44]) == (8000, 1, 2)
+    assert len(audio) == 44 + 1600
+
+
+def test_timeout_raises_with_partial_audio(monkeypatch):
+    monkeypatch.setattr(websocket_tts, "websocket_timeout_seconds", 0.05)
+    monkeypatch.setattr(websocket_tts, "websocket_timeout_per_char", 0.0)
+    with pytest.raises(DaisysMcpTimeoutError) as error:
+        run(monkeypatch, [("audio", 0, 0, wav_header(4) + b"\x01\x00\x02\x00")])
+    assert error.value.partial[44:] == b"\x01\x00\x02\x00"
+    assert error.value.partial[40:44] == (4).to_bytes(4, "little")
+
+
+def test_deadline_scales_with_text_length(monkeypatch):
+    monkeypatch.setattr(websocket_tts, "websocket_timeout_seconds", 10)
+    monkeypatch.setattr(websocket_tts, "websocket_timeout_per_char", 0.5)
+    assert websocket_tts.take_deadline("a" * 100) == 60
+
+
+def test_failed_take_raises(monkeypatch):
+    with pytest.raises(DaisysMcpError, match="error"):
+        run(monkeypatch, [("status", Status.ERROR)])
+
+
+class LostOnSubmit(FakeWebsocket):
+    def generate_take(self, *args, **kwargs):
+        raise DaisysMcpConnectionError("Websocket connection lost: closed")
+
+
+class LostWhileGenerating(FakeWebsocket):
+    def update(self, timeout=1):
+        raise DaisysMcpConnectionError("Websocket connection lost: closed")
+
+
+def run_lost(monkeypatch, lost_socket):
+    """A take on ``lost_socket``, which a retry replaces by a working socket."""
+    monkeypatch.setattr(resilience, "retry_backoff", 0)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    sockets = [
+        lost_socket,
+        FakeWebsocket(
+            [
+                ("audio", 0, 0, wav_header(4) + b"\x01\x00\x02\x00"),
+                ("audio", 1, 0, None),
+                ("status", Status.READY),
+            ]
+        ),
+    ]
+    monkeypatch.setattr(
+        websocket_tts,
+        "pooled_websocket",
+        contextlib.contextmanager(lambda voice_id: (yield sockets.pop(0))),
+    )
+    return sockets, websocket_tts.text_to_speech_websocket(
+        "Hello", "v1", playback=False
+    )
+
+
+def test_lost_connection_before_submit_is_retried(monkeypatch):
+    sockets, audio = run_lost(monkeypatch, LostOnSubmit([]))
+    assert audio[44:] == b"\x01\x00\x02\x00"
+    assert not sockets
+
+
+def test_submitted_take_is_not_resubmitted_by_default(monkeypatch):
+    # the take may have been accepted, sending it again could bill it twice
+    with pytest.raises(DaisysMcpConnectionError):
+        run_lost(monkeypatch, LostWhileGenerating([]))
+
+
+def test_submitted_take_is_resubmitted_when_allowed(monkeypatch):
+    monkeypatch.setattr(websocket_tts, "resubmit_lost_takes", True)
+    sockets, audio = run_lost(monkeypatch, LostWhileGenerating([]))
+    assert audio[44:] == b"\x01\x00\x02\x00"
+    assert not sockets
+
+
+def test_slow_take_is_hedged(monkeypatch):
+    monkeypatch.setattr(websocket_tts, "hedge_delay", lambda: 0.02)
+
+    class StalledWebsocket:
+        """The first take never streams, a second one does at once."""
+
+        def __init__(self):
+            self.takes = []
+
+        def generate_take(self, status_callback, audio_callback, **_):
+            self.takes.append((status_callback, audio_callback))
+            return len(self.takes) - 1
+
+        def update(self, timeout=1):
+            if len(self.takes) < 2:
+                time.sleep(timeout)
+                return
+            status_cb, audio_cb = self.takes[1]
+            audio_cb(1, "take", 0, 0, wav_header(2) + b"\x07\x00")
+            audio_cb(1, "take", 1, 0, None)
+            # a late chunk of the first take is ignored
+            self.takes[0][1](0, "take", 0, 0, wav_header(2) + b"\x09\x00")
+            status_cb(1, SimpleNamespace(take_id="take", status=Status.READY))
+
+    ws = StalledWebsocket()
+    monkeypatch.setattr(
+        websocket_tts,
+        "pooled_websocket",
+        contextlib.contextmanager(lambda voice_id: (yield ws)),
+    )
+    audio = websocket_tts.text_to_speech_websocket("Hello", "v1", playback=False)
+    assert len(ws.takes) == 2
+    assert audio[44:] == b"\x07\x00"